@@ -0,0 +1,117 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+import click
+
+from benchmarks.fake_danbooru import generate_users, redirect_danbooru, start_server
+
+# times a full populate followed by a level refresh against the stand-in, one fresh process and data folder per scale
+
+
+def get_server_stats(base_url: str) -> dict:
+    with urlopen(f"{base_url}/_stats") as response:  # noqa: S310
+        return json.loads(response.read())
+
+
+def run_once(base_url: str, max_to_update: int, workers: int, rate: float) -> dict:
+    # dbpromotions reads its settings on import, so it's only imported here, once BASE_FOLDER points at the scratch folder
+    redirect_danbooru(base_url)
+
+    from loguru import logger  # noqa: PLC0415
+
+    from dbpromotions import Defaults  # noqa: PLC0415
+
+    Defaults.MAX_REQUESTS_PER_SECOND = rate
+    Defaults.REQUEST_BURST = max(int(rate), 1)
+    Defaults.MAX_REQUESTS_PER_RUN = sys.maxsize
+
+    from dbpromotions.populate import populate_database, refresh_levels  # noqa: PLC0415
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    start = time.perf_counter()
+    populate_database(max_to_update=max_to_update, workers=workers)
+    populate_seconds = time.perf_counter() - start
+    populate_requests = get_server_stats(base_url)["requests"]
+
+    start = time.perf_counter()
+    refresh_levels()
+    refresh_seconds = time.perf_counter() - start
+    stats = get_server_stats(base_url)
+
+    return {
+        "populate_seconds": round(populate_seconds, 3),
+        "populate_requests": populate_requests,
+        "refresh_seconds": round(refresh_seconds, 3),
+        "refresh_requests": stats["requests"] - populate_requests,
+        "throttled": stats["throttled"],
+        "requests_by_path": stats["by_path"],
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.option("-s", "--scales", default="1000,10000,50000", help="Comma separated candidate counts.")
+@click.option("-m", "--max-to-update", type=int, default=None, help="Users to fully refresh per run, defaults to all of them.")
+@click.option("-w", "--workers", type=int, default=8)
+@click.option("-r", "--rate", type=float, default=1000, help="Request rate allowed to the client.")
+@click.option("-l", "--latency", type=float, default=0, help="Average seconds added to every response.")
+@click.option("-t", "--throttle", type=float, default=0, help="Share of requests answered with a 429.")
+@click.option("-o", "--output", type=click.Path(dir_okay=False, path_type=Path), default=None)
+def run(scales: str, max_to_update: int | None, workers: int, rate: float, latency: float, throttle: float,  # noqa: PLR0913, PLR0917
+        output: Path | None) -> None:
+    results = []
+    for scale in (int(scale) for scale in scales.split(",")):
+        server = start_server(generate_users(scale), latency=latency, throttle=throttle)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        with tempfile.TemporaryDirectory(prefix="dbpromotions-bench-") as base_folder:
+            command = [
+                sys.executable, "-m", "benchmarks.bench_populate", "once",
+                "--base-url", base_url,
+                "--max-to-update", str(max_to_update or scale),
+                "--workers", str(workers),
+                "--rate", str(rate),
+            ]
+            process = subprocess.run(command, env={**os.environ, "BASE_FOLDER": base_folder},  # noqa: S603
+                                     capture_output=True, text=True, check=False)
+        server.shutdown()
+
+        if process.returncode:
+            click.echo(process.stderr, err=True)
+            raise click.ClickException(f"The run with {scale} candidates failed.")
+
+        result = {"candidates": scale, "latency": latency, "throttle": throttle, **json.loads(process.stdout.splitlines()[-1])}
+        results.append(result)
+        click.echo(f"{scale:>7} candidates: populate {result['populate_seconds']}s / {result['populate_requests']} requests, "
+                   f"refresh {result['refresh_seconds']}s / {result['refresh_requests']} requests, peak RSS {result['peak_rss_mb']}MB")
+
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+
+@cli.command()
+@click.option("--base-url", required=True)
+@click.option("--max-to-update", type=int, required=True)
+@click.option("--workers", type=int, required=True)
+@click.option("--rate", type=float, required=True)
+def once(base_url: str, max_to_update: int, workers: int, rate: float) -> None:
+    click.echo(json.dumps(run_once(base_url, max_to_update, workers, rate)))
+
+
+if __name__ == "__main__":
+    cli()
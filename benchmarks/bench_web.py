@@ -0,0 +1,166 @@
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+
+import click
+
+# measures the web server in-process, with the flask test client, against synthetic databases of growing size
+
+RESULTS_FOLDER = Path(__file__).parent / "results"
+CANDIDATES_QUERY = "draw=1&order[0][column]=0&order[0][dir]=desc&columns[0][data]={order}&start={start}&length=25"
+
+
+def get_commit() -> str:
+    process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False)  # noqa: S607
+    return process.stdout.strip() or "unknown"
+
+
+def measure(client, paths: Iterable[str], before_each=None) -> dict:  # noqa: ANN001
+    timings = []
+    for path in paths:
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            msg = f"{path} answered {response.status_code}"
+            raise click.ClickException(msg)
+
+    # python allocations of one more request, measured apart since tracemalloc slows everything down
+    if before_each:
+        before_each()
+    tracemalloc.start()
+    client.get(path)
+    _, peak_allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 2),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 2),
+        "max_ms": round(timings[-1] * 1000, 2),
+        "peak_allocated_mb": round(peak_allocated / 1024 / 1024, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_once(rows: int, edit_summaries: int, repeats: int, seed: int) -> dict:
+    # dbpromotions reads its settings on import, so it's only imported here, once BASE_FOLDER points at the scratch folder
+    from loguru import logger  # noqa: PLC0415
+
+    from benchmarks.generate_database import generate_database  # noqa: PLC0415
+    from dbpromotions.database import PromotionCandidateEdits, user_database_location  # noqa: PLC0415
+    from dbpromotions.page_cache import page_cache_folder  # noqa: PLC0415
+    from dbpromotions.server import server  # noqa: PLC0415
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    start = time.perf_counter()
+    if user_database_location.exists():
+        user_ids = [edits.id for edits in PromotionCandidateEdits.select(PromotionCandidateEdits.id)]
+    else:
+        user_ids = generate_database(rows, edit_summaries, seed)
+    generate_seconds = time.perf_counter() - start
+
+    client = server.test_client()
+    sample = random.Random(seed).choices(user_ids, k=repeats)
+
+    def clear_page_cache() -> None:
+        shutil.rmtree(page_cache_folder, ignore_errors=True)
+
+    results = {
+        "index_render": measure(client, ["/"] * repeats, before_each=clear_page_cache),
+        "index_cached": measure(client, ["/"] * repeats),
+        "candidates_first_page": measure(client, [f"/candidates.json?{CANDIDATES_QUERY.format(order='total_posts', start=0)}"] * repeats),
+        "candidates_deep_page": measure(client, [
+            f"/candidates.json?{CANDIDATES_QUERY.format(order='recent_delete_ratio', start=rows // 2)}",
+        ] * repeats),
+        "edit_summary": measure(client, [f"/users/{user_id}/edit_summary" for user_id in sample]),
+    }
+    return {
+        "generate_seconds": round(generate_seconds, 1),
+        "database_mb": round(user_database_location.stat().st_size / 1024 / 1024, 1),
+        "endpoints": results,
+    }
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.option("-s", "--scales", default="10000,100000,1000000", help="Comma separated candidate counts.")
+@click.option("-e", "--edit-summaries", type=int, default=2000, help="Users with an edit summary, per scale.")
+@click.option("-n", "--repeats", type=int, default=50, help="Requests per endpoint.")
+@click.option("--seed", type=int, default=0)
+@click.option("-k", "--keep-folder", type=click.Path(file_okay=False, path_type=Path), default=None,
+              help="Keep the generated databases here and reuse them on the next run.")
+@click.option("-o", "--output", type=click.Path(dir_okay=False, path_type=Path), default=None,
+              help="Defaults to benchmarks/results/web-<commit>.json.")
+def run(scales: str, edit_summaries: int, repeats: int, seed: int, keep_folder: Path | None,  # noqa: PLR0913, PLR0917
+        output: Path | None) -> None:
+    commit = get_commit()
+    results = []
+    for scale in (int(scale) for scale in scales.split(",")):
+        with tempfile.TemporaryDirectory(prefix="dbpromotions-bench-") as temp_folder:
+            base_folder = keep_folder / f"web-{scale}-{edit_summaries}-{seed}" if keep_folder else Path(temp_folder)
+            command = [
+                sys.executable, "-m", "benchmarks.bench_web", "once",
+                "--rows", str(scale),
+                "--edit-summaries", str(edit_summaries),
+                "--repeats", str(repeats),
+                "--seed", str(seed),
+            ]
+            process = subprocess.run(command, env={**os.environ, "BASE_FOLDER": str(base_folder)},  # noqa: S603
+                                     capture_output=True, text=True, check=False)
+
+        if process.returncode:
+            click.echo(process.stderr, err=True)
+            raise click.ClickException(f"The run with {scale} candidates failed.")
+
+        result = {"candidates": scale, **json.loads(process.stdout.splitlines()[-1])}
+        results.append(result)
+        click.echo(f"{scale:>8} candidates ({result['database_mb']}MB):")
+        for endpoint, timings in result["endpoints"].items():
+            click.echo(f"  {endpoint:<22} p50 {timings['p50_ms']:>9}ms  p95 {timings['p95_ms']:>9}ms  "
+                       f"allocated {timings['peak_allocated_mb']:>7}MB  rss {timings['peak_rss_mb']}MB")
+
+    output = output or RESULTS_FOLDER / f"web-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "created_at": datetime.now(tz=UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": results,
+    }, indent=2))
+    click.echo(f"Results written to {output}")
+
+
+@cli.command()
+@click.option("--rows", type=int, required=True)
+@click.option("--edit-summaries", type=int, required=True)
+@click.option("--repeats", type=int, required=True)
+@click.option("--seed", type=int, required=True)
+def once(rows: int, edit_summaries: int, repeats: int, seed: int) -> None:
+    click.echo(json.dumps(run_once(rows, edit_summaries, repeats, seed)))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,462 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+
+# a stand-in for the parts of the danbooru api that populate uses, serving synthetic users that are all promotion candidates
+
+NOW = datetime.now(tz=UTC)
+DANBOORU_START = datetime(2005, 5, 23, tzinfo=UTC)
+RECENT_DAYS = 90
+
+LEVELS = {20: "Member", 30: "Gold", 31: "Platinum", 32: "Builder", 35: "Contributor"}
+TAG_VOCABULARY = 5000
+MAX_VERSIONS_PER_USER = 3000
+
+
+@dataclass
+class SyntheticUser:
+    id: int
+    name: str
+    level: int
+    created_at: datetime
+    is_banned: bool
+    is_deleted: bool
+
+    post_upload_count: int
+    post_update_count: int
+    note_update_count: int
+    wiki_page_version_count: int
+    artist_version_count: int
+    forum_post_count: int
+
+    deleted_posts: int
+    recent_posts: int
+    recent_deleted_posts: int
+    low_gentag_posts: int
+
+    last_edit: datetime | None
+    last_wiki_edit: datetime | None
+
+    @property
+    def version_count(self) -> int:
+        return min(self.post_update_count, MAX_VERSIONS_PER_USER)
+
+
+def pareto(rng: random.Random, scale: float, cap: int) -> int:
+    return min(int(rng.paretovariate(1.3) * scale), cap)
+
+
+def maybe_recent(rng: random.Random, chance: float, mean_days: float) -> datetime | None:
+    if rng.random() > chance:
+        return None
+    return NOW - timedelta(days=rng.expovariate(1 / mean_days))
+
+
+def generate_users(count: int, seed: int = 0) -> list[SyntheticUser]:
+    # every user is pushed over the threshold of one of the discovery listings, so that `count` is also the candidate count
+    rng = random.Random(seed)
+    users = []
+    for index in range(count):
+        kind = rng.choices(["uploader", "gardener", "translator", "wiki", "forum"], weights=[50, 30, 5, 10, 5])[0]
+
+        uploads = pareto(rng, 40, 200_000)
+        edits = pareto(rng, 200, 500_000)
+        notes = pareto(rng, 10, 50_000)
+        wiki = pareto(rng, 10, 50_000)
+        artist = pareto(rng, 10, 50_000)
+        forum = pareto(rng, 5, 20_000)
+
+        match kind:
+            case "uploader":
+                uploads = max(uploads, 501 + pareto(rng, 300, 200_000))
+            case "gardener":
+                edits = max(edits, 2001 + pareto(rng, 1000, 500_000))
+            case "translator":
+                notes = max(notes, 2001 + pareto(rng, 500, 50_000))
+            case "wiki":
+                wiki = max(wiki, 1001 + pareto(rng, 300, 50_000))
+            case "forum":
+                forum = max(forum, 101 + pareto(rng, 50, 20_000))
+
+        level = rng.choices(list(LEVELS), weights=[55, 20, 15, 5, 5])[0]
+        if kind != "uploader":
+            level = min(level, 31)
+        elif level >= 35:
+            level = 31
+
+        recent_posts = int(uploads * rng.random() * 0.2) if rng.random() < 0.6 else 0
+        deleted_ratio = rng.betavariate(2, 30)
+        user_id = 100_000 + index
+
+        users.append(SyntheticUser(
+            id=user_id,
+            name=f"synthetic_user_{user_id}",
+            level=level,
+            created_at=NOW - timedelta(days=rng.randint(30, 6000)),
+            is_banned=rng.random() < 0.01,
+            is_deleted=False,
+            post_upload_count=uploads,
+            post_update_count=edits,
+            note_update_count=notes,
+            wiki_page_version_count=wiki,
+            artist_version_count=artist,
+            forum_post_count=forum,
+            deleted_posts=int(uploads * deleted_ratio),
+            recent_posts=recent_posts,
+            recent_deleted_posts=int(recent_posts * deleted_ratio),
+            low_gentag_posts=int(recent_posts * rng.random() * 0.3),
+            last_edit=maybe_recent(rng, 0.7, 20) if edits else None,
+            last_wiki_edit=maybe_recent(rng, 0.3, 30) if wiki else None,
+        ))
+    return users
+
+
+def format_date(moment: datetime) -> str:
+    return moment.isoformat(timespec="milliseconds")
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=UTC)
+
+
+def spread_between(count: int, since: datetime, until: datetime) -> int:
+    # recent counts are spread evenly over the last RECENT_DAYS, so that any window of them, down to a single day, adds up
+    if not count:
+        return 0
+    step = timedelta(days=RECENT_DAYS) / count
+
+    def counted_since(moment: datetime) -> int:
+        return min(max(math.floor((NOW - moment) / step + 0.5), 0), count)
+
+    return counted_since(since) - counted_since(until)
+
+
+def count_between(total: int, recent: int, since: datetime, until: datetime) -> int:
+    # everything older than the recent counts happened right before them
+    count = spread_between(recent, since, until)
+    if since < NOW - timedelta(days=RECENT_DAYS) <= until:
+        count += total - recent
+    return count
+
+
+def get_report_count(user: SyntheticUser, kind: str, tags: str, since: datetime, until: datetime) -> int:
+    match kind:
+        case "posts" if "status:deleted" in tags:
+            count = count_between(user.deleted_posts, user.recent_deleted_posts, since, until)
+        case "posts" if "gentags:" in tags:
+            count = spread_between(user.low_gentag_posts, since, until)
+        case "posts":
+            count = count_between(user.post_upload_count, user.recent_posts, since, until)
+        case "post_versions":
+            count = user.post_update_count if user.last_edit and since <= user.last_edit < until else 0
+        case "wiki_page_versions" if since > NOW - timedelta(days=RECENT_DAYS):
+            count = user.wiki_page_version_count if user.last_wiki_edit and since <= user.last_wiki_edit < until else 0
+        case "wiki_page_versions":
+            count = user.wiki_page_version_count
+        case "artist_versions":
+            count = user.artist_version_count
+        case "forum_posts":
+            count = user.forum_post_count
+        case _:
+            count = 0
+    return count
+
+
+def matches(value: float, condition: str) -> bool:
+    # the comparison syntax of danbooru searches: 5, >5, <5, >=5, <=5, 5..10
+    condition = condition.strip()
+    if ".." in condition:
+        low, high = condition.split("..", 1)
+        return (not low or value >= float(low)) and (not high or value <= float(high))
+    for operator, compare in ((">=", float.__ge__), ("<=", float.__le__), (">", float.__gt__), ("<", float.__lt__)):
+        if condition.startswith(operator):
+            return compare(float(value), float(condition[len(operator):]))
+    return float(value) == float(condition)
+
+
+def parse_params(query: str) -> tuple[dict[str, str], dict[str, str]]:
+    # search[uploader][level]=<35 becomes {"uploader.level": "<35"}; anything outside of search[] is kept as is
+    search, other = {}, {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key.startswith("search["):
+            search[".".join(re.findall(r"\[([^\]]*)\]", key))] = value
+        else:
+            other[key] = value
+    return search, other
+
+
+def user_json(user: SyntheticUser) -> dict:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "level": user.level,
+        "level_string": LEVELS[user.level],
+        "created_at": format_date(user.created_at),
+        "is_banned": user.is_banned,
+        "is_deleted": user.is_deleted,
+        "inviter_id": None,
+        "post_upload_count": user.post_upload_count,
+        "post_update_count": user.post_update_count,
+        "note_update_count": user.note_update_count,
+        "wiki_page_version_count": user.wiki_page_version_count,
+        "artist_version_count": user.artist_version_count,
+        "artist_commentary_version_count": 0,
+        "pool_version_count": 0,
+        "forum_post_count": user.forum_post_count,
+        "comment_count": 0,
+        "favorite_group_count": 0,
+        "appeal_count": 0,
+        "flag_count": 0,
+        "positive_feedback_count": 0,
+        "neutral_feedback_count": 0,
+        "negative_feedback_count": 0,
+    }
+
+
+@cache
+def tag_names() -> list[str]:
+    return [f"tag_{index}" for index in range(TAG_VOCABULARY)]
+
+
+def version_json(user: SyntheticUser, position: int) -> dict:
+    # position 0 is the newest version; everything is derived from the user and position, so pages are stable across requests
+    rng = random.Random(user.id * MAX_VERSIONS_PER_USER + position)
+    tags = tag_names()
+    added = [tags[min(int(rng.paretovariate(1.1)) - 1, TAG_VOCABULARY - 1)] for _ in range(rng.randint(0, 4))]
+    removed = [tags[rng.randrange(TAG_VOCABULARY)] for _ in range(rng.randint(0, 2))]
+    last_edit = user.last_edit or NOW - timedelta(days=365)
+    return {
+        "id": user.id * MAX_VERSIONS_PER_USER + (user.version_count - position),
+        "post_id": rng.randint(1, 8_000_000),
+        "updater_id": user.id,
+        "updated_at": format_date(last_edit - timedelta(hours=position * 3)),
+        "version": rng.randint(2, 20),
+        "tags": " ".join(added),
+        "added_tags": added,
+        "removed_tags": removed,
+        "obsolete_added_tags": added[:1] if rng.random() < 0.05 else [],
+        "obsolete_removed_tags": removed[:1] if rng.random() < 0.05 else [],
+        "unchanged_tags": "",
+        "rating": "g",
+        "rating_changed": False,
+        "parent_id": None,
+        "parent_changed": False,
+        "source": "",
+        "source_changed": False,
+    }
+
+
+class FakeDanbooru:
+    def __init__(self, users: list[SyntheticUser], latency: float = 0, throttle: float = 0) -> None:
+        self.users = users
+        self.users_by_id = {user.id: user for user in users}
+        self.users_by_name = {user.name.lower(): user for user in users}
+        self.latency = latency
+        self.throttle = throttle
+        self.requests: Counter[str] = Counter()
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(1)
+
+    def handle(self, path: str, query: str) -> tuple[int, object]:  # noqa: PLR0911
+        if path == "/_stats":
+            with self._lock:
+                return 200, {"requests": sum(self.requests.values()), "throttled": self.throttled, "by_path": dict(self.requests)}
+        if path == "/_reset":
+            with self._lock:
+                self.requests.clear()
+                self.throttled = 0
+            return 200, {}
+
+        with self._lock:
+            self.requests[path] += 1
+            throttled = self._rng.random() < self.throttle
+            if throttled:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency * (0.5 + random.random()))
+        if throttled:
+            return 429, {"success": False, "message": "Too many requests"}
+
+        search, other = parse_params(query)
+        handlers = {
+            "/users.json": self.get_users,
+            "/counts/posts.json": self.get_post_counts,
+            "/post_versions.json": self.get_post_versions,
+            "/wiki_page_versions.json": self.get_wiki_page_versions,
+        }
+        if path in handlers:
+            return 200, handlers[path](search, other)
+        if path.startswith("/reports/"):
+            return 200, self.get_report(path.removeprefix("/reports/").removesuffix(".json"), search)
+        if match := re.fullmatch(r"/users/(\d+)\.json", path):
+            user = self.users_by_id.get(int(match[1]))
+            return (200, user_json(user)) if user else (404, {"success": False})
+        return 404, {"success": False, "message": f"{path} isn't served by the stand-in"}
+
+    @staticmethod
+    def paginate(items: list, other: dict[str, str], key: str = "id") -> list:
+        limit = min(int(other.get("limit", 20)), 1000)
+        page = other.get("page", "1")
+        if page[:1] == "b":
+            items = [item for item in items if item[key] < int(page[1:])]
+            return sorted(items, key=lambda item: item[key], reverse=True)[:limit]
+        if page[:1] == "a":
+            items = sorted((item for item in items if item[key] > int(page[1:])), key=lambda item: item[key])[:limit]
+            return items[::-1]
+        return items[(int(page) - 1) * limit:int(page) * limit]
+
+    def get_users(self, search: dict[str, str], other: dict[str, str]) -> list[dict]:
+        users = self.users
+        for key, value in search.items():
+            if key == "id":
+                ids = {int(user_id) for user_id in value.split(",") if user_id.isdigit()}
+                users = [user for user in users if user.id in ids] if "," in value or value.isdigit() else \
+                    [user for user in users if matches(user.id, value)]
+            elif key in {"name", "name_comma"}:
+                names = {name.lower() for name in value.split(",")}
+                users = [user for user in users if user.name.lower() in names]
+            elif key in {"level", "post_upload_count", "post_update_count", "note_update_count"}:
+                users = [user for user in users if matches(getattr(user, key), value)]
+
+        order = search.get("order")
+        if order in {"post_upload_count", "post_update_count", "note_update_count"}:
+            users = sorted(users, key=lambda user: getattr(user, order), reverse=True)
+        else:
+            users = sorted(users, key=lambda user: user.id, reverse=True)
+
+        return self.paginate([user_json(user) for user in users], other)
+
+    def get_post_counts(self, search: dict[str, str], other: dict[str, str]) -> dict:
+        tags = (other.get("tags") or search.get("tags", "")).split()
+        names = [tag.removeprefix("user:") for tag in tags if tag.startswith("user:")]
+        user = self.users_by_name.get(names[0].lower()) if names else None
+        if not user:
+            return {"counts": {"posts": 0}}
+
+        dates = [tag.removeprefix("date:").removesuffix("..") for tag in tags if tag.startswith("date:")]
+        since = parse_date(dates[0]) if dates else DANBOORU_START
+        if "status:deleted" in tags:
+            count = count_between(user.deleted_posts, user.recent_deleted_posts, since, NOW)
+        elif any(tag.startswith("gentags:") for tag in tags):
+            count = spread_between(user.low_gentag_posts, since, NOW)
+        else:
+            count = count_between(user.post_upload_count, user.recent_posts, since, NOW)
+        return {"counts": {"posts": count}}
+
+    def get_post_versions(self, search: dict[str, str], other: dict[str, str]) -> list[dict]:
+        if "updater_id" in search:
+            user = self.users_by_id.get(int(search["updater_id"]))
+        else:
+            user = self.users_by_name.get(search.get("updater_name", "").lower())
+        if not user or not user.last_edit:
+            return []
+
+        limit = min(int(other.get("limit", 20)), 1000)
+        page = other.get("page", "1")
+        # versions are generated on the fly, only for the page that's asked for
+        base_id = user.id * MAX_VERSIONS_PER_USER
+        if page[:1] == "b":
+            first = user.version_count - (int(page[1:]) - base_id) + 1
+            positions = range(max(first, 0), min(first + limit, user.version_count))
+        elif page[:1] == "a":
+            last = user.version_count - (int(page[1:]) - base_id) - 1
+            positions = range(max(last - limit + 1, 0), max(last + 1, 0))
+        else:
+            first = (int(page) - 1) * limit
+            positions = range(first, min(first + limit, user.version_count))
+        return [version_json(user, position) for position in positions]
+
+    def get_wiki_page_versions(self, search: dict[str, str], other: dict[str, str]) -> list[dict]:  # noqa: ARG002
+        user = self.users_by_id.get(int(search.get("updater_id", 0)))
+        if not user or not user.last_wiki_edit:
+            return []
+        return [{"id": user.id, "updater_id": user.id, "updated_at": format_date(user.last_wiki_edit)}]
+
+    def get_report(self, kind: str, search: dict[str, str]) -> list[dict]:
+        since = parse_date(search["from"]) if "from" in search else DANBOORU_START
+        until = parse_date(search["to"]) if "to" in search else NOW
+        tags = search.get("tags", "")
+        group = search.get("group", "uploader")
+        group_limit = int(search.get("group_limit", 10))
+        level = search.get(f"{group}.level")
+
+        counts: list[tuple[str, int]] = []
+        for user in self.users:
+            if level and not matches(user.level, level):
+                continue
+            if count := get_report_count(user, kind, tags, since, until):
+                counts.append((user.name, count))
+
+        counts.sort(key=lambda name_count: name_count[1], reverse=True)
+        return [{group: name, kind: count} for name, count in counts[:group_limit]]
+
+def make_handler(fake: FakeDanbooru) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            status, body = fake.handle(url.path, url.query)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002
+            pass
+
+    return Handler
+
+
+def start_server(users: list[SyntheticUser], port: int = 0, latency: float = 0, throttle: float = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(FakeDanbooru(users, latency=latency, throttle=throttle)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-danbooru").start()
+    return server
+
+
+def redirect_danbooru(base_url: str) -> None:
+    # the client is pointed at the stand-in at the transport level, so that it works however the client picks its domain
+    from requests.adapters import HTTPAdapter  # noqa: PLC0415
+
+    send = HTTPAdapter.send
+
+    def redirected_send(self: HTTPAdapter, request, **kwargs):  # noqa: ANN001, ANN202
+        url = urlsplit(request.url)
+        if url.hostname and url.hostname.endswith("donmai.us"):
+            request.url = f"{base_url}{url.path}{'?' + url.query if url.query else ''}"
+        return send(self, request, **kwargs)
+
+    HTTPAdapter.send = redirected_send  # type: ignore[method-assign]
+
+
+@click.command()
+@click.option("-u", "--users", type=int, default=10_000)
+@click.option("-p", "--port", type=int, default=8023)
+@click.option("-l", "--latency", type=float, default=0, help="Average seconds added to every response.")
+@click.option("-t", "--throttle", type=float, default=0, help="Share of requests answered with a 429.")
+def main(users: int, port: int, latency: float, throttle: float) -> None:
+    server = start_server(generate_users(users), port=port, latency=latency, throttle=throttle)
+    click.echo(f"Serving {users} synthetic users on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import random
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+
+import click
+from loguru import logger
+from peewee import chunked
+
+from benchmarks.fake_danbooru import pareto
+from dbpromotions.database import PromotionCandidate, PromotionCandidateEdits, bump_data_version, init_database, user_database
+from dbpromotions.edit_summary import TAG_EDIT_KINDS, EditSummary
+
+# fills users.sqlite under BASE_FOLDER with synthetic candidates; it refuses to touch a database that already has users in it
+
+LEVEL_WEIGHTS = {20: 55, 30: 20, 31: 15, 32: 7, 35: 3}
+TAG_VOCABULARY = 200_000
+MAX_TAGS_PER_SUMMARY = 10_000
+
+
+def generate_candidates(rows: int, rng: random.Random, now: datetime) -> Iterator[dict]:
+    for index in range(rows):
+        total_posts = pareto(rng, 40, 200_000)
+        recent_posts = int(total_posts * rng.random() * 0.2) if rng.random() < 0.6 else 0
+        deleted_ratio = rng.betavariate(2, 30)
+        last_checked = now - timedelta(days=min(rng.expovariate(1 / 10), 60))
+
+        yield {
+            "id": 100_000 + index,
+            "name": f"synthetic_user_{100_000 + index}",
+            "level": rng.choices(list(LEVEL_WEIGHTS), weights=list(LEVEL_WEIGHTS.values()))[0],
+            "created_at": now - timedelta(days=rng.randint(30, 6000)),
+            "is_deleted": False,
+            "is_banned": rng.random() < 0.01,
+            "last_checked": last_checked,
+            "first_added": last_checked - timedelta(days=rng.randint(0, 1000)),
+            "last_edit": last_checked - timedelta(days=rng.expovariate(1 / 30)),
+            "total_posts": total_posts,
+            "total_deleted_posts": int(total_posts * deleted_ratio),
+            "recent_posts": recent_posts,
+            "recent_deleted_posts": int(recent_posts * deleted_ratio),
+            "post_edits": pareto(rng, 500, 500_000),
+            "total_note_edits": pareto(rng, 100, 50_000),
+            "total_wiki_edits": pareto(rng, 50, 50_000),
+            "total_artist_edits": pareto(rng, 50, 50_000),
+            "total_forum_posts": pareto(rng, 10, 20_000),
+            "low_gentag_posts": int(recent_posts * rng.random() * 0.3),
+            "last_refreshed": last_checked,
+            "next_due": last_checked + timedelta(days=5),
+        }
+
+
+def generate_edit_summary(rng: random.Random, post_edits: int, now: datetime) -> EditSummary:
+    # goes through EditSummary, so that the stored blob has exactly the shape populate would have written
+    summary = EditSummary()
+    summary.count = post_edits
+    summary.newest_id = rng.randint(10_000_000, 90_000_000)
+    summary.settled_id = summary.newest_id
+    summary.oldest = now - timedelta(days=rng.randint(30, 4000))
+    for year in range(summary.oldest.year, now.year + 1):
+        summary.by_year[str(year)] = rng.randint(0, post_edits // 4 + 1)
+
+    # most users only touch a few hundred tags, heavy gardeners several thousands, and some revert a lot of what they touch
+    tag_count = min(int(rng.paretovariate(1.1) * 300), MAX_TAGS_PER_SUMMARY)
+    revert_shape = (2, 8) if rng.random() < 0.05 else (1, 40)
+    for rank in rng.sample(range(min(tag_count * 5, TAG_VOCABULARY)), tag_count):
+        added = int(rng.paretovariate(1.3) * 10)
+        removed = int(rng.paretovariate(1.3) * 5) if rng.random() < 0.5 else 0
+        counts = (added, removed, int(added * rng.betavariate(*revert_shape)), int(removed * rng.betavariate(*revert_shape)))
+        for kind, count in zip(TAG_EDIT_KINDS, counts, strict=True):
+            if count:
+                summary.by_tag[f"tag_{rank}", kind] = count
+    return summary
+
+
+def generate_database(rows: int, edit_summaries: int, seed: int = 0) -> list[int]:
+    init_database()
+    if PromotionCandidate.select().exists():
+        msg = f"{user_database.database} already has users in it. Point BASE_FOLDER somewhere else."
+        raise click.ClickException(msg)
+
+    rng = random.Random(seed)
+    now = datetime.now(tz=UTC)
+
+    logger.info(f"Generating {rows} candidates...")
+    with user_database.atomic():
+        for batch in chunked(generate_candidates(rows, rng, now), 500):
+            PromotionCandidate.insert_many(batch).execute()
+
+    # edit summaries only exist for users below builder
+    below_builder = PromotionCandidate.select(PromotionCandidate.id, PromotionCandidate.post_edits) \
+        .where(PromotionCandidate.level < 32).order_by(PromotionCandidate.id).tuples()
+    with_edits = rng.sample(list(below_builder), min(edit_summaries, below_builder.count()))
+
+    logger.info(f"Generating {len(with_edits)} edit summaries...")
+    for batch in chunked(with_edits, 100):
+        with user_database.atomic():
+            for user_id, post_edits in batch:
+                data = generate_edit_summary(rng, post_edits, now).to_data()
+                PromotionCandidateEdits.insert(id=user_id, last_checked=now, data=data).execute()
+                PromotionCandidate.update(
+                    bad_edit_tags=data["bad_edit_tags"],
+                    worst_revert_perc=data["worst_revert_perc"],
+                ).where(PromotionCandidate.id == user_id).execute()
+
+    bump_data_version()
+    return sorted(user_id for user_id, _ in with_edits)
+
+
+@click.command()
+@click.option("-r", "--rows", type=int, default=10_000)
+@click.option("-e", "--edit-summaries", type=int, default=2000, help="How many users below builder get an edit summary.")
+@click.option("-s", "--seed", type=int, default=0)
+def main(rows: int, edit_summaries: int, seed: int) -> None:
+    generate_database(rows, edit_summaries, seed)
+    logger.info(f"Done: {user_database.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,3 +27,63 @@ class Defaults:
     MIN_NOTES = 2000
     MIN_WIKI_ARTIST_EDITS = 1000
     MIN_FORUM_POSTS = 100
+
+    USER_REFRESH_INTERVAL = timedelta(days=5)
+    MAX_UNCHANGED_AGE = timedelta(days=30)
+
+    # the last edit of a recent editor is estimated from the narrowest of these windows (in days) they edited in
+    LAST_EDIT_WINDOWS = (1, 7, 14, 21, 31, RECENT_RANGE.days)
+
+    MIN_TAG_EDITS = 50
+    # the most danbooru returns in a single page of any listing
+    LISTING_PAGE_SIZE = 1000
+    EDIT_PAGE_SIZE = 1000
+    MAX_EDIT_PAGES = 100
+    # reverts mark the tags of older versions obsolete after the fact, so versions this recent are fetched again on every scan
+    EDIT_SETTLE_DAYS = 30
+
+    LOW_GENTAG_QUERY = "gentags:<15 -scenery -no_humans -abstract"
+
+    # days of per-user daily activity kept up to date, which bounds the windows recent counts can be summed over
+    ACTIVITY_HISTORY_DAYS = 90
+    # posts keep getting deleted after the day they were uploaded, so days are fetched again until they're this old
+    ACTIVITY_SETTLE_DAYS = 7
+    ACTIVITY_REFETCH_INTERVAL = timedelta(hours=6)
+
+    # candidate snapshots only hold what changed since the previous one, with a full keyframe at least this often
+    SNAPSHOT_KEYFRAME_INTERVAL = timedelta(days=30)
+
+    MAX_CONCURRENT_REQUESTS = 4
+    MAX_REQUESTS_PER_SECOND = 5
+    MIN_REQUESTS_PER_SECOND = 0.5
+    REQUEST_BURST = 5
+    # share of MAX_REQUESTS_PER_SECOND the rate recovers by after every successful request
+    REQUEST_RATE_RECOVERY = 0.01
+    MAX_REQUEST_TRIES = 6
+    REQUEST_BACKOFF = 2
+    # requests the refresh chunks of a single populate run can make, drawn from the run in blocks
+    MAX_REQUESTS_PER_RUN = 20_000
+    REQUEST_BUDGET_BLOCK = 50
+    REFRESH_WORKERS = 8
+
+    # populate runs are split into chunks of users, each claimed by one worker for WORK_LEASE, extended while it makes progress
+    POPULATE_CHUNK_SIZE = 100
+    WORK_LEASE = timedelta(minutes=30)
+    MAX_WORK_ATTEMPTS = 3
+    DISCOVERY_TIMEOUT = timedelta(hours=2)
+
+    # only calls made with cache=True are kept on disk, for as long as their endpoint allows
+    ALL_TIME_REPORT_CACHE_TTL = timedelta(days=1)
+    RECENT_REPORT_CACHE_TTL = timedelta(hours=1)
+    API_CACHE_TTLS = {
+        "DanbooruUser.get_from_name": USER_REFRESH_INTERVAL,
+        "DanbooruPostCounts.get": USER_REFRESH_INTERVAL,
+        "DanbooruPostVersion.get": timedelta(hours=1),
+        "DanbooruWikiPageVersion.get": timedelta(hours=1),
+    }
+    API_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+    # metrics files of processes that haven't written one in this long are left out of /metrics
+    METRICS_FILE_MAX_AGE = timedelta(days=1)
+    # web workers write theirs after a request, at most this often
+    METRICS_WRITE_INTERVAL = timedelta(seconds=15)
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections.abc import Callable
+
+import backoff
+from loguru import logger
+
+from dbpromotions import Defaults
+from dbpromotions.metrics import api_request_duration, api_requests
+from dbpromotions.response_cache import get_endpoint_name, response_cache
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RequestBudgetExceededError(Exception):
+    pass
+
+
+class RateLimiter:
+    # a token bucket whose rate creeps back up while requests succeed, and is halved whenever danbooru pushes back
+    def __init__(self, requests_per_second: float, burst: int = Defaults.REQUEST_BURST) -> None:
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def set_rate(self, requests_per_second: float) -> None:
+        with self._lock:
+            self.max_rate = requests_per_second
+            self.rate = min(self.rate, requests_per_second)
+
+    def wait(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+
+            time.sleep(delay)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * Defaults.REQUEST_RATE_RECOVERY)
+
+    def on_throttle(self, pause: float) -> None:
+        # every thread waits out the pause, not just the one that got throttled
+        with self._lock:
+            self.rate = max(Defaults.MIN_REQUESTS_PER_SECOND, self.rate / 2)
+            self._tokens = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+
+class RequestBudget:
+    # the limit is drawn in blocks from a shared source, so that several processes can spend the same budget
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._draw: Callable[[int], int] | None = None
+        self._available = 0
+        self.used = 0
+
+    def start(self, draw: Callable[[int], int]) -> None:
+        with self._lock:
+            self._draw = draw
+            self._available = 0
+            self.used = 0
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._draw and self._available:
+                self._draw(-self._available)
+            self._draw = None
+            self._available = 0
+
+    def spend(self) -> None:
+        with self._lock:
+            if self._draw is None:
+                return
+            if not self._available:
+                self._available = self._draw(Defaults.REQUEST_BUDGET_BLOCK)
+                if not self._available:
+                    raise RequestBudgetExceededError
+            self._available -= 1
+            self.used += 1
+
+
+request_limiter = RateLimiter(Defaults.MAX_REQUESTS_PER_SECOND)
+request_budget = RequestBudget()
+
+
+def get_status_code(exception: Exception) -> int | None:
+    response = getattr(exception, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_permanent_error(exception: Exception) -> bool:
+    return get_status_code(exception) not in RETRYABLE_STATUS_CODES
+
+
+def on_throttled(details: dict) -> None:
+    exception = details["exception"]  # type: ignore[typeddict-item]
+    retry_after = getattr(getattr(exception, "response", None), "headers", {}).get("Retry-After", "")
+    pause = float(retry_after) if retry_after.isdigit() else details["wait"]
+
+    logger.warning(f"Danbooru answered {get_status_code(exception)}. Slowing down and retrying in {pause:.0f}s.")
+    request_limiter.on_throttle(pause)
+
+
+def fetch[T](endpoint: Callable[..., T], *args, **kwargs) -> T:
+    # every call to danbooru goes through here, so that parallel workers share the same request rate
+    if kwargs.get("cache"):
+        return response_cache.fetch(endpoint, lambda: request(endpoint, *args, **kwargs), args, kwargs)
+    return request(endpoint, *args, **kwargs)
+
+
+def fetch_all[T](endpoint: Callable[..., list[T]], **kwargs) -> list[T]:
+    # the models' get_all pages on its own, out of reach of the limiter and the budget, so listings are walked here instead,
+    # one request per page, forward from the oldest id so that the pages don't shift while they're walked
+    results: list[T] = []
+    cursor = 0
+    while True:
+        page = fetch(endpoint, page=f"a{cursor}", limit=Defaults.LISTING_PAGE_SIZE, **kwargs)
+        results.extend(page)
+        if len(page) < Defaults.LISTING_PAGE_SIZE:
+            return results
+        cursor = max(item.id for item in page)  # type: ignore[attr-defined]
+
+
+@backoff.on_exception(
+    backoff.expo,
+    Exception,
+    giveup=is_permanent_error,
+    on_backoff=on_throttled,  # type: ignore[arg-type]
+    max_tries=Defaults.MAX_REQUEST_TRIES,
+    factor=Defaults.REQUEST_BACKOFF,
+)
+def request[T](endpoint: Callable[..., T], *args, **kwargs) -> T:
+    request_budget.spend()
+    request_limiter.wait()
+
+    endpoint_name = get_endpoint_name(endpoint)
+    try:
+        with api_request_duration.time(endpoint=endpoint_name):
+            response = endpoint(*args, **kwargs)
+    except Exception as e:
+        api_requests.inc(endpoint=endpoint_name, status=str(get_status_code(e) or "error"))
+        raise
+
+    api_requests.inc(endpoint=endpoint_name, status="ok")
+    request_limiter.on_success()
+    return response
@@ -1,16 +1,49 @@
 import json
-from datetime import UTC, datetime, timedelta
+import threading
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+from sqlite3 import Cursor
 
 from danbooru.models import DanbooruPost, DanbooruPostVersion
 from danbooru.user_level import UserLevel
 from loguru import logger
-from peewee import BooleanField, CharField, IntegerField, Model, SqliteDatabase, TimestampField
+from peewee import (
+    EXCLUDED,
+    SQL,
+    BooleanField,
+    CharField,
+    DateField,
+    Expression,
+    FloatField,
+    IntegerField,
+    Model,
+    ModelSelect,
+    OperationalError,
+    SqliteDatabase,
+    TextField,
+    TimestampField,
+    chunked,
+    fn,
+)
+from playhouse.migrate import SqliteMigrator, migrate
 from playhouse.sqlite_ext import JSONField
 
 from dbpromotions import Defaults, Settings
+from dbpromotions.metrics import db_queries, db_query_duration
+
+
+class InstrumentedSqliteDatabase(SqliteDatabase):
+    def execute_sql(self, sql: str, params: tuple | None = None, commit: bool | None = None) -> Cursor:
+        statement = sql.lstrip().split(" ", 1)[0].upper()
+        database = Path(self.database).stem
+        db_queries.inc(database=database, statement=statement)
+        with db_query_duration.time(database=database, statement=statement):
+            return super().execute_sql(sql, params, commit)
+
 
 user_database_location = Settings.DATA_FOLDER / "users.sqlite"
-user_database = SqliteDatabase(user_database_location)
+# written by every worker process and its refresh threads at once, so readers don't block writers and writers queue up
+user_database = InstrumentedSqliteDatabase(user_database_location, pragmas={"journal_mode": "wal", "busy_timeout": 10_000})
 
 
 class PromotionCandidate(Model):
@@ -45,6 +78,14 @@ class PromotionCandidate(Model):
 
     low_gentag_posts = IntegerField(index=True)
 
+    counters_fingerprint = CharField(null=True)
+    last_refreshed = TimestampField(null=True)
+    next_due = TimestampField(null=True, default=None, index=True)
+
+    # rollups of the edit summary, see EditSummary.to_data
+    bad_edit_tags = IntegerField(default=0, index=True)
+    worst_revert_perc = FloatField(default=0, index=True)
+
     @property
     def html_classes(self) -> str:
         classes = ["user"]
@@ -155,9 +196,21 @@ class PromotionCandidate(Model):
         mintag_ratio = (self.low_gentag_posts / self.recent_posts) * 100
         return self.low_gentag_posts > 20 or (mintag_ratio > 30 and self.recent_posts > 10)
 
+    @property
+    def has_bad_edits(self) -> bool:
+        return self.bad_edit_tags > 0
+
     @property
     def mintags_url(self) -> str:
-        return DanbooruPost.url_for(tags=f"gentags:<15 -scenery -no_humans -abstract user:{self.name} date:{Defaults.RECENT_SINCE_STR}..")
+        return DanbooruPost.url_for(tags=f"{Defaults.LOW_GENTAG_QUERY} user:{self.name} date:{Defaults.RECENT_SINCE_STR}..")
+
+
+# get_active_users only ever looks at recently active users below contributor, so only those rows are indexed
+PromotionCandidate.add_index(PromotionCandidate.index(
+    PromotionCandidate.last_checked - PromotionCandidate.last_edit,
+    where=PromotionCandidate.level < SQL(str(UserLevel.number_from_name("contributor"))),  # sqlite wants a literal here
+    name="promotioncandidate_recently_active",
+))
 
 
 class PromotionCandidateEdits(Model):
@@ -169,22 +222,626 @@ class PromotionCandidateEdits(Model):
     data = JSONField(json_dumps=lambda d: json.dumps(d, default=str))
 
 
+class PromotionCandidateTagEdits(Model):
+    # the same counters as in PromotionCandidateEdits.data, one row per user, tag and year, so that they can be queried across users
+    class Meta:
+        database = user_database
+        indexes = (
+            (("user_id", "tag", "year"), True),
+            (("tag", "year"), False),
+        )
+
+    user_id = IntegerField()
+    tag = CharField()
+    year = IntegerField()
+
+    added = IntegerField(default=0)
+    removed = IntegerField(default=0)
+    revert_added = IntegerField(default=0)
+    revert_removed = IntegerField(default=0)
+
+
+class PromotionCandidateActivity(Model):
+    # what each user did on each day, from the daily grouped reports, so that recent counts can be summed over any window.
+    # Reports are grouped by name, so this is keyed on it too.
+    class Meta:
+        database = user_database
+        indexes = (
+            (("user_name", "day"), True),
+            (("day",), False),
+        )
+
+    user_name = CharField()
+    day = DateField()
+
+    posts = IntegerField(default=0)
+    deleted_posts = IntegerField(default=0)
+    low_gentag_posts = IntegerField(default=0)
+
+
+class ActivityReport(Model):
+    # which daily report was fetched into which PromotionCandidateActivity column, and whether it hit the group limit
+    class Meta:
+        database = user_database
+        indexes = (
+            (("day", "column"), True),
+        )
+
+    day = DateField()
+    column = CharField()
+    fetched_at = TimestampField()
+    truncated = BooleanField(default=False)
+
+
+class PromotionCandidateSnapshot(Model):
+    # an append-only history of the candidate stats: a keyframe holds every value, the rows after it only what changed since
+    # the previous row, so any state is rebuilt from the last keyframe before it
+    class Meta:
+        database = user_database
+        indexes = (
+            (("user_id", "taken_at"), False),
+        )
+
+    user_id = IntegerField()
+    taken_at = TimestampField()
+    is_keyframe = BooleanField(default=False)
+    values = JSONField(json_dumps=lambda d: json.dumps(d, separators=(",", ":")))
+
+
+class CandidateDataVersion(Model):
+    # a single row, bumped on every write of candidates, that tells pages rendered from them whether they're stale
+    class Meta:
+        database = user_database
+
+    id = IntegerField(primary_key=True)
+    version = IntegerField(default=0)
+
+
+class PopulateRun(Model):
+    class Meta:
+        database = user_database
+
+    started_at = TimestampField()
+    discovered_at = TimestampField(null=True, default=None)
+    finished_at = TimestampField(null=True, default=None, index=True)
+
+    total = IntegerField(default=0)
+    max_to_update = IntegerField()
+    fetches_used = IntegerField(default=0)
+    edits_used = IntegerField(default=0)
+    max_requests = IntegerField(default=0)
+    requests_used = IntegerField(default=0)
+
+
+class PopulateWork(Model):
+    # the ledger of users a populate run still has to go through, claimed in chunks by whichever worker is free
+    class Meta:
+        database = user_database
+        indexes = (
+            (("run_id", "state", "position"), False),
+        )
+
+    run_id = IntegerField()
+    position = IntegerField()
+    user_name = CharField()
+    user_id = IntegerField(null=True)
+
+    state = CharField(default="pending")
+    lease_until = TimestampField(null=True, default=None)
+    attempts = IntegerField(default=0)
+
+    # the IncompleteUserData discovery queued, as model_dump_json, and its private attributes, which that leaves out
+    user_data = TextField()
+    last_edit_hints = JSONField(default=dict)
+    danbooru_user = JSONField(null=True, default=None)
+
+
+USER_DATABASE_MODELS = (
+    PromotionCandidate,
+    PromotionCandidateEdits,
+    PromotionCandidateTagEdits,
+    PromotionCandidateActivity,
+    ActivityReport,
+    PromotionCandidateSnapshot,
+    CandidateDataVersion,
+    PopulateRun,
+    PopulateWork,
+)
+
+
 def init_database() -> None:
     logger.debug("Initializing database...")
     user_database_location.parent.mkdir(exist_ok=True)
     with user_database:
         logger.debug("Initializing tables...")
-        user_database.create_tables([PromotionCandidate, PromotionCandidateEdits])
+        drop_pickled_ledger()
+        # new columns go in first, since create_tables also creates any missing index, and those could be on them
+        for model in USER_DATABASE_MODELS:
+            if model.table_exists():
+                add_missing_columns(model)
+        user_database.create_tables(USER_DATABASE_MODELS)
+
+
+def drop_pickled_ledger() -> None:
+    # the ledger used to keep pickled payloads. It only ever holds the current run, so that's dropped and discovered again
+    if not PopulateWork.table_exists():
+        return
+    if "payload" not in {column.name for column in user_database.get_columns(PopulateWork._meta.table_name)}:
+        return
+
+    logger.info("Dropping the work ledger of the previous format...")
+    with user_database.atomic():
+        PopulateWork.drop_table()
+        PopulateRun.update(finished_at=datetime.now(tz=UTC)).where(PopulateRun.finished_at.is_null()).execute()
+
+
+def add_missing_columns(model: type[Model]) -> None:
+    # create_tables doesn't touch existing tables, so columns added to a model later have to be added by hand
+    table_name = model._meta.table_name
+    existing_columns = {column.name for column in user_database.get_columns(table_name)}
+    migrator = SqliteMigrator(user_database)
+
+    operations = []
+    for field in model._meta.sorted_fields:
+        if field.column_name not in existing_columns:
+            logger.info(f"Adding column {field.column_name} to {table_name}...")
+            operations.append(migrator.add_column(table_name, field.column_name, field))
+
+    if operations:
+        migrate(*operations)
+
+
+class CandidateStore:
+    # keeps every candidate in memory and writes changes back in bulk, instead of one autocommitted query per user
+    def __init__(self, flush_every: int = 500, user_ids: list[int] | None = None) -> None:
+        # with user_ids, only those are preloaded, and anyone else is looked up when first asked for
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._partial = user_ids is not None
+        query = PromotionCandidate.select()
+        if user_ids is not None:
+            query = query.where(PromotionCandidate.id.in_(user_ids))
+        self._candidates: dict[int, PromotionCandidate | None] = {candidate.id: candidate for candidate in query}
+        self._pending: dict[int, PromotionCandidate] = {}
+        self._new: set[int] = set()
+        logger.debug(f"Loaded {len(self._candidates)} candidates in memory.")
+
+    def get(self, user_id: int) -> PromotionCandidate | None:
+        with self._lock:
+            if self._partial and user_id not in self._candidates:
+                self._candidates[user_id] = PromotionCandidate.get_or_none(PromotionCandidate.id == user_id)
+            return self._candidates.get(user_id)
+
+    def save(self, candidate: PromotionCandidate, new: bool = False) -> None:
+        # store values the same way they'd come back from the database, so that in-memory and loaded rows compare alike
+        for field in PromotionCandidate._meta.sorted_fields:
+            value = candidate.__data__.get(field.name)
+            if value is not None:
+                candidate.__data__[field.name] = field.python_value(field.db_value(value))
+
+        with self._lock:
+            self._candidates[candidate.id] = candidate
+            self._pending[candidate.id] = candidate
+            if new:
+                self._new.add(candidate.id)
+
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+
+        fields = PromotionCandidate._meta.sorted_fields
+        updatable = {field.name for field in fields} - {"id", "first_added"}
+
+        # rows are grouped by the columns that changed, so that an upsert never overwrites untouched values
+        groups: dict[frozenset[str], list[dict]] = {}
+        for candidate in self._pending.values():
+            changed = updatable if candidate.id in self._new else updatable & {field.name for field in candidate.dirty_fields}
+            row = {field.name: candidate.__data__.get(field.name) for field in fields}
+            groups.setdefault(frozenset(changed), []).append(row)
+
+        logger.debug(f"Writing {len(self._pending)} candidates to the database...")
+        # immediate, since the snapshots read the previous values first, and a deferred read lock can't wait its way up to a write
+        with user_database.atomic("IMMEDIATE"):
+            save_snapshots(list(self._pending.values()))
+            bump_data_version()
+            for changed, rows in groups.items():
+                preserve = [field for field in fields if field.name in changed]
+                for batch in chunked(rows, 50):
+                    query = PromotionCandidate.insert_many(batch)
+                    if preserve:
+                        query = query.on_conflict(conflict_target=[PromotionCandidate.id], preserve=preserve)
+                    else:
+                        query = query.on_conflict_ignore()
+                    query.execute()
+
+        for candidate in self._pending.values():
+            candidate._dirty.clear()
+        self._pending.clear()
+        self._new.clear()
+
+
+def bump_data_version() -> None:
+    CandidateDataVersion.insert(id=1, version=1).on_conflict(
+        conflict_target=[CandidateDataVersion.id],
+        update={CandidateDataVersion.version: CandidateDataVersion.version + 1},
+    ).execute()
+
+
+def get_data_version() -> str:
+    # changes whenever candidates are written, from any process, but not on the ledger and budget writes of populate runs
+    try:
+        version = CandidateDataVersion.select(CandidateDataVersion.version).scalar()
+    except OperationalError:
+        # populate hasn't created the table yet
+        version = None
+    return str(version or 0)
+
+
+def get_active_users_query() -> ModelSelect:
+    return PromotionCandidate.select() \
+        .where(PromotionCandidate.level < UserLevel.number_from_name("contributor")) \
+        .where(was_active_recently()) \
+        .where(should_be_considered())
 
 
 def get_active_users() -> list[PromotionCandidate]:
-    users = PromotionCandidate.select() \
-        .where(PromotionCandidate.level < UserLevel.number_from_name("contributor"))
-
-    users = filter(was_active_recently, users)
-
-    return list(users)
-
-
-def was_active_recently(user: PromotionCandidate) -> bool:
-    return user.last_checked - user.last_edit < Defaults.RECENT_RANGE
+    return list(get_active_users_query())
+
+
+def was_active_recently() -> Expression:
+    # same expression as the one in promotioncandidate_recently_active, so that the index can be used
+    return PromotionCandidate.last_checked - PromotionCandidate.last_edit < int(Defaults.RECENT_RANGE.total_seconds())
+
+
+def should_be_considered() -> Expression:
+    # SQL version of PromotionCandidate.should_be_considered
+    return (PromotionCandidate.total_posts > Defaults.MIN_UPLOADS) | (
+        (PromotionCandidate.level < UserLevel.number_from_name("builder")) & (
+            (PromotionCandidate.post_edits > Defaults.MIN_EDITS)
+            | (PromotionCandidate.total_note_edits > Defaults.MIN_NOTES)
+            | (PromotionCandidate.total_wiki_edits + PromotionCandidate.total_artist_edits > Defaults.MIN_WIKI_ARTIST_EDITS)
+            | (PromotionCandidate.total_forum_posts > Defaults.MIN_FORUM_POSTS)
+        )
+    )
+
+
+def deletion_ratio(deleted: Expression, total: Expression) -> Expression:
+    return fn.COALESCE(deleted * 100.0 / fn.NULLIF(total, 0), 0)
+
+
+def is_mintagger() -> Expression:
+    # SQL version of PromotionCandidate.is_mintagger
+    mintag_ratio = deletion_ratio(PromotionCandidate.low_gentag_posts, PromotionCandidate.recent_posts)
+    return (PromotionCandidate.low_gentag_posts > 20) | ((mintag_ratio > 30) & (PromotionCandidate.recent_posts > 10))
+
+
+# columns the candidates table can be sorted by; dates are sorted by how long ago they were, like they're displayed
+CANDIDATE_SORT_COLUMNS: dict[str, Expression] = {
+    "id": PromotionCandidate.id,
+    "level": PromotionCandidate.level,
+    "name": PromotionCandidate.name,
+    "total_posts": PromotionCandidate.total_posts,
+    "total_deleted_posts": PromotionCandidate.total_deleted_posts,
+    "total_delete_ratio": deletion_ratio(PromotionCandidate.total_deleted_posts, PromotionCandidate.total_posts),
+    "recent_posts": PromotionCandidate.recent_posts,
+    "recent_deleted_posts": PromotionCandidate.recent_deleted_posts,
+    "recent_delete_ratio": deletion_ratio(PromotionCandidate.recent_deleted_posts, PromotionCandidate.recent_posts),
+    "total_note_edits": PromotionCandidate.total_note_edits,
+    "total_wiki_edits": PromotionCandidate.total_wiki_edits,
+    "total_artist_edits": PromotionCandidate.total_artist_edits,
+    "total_forum_posts": PromotionCandidate.total_forum_posts,
+    "post_edits": PromotionCandidate.post_edits,
+    "bad_edit_tags": PromotionCandidate.bad_edit_tags,
+    "last_edit": 0 - PromotionCandidate.last_edit,
+    "first_added": 0 - PromotionCandidate.first_added,
+}
+
+
+def get_candidate_presets() -> dict[str, tuple[str, Expression]]:
+    not_builder = PromotionCandidate.level != UserLevel.number_from_name("builder")
+    return {
+        "contributor": (
+            "1. For Contrib (<4%, 500 ups, 50 recent)",
+            (CANDIDATE_SORT_COLUMNS["recent_delete_ratio"] < 4)
+            & (PromotionCandidate.total_posts > 500)
+            & (PromotionCandidate.recent_posts > 50),
+        ),
+        "translator": (
+            "2. Translators for Builder (>2000 notes)",
+            not_builder & (PromotionCandidate.total_note_edits > 2000),
+        ),
+        "builder": (
+            "3. For Builder (>5000 edits or >1000 ups)",
+            not_builder & ((PromotionCandidate.post_edits > 5000) | (PromotionCandidate.total_posts > 1000)),
+        ),
+        "wiki": (
+            "4. Wiki/Artist Editors (>1000 edits)",
+            not_builder & (PromotionCandidate.total_wiki_edits + PromotionCandidate.total_artist_edits > 1000),
+        ),
+        "forum": (
+            "5. Forum Posters (>100 posts)",
+            not_builder & (PromotionCandidate.total_forum_posts > 100),
+        ),
+        "mintagger": (
+            "6. Mintaggers/Bad users",
+            is_mintagger(),
+        ),
+        "bad_edits": (
+            "7. Gardeners with many reverted edits",
+            PromotionCandidate.bad_edit_tags > 0,
+        ),
+    }
+
+
+def get_active_levels() -> list[int]:
+    levels = get_active_users_query().select(PromotionCandidate.level).distinct().order_by(PromotionCandidate.level)
+    return [user.level for user in levels]
+
+
+def get_candidates_page(offset: int,  # noqa: PLR0913
+                        limit: int,
+                        *,
+                        order_by: str = "total_posts",
+                        descending: bool = True,
+                        search: str = "",
+                        levels: list[int] | None = None,
+                        banned: bool | None = None,
+                        preset: str | None = None,
+                        ) -> tuple[int, int, list[PromotionCandidate]]:
+    users = get_active_users_query()
+    total = filtered = users.count()
+
+    if search:
+        search_condition = PromotionCandidate.name.contains(search)
+        if search.isdigit():
+            search_condition |= PromotionCandidate.id == int(search)
+        users = users.where(search_condition)
+    if levels:
+        users = users.where(PromotionCandidate.level.in_(levels))
+    if banned is not None:
+        users = users.where(PromotionCandidate.is_banned == banned)
+    if preset:
+        users = users.where(get_candidate_presets()[preset][1])
+
+    if search or levels or banned is not None or preset:
+        filtered = users.count()
+
+    sort_column = CANDIDATE_SORT_COLUMNS[order_by]
+    users = users.order_by(sort_column.desc() if descending else sort_column.asc(), PromotionCandidate.id)
+
+    return total, filtered, list(users.offset(offset).limit(limit))
+
+
+def has_tag_edits(user_id: int) -> bool:
+    return PromotionCandidateTagEdits.select().where(PromotionCandidateTagEdits.user_id == user_id).exists()
+
+
+def save_tag_edits(user_id: int, tag_edits: dict[tuple[str, int], dict[str, int]], replace: bool = False) -> None:
+    # with replace, the counters are a full rescan and overwrite what's there; otherwise they're new edits and get added to it
+    rows = [{"user_id": user_id, "tag": tag, "year": year, **counters} for (tag, year), counters in tag_edits.items()]
+    kinds = [PromotionCandidateTagEdits.added,
+             PromotionCandidateTagEdits.removed,
+             PromotionCandidateTagEdits.revert_added,
+             PromotionCandidateTagEdits.revert_removed]
+
+    with user_database.atomic():
+        if replace:
+            PromotionCandidateTagEdits.delete().where(PromotionCandidateTagEdits.user_id == user_id).execute()
+
+        for batch in chunked(rows, 100):
+            PromotionCandidateTagEdits.insert_many(batch).on_conflict(
+                conflict_target=[PromotionCandidateTagEdits.user_id, PromotionCandidateTagEdits.tag, PromotionCandidateTagEdits.year],
+                update={kind: kind + EXCLUDED[kind.column_name] for kind in kinds},
+            ).execute()
+
+
+TAG_LEADERBOARD_COLUMNS = ("total", "added", "removed", "revert_total", "revert_perc")
+
+
+def get_tag_leaderboard(tag: str,
+                        year: int | None = None,
+                        order_by: str = "total",
+                        limit: int = 100,
+                        min_edits: int = Defaults.MIN_TAG_EDITS,
+                        ) -> list[dict]:
+    added = fn.SUM(PromotionCandidateTagEdits.added)
+    removed = fn.SUM(PromotionCandidateTagEdits.removed)
+    revert_added = fn.SUM(PromotionCandidateTagEdits.revert_added)
+    revert_removed = fn.SUM(PromotionCandidateTagEdits.revert_removed)
+    total = added + removed
+    revert_total = revert_added + revert_removed
+    columns = {
+        "total": total,
+        "added": added,
+        "removed": removed,
+        "revert_total": revert_total,
+        "revert_perc": revert_total * 100.0 / total,
+    }
+
+    query = (PromotionCandidateTagEdits
+             .select(PromotionCandidateTagEdits.user_id,
+                     PromotionCandidate.name,
+                     PromotionCandidate.level,
+                     added.alias("added"),
+                     removed.alias("removed"),
+                     revert_added.alias("revert_added"),
+                     revert_removed.alias("revert_removed"),
+                     total.alias("total"),
+                     revert_total.alias("revert_total"),
+                     columns["revert_perc"].alias("revert_perc"))
+             .join(PromotionCandidate, on=PromotionCandidate.id == PromotionCandidateTagEdits.user_id)
+             .where(PromotionCandidateTagEdits.tag == tag))
+
+    if year is not None:
+        query = query.where(PromotionCandidateTagEdits.year == year)
+
+    query = (query
+             .group_by(PromotionCandidateTagEdits.user_id)
+             .having(total >= min_edits)
+             .order_by(columns[order_by].desc(), PromotionCandidateTagEdits.user_id)
+             .limit(limit))
+
+    return list(query.dicts())
+
+
+def get_user_tag_edits(user_id: int, year: int | None = None) -> list[PromotionCandidateTagEdits]:
+    query = PromotionCandidateTagEdits.select().where(PromotionCandidateTagEdits.user_id == user_id)
+    if year is not None:
+        query = query.where(PromotionCandidateTagEdits.year == year)
+    return list(query.order_by(PromotionCandidateTagEdits.year.desc(), PromotionCandidateTagEdits.tag))
+
+
+ACTIVITY_COLUMNS = ("posts", "deleted_posts", "low_gentag_posts")
+
+
+def save_activity_report(day: date, column: str, counts: dict[str, int], truncated: bool) -> None:
+    # a report replaces whatever an earlier fetch of the same day said, since posts get deleted or expunged after the fact
+    field = PromotionCandidateActivity._meta.fields[column]
+    rows = [{"user_name": user_name, "day": day, column: count} for user_name, count in counts.items()]
+
+    with user_database.atomic():
+        PromotionCandidateActivity.update({field: 0}).where(PromotionCandidateActivity.day == day).execute()
+        for batch in chunked(rows, 500):
+            PromotionCandidateActivity.insert_many(batch).on_conflict(
+                conflict_target=[PromotionCandidateActivity.user_name, PromotionCandidateActivity.day],
+                update={field: EXCLUDED[column]},
+            ).execute()
+
+        ActivityReport.insert(day=day, column=column, fetched_at=datetime.now(tz=UTC), truncated=truncated).on_conflict(
+            conflict_target=[ActivityReport.day, ActivityReport.column],
+            update={ActivityReport.fetched_at: EXCLUDED.fetched_at, ActivityReport.truncated: EXCLUDED.truncated},
+        ).execute()
+
+
+def get_activity_reports(since: date) -> dict[tuple[date, str], ActivityReport]:
+    reports = ActivityReport.select().where(ActivityReport.day >= since)
+    return {(report.day, report.column): report for report in reports}
+
+
+def get_activity_totals(column: str, since: date, until: date) -> dict[str, int] | None:
+    # None if any day in the window is missing or was truncated, since users could then be missing from the sums
+    days = (until - since).days + 1
+    complete_days = ActivityReport.select().where(
+        (ActivityReport.column == column) & ActivityReport.day.between(since, until) & ~ActivityReport.truncated,
+    ).count()
+    if complete_days < days:
+        return None
+
+    total = fn.SUM(PromotionCandidateActivity._meta.fields[column])
+    query = (PromotionCandidateActivity
+             .select(PromotionCandidateActivity.user_name, total)
+             .where(PromotionCandidateActivity.day.between(since, until))
+             .group_by(PromotionCandidateActivity.user_name)
+             .having(total > 0))
+    return dict(query.tuples())
+
+
+# the candidate stats kept in PromotionCandidateSnapshot
+SNAPSHOT_FIELDS = (
+    "level",
+    "is_banned",
+    "total_posts",
+    "total_deleted_posts",
+    "recent_posts",
+    "recent_deleted_posts",
+    "post_edits",
+    "total_note_edits",
+    "total_wiki_edits",
+    "total_artist_edits",
+    "total_forum_posts",
+    "low_gentag_posts",
+    "bad_edit_tags",
+    "worst_revert_perc",
+)
+
+
+def get_snapshot_values(values: dict) -> dict[str, float]:
+    snapshot_values = {}
+    for field in SNAPSHOT_FIELDS:
+        value = values.get(field)
+        if value is not None:
+            snapshot_values[field] = round(value, 2) if isinstance(value, float) else int(value)
+    return snapshot_values
+
+
+def save_snapshots(candidates: list[PromotionCandidate]) -> None:
+    # has to run before the candidates are written, since the previous values are read back from the database
+    # taken_at is kept as a naive local time
+    now = datetime.now(tz=UTC).astimezone().replace(tzinfo=None)
+    fields = [PromotionCandidate._meta.fields[field] for field in SNAPSHOT_FIELDS]
+    snapshot = PromotionCandidateSnapshot
+
+    rows = []
+    for batch in chunked(candidates, 500):
+        user_ids = [candidate.id for candidate in batch]
+        previous = {row["id"]: row for row in PromotionCandidate
+                    .select(PromotionCandidate.id, *fields)
+                    .where(PromotionCandidate.id.in_(user_ids))
+                    .dicts()}
+        last_keyframes = dict(snapshot
+                              .select(snapshot.user_id, fn.MAX(snapshot.taken_at))
+                              .where(snapshot.user_id.in_(user_ids) & snapshot.is_keyframe)
+                              .group_by(snapshot.user_id)
+                              .tuples())
+
+        for candidate in batch:
+            values = get_snapshot_values(candidate.__data__)
+            previous_values = get_snapshot_values(previous.get(candidate.id, {}))
+            changes = {field: round(value - previous_values.get(field, 0), 2) for field, value in values.items()
+                       if value != previous_values.get(field)}
+
+            last_keyframe = last_keyframes.get(candidate.id)
+            if not last_keyframe or candidate.id not in previous:
+                rows.append({"user_id": candidate.id, "taken_at": now, "is_keyframe": True, "values": values})
+            elif not changes:
+                continue
+            elif last_keyframe < now - Defaults.SNAPSHOT_KEYFRAME_INTERVAL:
+                rows.append({"user_id": candidate.id, "taken_at": now, "is_keyframe": True, "values": values})
+            else:
+                rows.append({"user_id": candidate.id, "taken_at": now, "is_keyframe": False, "values": changes})
+
+    for batch in chunked(rows, 100):
+        snapshot.insert_many(batch).execute()
+
+
+def get_snapshots(user_id: int, since: datetime | None = None, until: datetime | None = None) -> list[tuple[datetime, dict[str, float]]]:
+    # one scan of the user's index range, starting from the last keyframe before `since`, whose state at `since` comes first
+    snapshot = PromotionCandidateSnapshot
+    # taken_at comes back as a naive local time
+    since, until = (moment.astimezone().replace(tzinfo=None) if moment and moment.tzinfo else moment for moment in (since, until))
+
+    query = snapshot.select().where(snapshot.user_id == user_id)
+    if since:
+        last_keyframe = snapshot.select(fn.MAX(snapshot.taken_at)).where(
+            (snapshot.user_id == user_id) & snapshot.is_keyframe & (snapshot.taken_at <= since),
+        )
+        query = query.where(snapshot.taken_at >= fn.COALESCE(last_keyframe, snapshot.taken_at.to_value(since)))
+    if until:
+        query = query.where(snapshot.taken_at <= until)
+
+    series: list[tuple[datetime, dict[str, float]]] = []
+    state: dict[str, float] = {}
+    for row in query.order_by(snapshot.taken_at, snapshot.id):
+        if since and state and not series and row.taken_at > since:
+            series.append((since, dict(state)))
+
+        if row.is_keyframe:
+            state = dict(row.values)
+        else:
+            for field, change in row.values.items():
+                state[field] = round(state.get(field, 0) + change, 2)
+
+        if not since or row.taken_at >= since:
+            series.append((row.taken_at, dict(state)))
+
+    if since and state and not series:
+        # nothing changed within the range
+        series.append((since, dict(state)))
+    return series
@@ -0,0 +1,159 @@
+import sys
+from collections import Counter
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
+from danbooru.models import DanbooruPostVersion
+
+from dbpromotions import Defaults
+
+TAG_EDIT_KINDS = ("added", "removed", "revert_added", "revert_removed")
+# bumped whenever the tag edits table needs every summary to be scanned again in full
+TAG_EDITS_VERSION = 1
+
+
+class EditSummary:
+    # counts post versions as they come in, so memory depends on the number of distinct tags, not on the number of edits
+    def __init__(self) -> None:
+        self.count = 0
+        self.newest_id = 0
+        self.oldest: datetime | None = None
+        self.by_year: Counter[str] = Counter()
+        self.by_tag: Counter[tuple[str, str]] = Counter()
+        self.is_incremental = False
+        # only what changed since loading, split by year, which is what the tag edits table needs to be brought up to date
+        self.new_by_tag_year: Counter[tuple[str, int, str]] = Counter()
+
+        # versions up to seen_id were already counted when the summary was loaded
+        self.seen_id = 0
+        # every version up to settled_id is older than the settle window, so the reverts counted for it are final
+        self.settled_id = 0
+        self.settle_since = datetime.now(tz=UTC) - timedelta(days=Defaults.EDIT_SETTLE_DAYS)
+        # the obsolete tags counted for the versions still within the settle window, by version id
+        self.unsettled: dict[int, tuple[list[str], list[str]]] = {}
+
+    @classmethod
+    def from_data(cls, data: dict) -> "EditSummary":
+        summary = cls()
+        summary.is_incremental = True
+        summary.count = data["count"]
+        summary.newest_id = data["newest_id"]
+        summary.seen_id = data["newest_id"]
+        # summaries from before the settle window existed are taken as settled
+        summary.settled_id = data.get("settled_id", data["newest_id"])
+        summary.unsettled = {int(version_id): (added, removed) for version_id, (added, removed) in data.get("unsettled", {}).items()}
+        oldest = data["oldest"]
+        summary.oldest = datetime.fromisoformat(oldest) if isinstance(oldest, str) else oldest
+        summary.by_year.update(data["by_year"])
+        for tag, tag_data in data["by_tag"].items():
+            for kind in TAG_EDIT_KINDS:
+                if tag_data[kind]:
+                    summary.by_tag[sys.intern(tag), kind] = tag_data[kind]
+        return summary
+
+    def add(self, post_edit: DanbooruPostVersion) -> None:
+        year = post_edit.updated_at.year
+        if post_edit.id > self.seen_id:
+            self.count += 1
+            self.newest_id = max(self.newest_id, post_edit.id)
+            if not self.oldest or post_edit.updated_at < self.oldest:
+                self.oldest = post_edit.updated_at
+            self.by_year[str(year)] += 1
+
+            self.count_tags("added", post_edit.added_tags, year)
+            self.count_tags("removed", post_edit.removed_tags, year)
+        else:
+            # counted on an earlier scan, but later reverts can have made more of its tags obsolete, so its reverts are replaced
+            obsolete_added, obsolete_removed = self.unsettled.pop(post_edit.id, ([], []))
+            self.count_tags("revert_added", obsolete_added, year, -1)
+            self.count_tags("revert_removed", obsolete_removed, year, -1)
+
+        self.count_tags("revert_added", post_edit.obsolete_added_tags, year)
+        self.count_tags("revert_removed", post_edit.obsolete_removed_tags, year)
+
+        if post_edit.updated_at < self.settle_since:
+            self.settled_id = max(self.settled_id, post_edit.id)
+        elif post_edit.obsolete_added_tags or post_edit.obsolete_removed_tags:
+            self.unsettled[post_edit.id] = (post_edit.obsolete_added_tags, post_edit.obsolete_removed_tags)
+
+    def count_tags(self, kind: str, tags: Iterable[str], year: int, change: int = 1) -> None:
+        for tag_name in tags:
+            tag = sys.intern(tag_name)
+            self.by_tag[tag, kind] += change
+            self.new_by_tag_year[tag, year, kind] += change
+
+    def consume(self, post_edits: Iterable[DanbooruPostVersion]) -> None:
+        for post_edit in post_edits:
+            self.add(post_edit)
+
+    def to_data(self) -> dict:
+        # tags are stored without any threshold, so that the counters can keep being added to; top_tags holds the filtered view
+        by_tag: dict[str, dict[str, int]] = {}
+        for (tag, kind), count in self.by_tag.items():
+            tag_data = by_tag.get(tag)
+            if tag_data is None:
+                tag_data = by_tag[tag] = dict.fromkeys(TAG_EDIT_KINDS, 0)
+            tag_data[kind] = count
+
+        top_tags = get_top_tags(by_tag)
+
+        return {
+            "oldest": self.oldest,
+            "newest_id": self.newest_id,
+            "settled_id": self.settled_id,
+            "unsettled": {version_id: obsolete_tags for version_id, obsolete_tags in self.unsettled.items()
+                          if version_id > self.settled_id},
+            "count": self.count,
+            "tag_edits": TAG_EDITS_VERSION,
+            "by_year": dict(self.by_year),
+            "by_tag": by_tag,
+            "top_tags": top_tags,
+            "bad_edit_tags": sum(tag_data["bad_edits"] for tag_data in top_tags.values()),
+            "worst_revert_perc": max((tag_data["revert_total_perc"] for tag_data in top_tags.values()), default=0),
+        }
+
+    def new_tag_edits(self) -> dict[tuple[str, int], dict[str, int]]:
+        tag_edits: dict[tuple[str, int], dict[str, int]] = {}
+        for (tag, year, kind), count in self.new_by_tag_year.items():
+            if not count:
+                continue
+            counters = tag_edits.get((tag, year))
+            if counters is None:
+                counters = tag_edits[tag, year] = dict.fromkeys(TAG_EDIT_KINDS, 0)
+            counters[kind] = count
+        return tag_edits
+
+
+def get_top_tags(by_tag: dict[str, dict[str, int]]) -> dict[str, dict]:
+    # only the most edited tags are shown, most edited first
+    top_tags = {tag: get_tag_metrics(tag_data) for tag, tag_data in by_tag.items()
+                if tag_data["added"] + tag_data["removed"] > Defaults.MIN_TAG_EDITS}
+    return dict(sorted(top_tags.items(), key=lambda v: v[1]["total"], reverse=True))
+
+
+def get_tag_metrics(tag_data: dict[str, int]) -> dict:
+    tag_metrics: dict = dict(tag_data)
+    tag_metrics["total"] = tag_data["added"] + tag_data["removed"]
+    tag_metrics["revert_total"] = tag_data["revert_added"] + tag_data["revert_removed"]
+
+    tag_metrics["revert_total_perc"] = (tag_metrics["revert_total"] / tag_metrics["total"]) * 100
+
+    if tag_data["added"]:
+        tag_metrics["revert_added_perc"] = (tag_data["revert_added"] / tag_data["added"]) * 100
+    else:
+        tag_metrics["revert_added_perc"] = 0
+
+    if tag_data["removed"]:
+        tag_metrics["revert_removed_perc"] = (tag_data["revert_removed"] / tag_data["removed"]) * 100
+    else:
+        tag_metrics["revert_removed_perc"] = 0
+
+    tag_metrics["bad_edits"] = False
+    if tag_metrics["revert_total_perc"] > 15:
+        tag_metrics["bad_edits"] = True
+    if tag_metrics["revert_added_perc"] > 20 and tag_data["added"] > 20:
+        tag_metrics["bad_edits"] = True
+    if tag_metrics["revert_removed_perc"] > 20 and tag_data["removed"] > 20:
+        tag_metrics["bad_edits"] = True
+
+    return tag_metrics
@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections.abc import Iterator
 from datetime import UTC, datetime, timedelta
 
 import peewee
@@ -6,10 +6,23 @@ from danbooru.model import WrongIncludeCallError
 from danbooru.models import DanbooruPostCounts, DanbooruPostVersion, DanbooruUser, DanbooruWikiPageVersion
 from danbooru.user_level import UserLevel
 from loguru import logger
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, PrivateAttr, field_validator
 
 from dbpromotions import Defaults
-from dbpromotions.database import PromotionCandidate, PromotionCandidateEdits
+from dbpromotions.api import fetch
+from dbpromotions.database import (
+    CandidateStore,
+    PromotionCandidate,
+    PromotionCandidateEdits,
+    bump_data_version,
+    has_tag_edits,
+    save_snapshots,
+    save_tag_edits,
+    user_database,
+)
+from dbpromotions.edit_summary import TAG_EDITS_VERSION, EditSummary
+from dbpromotions.metrics import timed_phase, users_processed
+from dbpromotions.scheduler import as_utc, get_next_due
 
 
 class IncompleteUserData(BaseModel):
@@ -40,10 +53,18 @@ class IncompleteUserData(BaseModel):
 
     low_gentag_posts: int | None = None
 
-    def save_to_db(self, update: bool = False) -> bool:
-        try:
-            saved_data = PromotionCandidate.get(self.id)
-        except peewee.DoesNotExist:
+    counters_fingerprint: str | None = None
+    last_refreshed: datetime | None = None
+    next_due: datetime | None = None
+
+    # the danbooru user this data was built from, if any, so that it doesn't have to be fetched again
+    _danbooru_user: DanbooruUser | None = PrivateAttr(default=None)
+    # approximate last "post"/"wiki" edit from the grouped reports; None if they didn't edit recently, missing if unknown
+    _last_edit_hints: dict[str, datetime | None] = PrivateAttr(default_factory=dict)
+
+    def save_to_db(self, store: CandidateStore, update: bool = False) -> bool:
+        saved_data = store.get(self.id)  # type: ignore[arg-type]
+        if saved_data is None:
             saved_data = PromotionCandidate(id=self.id)
             self.last_checked = None
             new = True
@@ -51,58 +72,136 @@ class IncompleteUserData(BaseModel):
             self.last_checked = saved_data.last_checked
             new = False
 
-        if not update and self.last_checked:  # just check anyway if it's a new user
+        if not new and self.is_unchanged(saved_data):
+            logger.info(f"User #{self.id} '{self.name}' hasn't changed since the last check.")
+            self.last_checked = datetime.now(tz=UTC)
+            self.update_last_edit_from_hints(saved_data)
+            fetched = False
+            users_processed.inc(step="profile", outcome="unchanged")
+        elif not update and self.last_checked:  # just check anyway if it's a new user
             logger.info("Reached the limit for fetchable user info in the current session. Skipping until next scan.")
             fetched = False
+            users_processed.inc(step="profile", outcome="over_budget")
         else:
             fetched = self.refresh_user(saved_data)
+            users_processed.inc(step="profile", outcome=("created" if new else "refreshed") if fetched else "not_due")
 
-        self._save(saved_data, new=new)
+        self.next_due = get_next_due(self, saved_data)
+        self._save(saved_data, store, new=new)
         return fetched
 
-    def _save(self, saved_data: PromotionCandidate, new: bool) -> None:
+    def _save(self, saved_data: PromotionCandidate, store: CandidateStore, new: bool) -> None:
         for key, value in self.model_dump(exclude_none=True).items():
             setattr(saved_data, key, value)
 
-        saved_data.save(force_insert=new)
+        store.save(saved_data, new=new)
 
     def refresh_user(self, saved_data: PromotionCandidate) -> bool:
-        if self.last_checked and self.last_checked > (datetime.now() - timedelta(days=5)):
-            logger.info(f"User #{self.id} '{self.name}' was already checked recently.")
+        if self.last_checked and (next_due := get_next_due(self, saved_data)) > datetime.now(tz=UTC):
+            logger.info(f"User #{self.id} '{self.name}' was already checked recently, and isn't due until {next_due:%Y-%m-%d}.")
             return False
 
         self.last_checked = datetime.now(tz=UTC)
+        self.last_refreshed = self.last_checked
         logger.info(f"Populating missing values for user #{self.id} '{self.name}'.")
 
-        db_user = DanbooruUser.get_from_name(self.name, cache=True)
+        db_user = self._danbooru_user
+        if not db_user or not has_extended_counts(db_user):
+            db_user = fetch(DanbooruUser.get_from_name, self.name, cache=True)
         for key, value in self.from_danbooru_user(db_user).model_dump(exclude_none=True).items():
             setattr(self, key, value)
+        self.counters_fingerprint = self.get_counters_fingerprint()
 
-        last_edit = self.set_last_edit()
+        last_edit = self.set_last_edit(saved_data)
         self.populate_other_values(last_edit=last_edit, saved_data=saved_data)
         return True
 
+    def get_counters_fingerprint(self) -> str | None:
+        # the counters returned by the user listings; if none of them moved, there's nothing new to fetch for this user
+        counters = (self.level, self.is_banned, self.is_deleted, self.total_posts, self.post_edits, self.total_note_edits)
+        if any(counter is None for counter in counters):
+            return None
+        return ":".join(str(int(counter)) for counter in counters)  # type: ignore[arg-type]
+
+    def is_unchanged(self, saved_data: PromotionCandidate) -> bool:
+        fingerprint = self.get_counters_fingerprint()
+        if not fingerprint or fingerprint != saved_data.counters_fingerprint:
+            return False
+
+        # things like deletions don't move any counter, so do a full refresh every now and then anyway
+        last_refreshed = as_utc(saved_data.last_refreshed)
+        return bool(last_refreshed) and last_refreshed > datetime.now(tz=UTC) - Defaults.MAX_UNCHANGED_AGE
+
+    def update_last_edit_from_hints(self, saved_data: PromotionCandidate) -> None:
+        # wiki edits don't move any of the fingerprinted counters, so users who only do those would otherwise keep their old
+        # last edit until the next full refresh, and drop out of the recently active ones in the meantime
+        hints = [hint for hint in self._last_edit_hints.values() if hint]
+        if hints and (not saved_data.last_edit or max(hints) > saved_data.last_edit_dt):
+            self.last_edit = max(hints)
+
     @classmethod
-    def update_from_danbooru_user(cls, user: DanbooruUser) -> None:
-        db_user = PromotionCandidate.get(user.id)
-        user_data = IncompleteUserData.from_danbooru_user(user)
-        for key, value in user_data.model_dump(exclude_none=True).items():
-            setattr(db_user, key, value)
-        db_user.save()
-
-    def set_last_edit(self) -> datetime | None:
-        versions = DanbooruPostVersion.get(updater_id=self.id, cache=True, limit=1)
+    def update_from_danbooru_users(cls, users: list[DanbooruUser]) -> int:
+        saved_users = PromotionCandidate.select().where(PromotionCandidate.id.in_([user.id for user in users]))
+        saved_users_by_id = {saved_data.id: saved_data for saved_data in saved_users}
+
+        changed_users: list[PromotionCandidate] = []
+        changed_fields: set[peewee.Field] = set()
+        for user in users:
+            saved_data = saved_users_by_id.get(user.id)
+            if not saved_data:
+                continue
+
+            for key, value in cls.from_danbooru_user(user).model_dump(exclude_none=True).items():
+                field = PromotionCandidate._meta.fields.get(key)
+                if field is None or field.primary_key:
+                    continue
+                if field.db_value(value) != field.db_value(getattr(saved_data, key)):
+                    setattr(saved_data, key, value)
+                    changed_fields.add(field)
+
+            if saved_data.is_dirty():
+                changed_users.append(saved_data)
+
+        if changed_users:
+            # immediate, for the same reason as CandidateStore's flush
+            with user_database.atomic("IMMEDIATE"):
+                save_snapshots(changed_users)
+                bump_data_version()
+                PromotionCandidate.bulk_update(changed_users, fields=list(changed_fields), batch_size=100)
+
+        return len(changed_users)
+
+    def set_last_edit(self, saved_data: PromotionCandidate) -> datetime | None:
+        # the estimate from the grouped reports is good enough for everything it's displayed or filtered on, so the exact
+        # date is only searched when the reports couldn't tell
+        recent_post_edit = self._last_edit_hints.get("post")
+        if recent_post_edit:
+            self.last_edit = recent_post_edit
+            return recent_post_edit
+
+        if "post" in self._last_edit_hints and saved_data.last_edit and saved_data.last_edit_dt < Defaults.RECENT_SINCE:
+            # nothing recent, and what's saved is already older than that
+            self.last_edit = saved_data.last_edit_dt
+            return saved_data.last_edit_dt
+
+        recent_wiki_edit = self._last_edit_hints.get("wiki")
+        if self.post_edits == 0 and recent_wiki_edit:
+            self.last_edit = recent_wiki_edit
+            return None
+
+        versions = fetch(DanbooruPostVersion.get, updater_id=self.id, cache=True, limit=1)
         if versions:
             self.last_edit = versions[0].updated_at
             return versions[0].updated_at
 
-        wiki_versions = DanbooruWikiPageVersion.get(updater_id=self.id, cache=True, limit=1)
+        wiki_versions = fetch(DanbooruWikiPageVersion.get, updater_id=self.id, cache=True, limit=1)
         if wiki_versions:
             self.last_edit = wiki_versions[0].updated_at
 
         return None
 
     def populate_other_values(self, last_edit: datetime | None, saved_data: PromotionCandidate) -> None:
+        # counts that were already filled in from the grouped reports during discovery are not searched again
         if self.total_posts == 0 or not last_edit:
             self.recent_posts = 0
             self.total_deleted_posts = 0
@@ -114,88 +213,76 @@ class IncompleteUserData(BaseModel):
             self.recent_deleted_posts = 0
             self.low_gentag_posts = 0
 
-            if saved_data.total_deleted_posts is None:
-                count_search = DanbooruPostCounts.get(tags=f"status:deleted user:{self.name}",
-                                                      cache=True)  # type: ignore[var-annotated] # one fucking job
-                self.total_deleted_posts = count_search.count  # type: ignore[attr-defined]
+            if self.total_deleted_posts is None and saved_data.total_deleted_posts is None:
+                self.total_deleted_posts = self.count_posts("status:deleted")
 
         else:
-            count_search = DanbooruPostCounts.get(tags=f"user:{self.name} date:{Defaults.RECENT_SINCE_STR}..",
-                                                  cache=True)  # type: ignore[var-annotated] # one fucking job
-            self.recent_posts = count_search.count
+            if self.recent_posts is None:
+                self.recent_posts = self.count_posts(f"date:{Defaults.RECENT_SINCE_STR}..")
 
-            count_search = DanbooruPostCounts.get(tags=f"status:deleted user:{self.name}",
-                                                  cache=True)  # type: ignore[var-annotated] # one fucking job
-            self.total_deleted_posts = count_search.count  # type: ignore[attr-defined]
+            if self.total_deleted_posts is None:
+                self.total_deleted_posts = self.count_posts("status:deleted")
 
             if self.recent_posts == 0:
                 self.recent_deleted_posts = 0
                 self.low_gentag_posts = 0
             else:
-                count_search = DanbooruPostCounts.get(
-                    tags=f"status:deleted user:{self.name} date:{Defaults.RECENT_SINCE_STR}..",
-                    cache=True,
-                )  # type: ignore[var-annotated] # one fucking job
-                self.recent_deleted_posts = count_search.count      # type: ignore[attr-defined]
-
-                count_search = DanbooruPostCounts.get(
-                    tags=f"gentags:<15 -scenery -no_humans -abstract user:{self.name} date:{Defaults.RECENT_SINCE_STR}..",
-                    cache=True,
-                )  # type: ignore[var-annotated] # one fucking job
-                self.low_gentag_posts = count_search.count      # type: ignore[attr-defined]
-
-    def fetch_edit_data(self) -> dict:
-        post_edits = DanbooruPostVersion.get_all(updater_name=self.name, is_new=False, max_pages=10)
-
-        by_year = defaultdict(int)
-        by_tag = defaultdict(lambda: {
-            "added": 0,
-            "removed": 0,
-            "revert_added": 0,
-            "revert_removed": 0,
-        })
-
-        for post_edit in post_edits:
-            by_year[post_edit.updated_at.year] += 1
-
-            for tag in post_edit.added_tags:
-                by_tag[tag]["added"] += 1
-            for tag in post_edit.removed_tags:
-                by_tag[tag]["removed"] += 1
-            for tag in post_edit.obsolete_added_tags:
-                by_tag[tag]["revert_added"] += 1
-            for tag in post_edit.obsolete_removed_tags:
-                by_tag[tag]["revert_removed"] += 1
-
-        by_tag = {k: v for k, v in by_tag.items() if v["added"] + v["removed"] > 50}
-        by_tag = dict(sorted(by_tag.items(), key=lambda v: v[1]["added"] + v[1]["removed"], reverse=True))
-
-        data = {
-            "oldest": post_edits[-1].updated_at,
-            "count": len(post_edits),
-            "by_year": by_year,
-            "by_tag":  by_tag,
-        }
+                if self.recent_deleted_posts is None:
+                    self.recent_deleted_posts = self.count_posts(f"status:deleted date:{Defaults.RECENT_SINCE_STR}..")
+
+                if self.low_gentag_posts is None:
+                    self.low_gentag_posts = self.count_posts(f"{Defaults.LOW_GENTAG_QUERY} date:{Defaults.RECENT_SINCE_STR}..")
+
+    def count_posts(self, tags: str) -> int:
+        count_search = fetch(DanbooruPostCounts.get, tags=f"{tags} user:{self.name}",
+                             cache=True)  # type: ignore[var-annotated] # one fucking job
+        return count_search.count  # type: ignore[attr-defined]
+
+    @timed_phase("fetch_edit_data")
+    def fetch_edit_data(self, previous_data: dict | None = None) -> EditSummary:
+        if previous_data and "newest_id" in previous_data:
+            # only the versions that are new or still within the settle window are fetched, and merged into what was already counted
+            summary = EditSummary.from_data(previous_data)
+            summary.consume(self.iterate_post_edits(after_id=summary.settled_id))
+        else:
+            summary = EditSummary()
+            summary.consume(self.iterate_post_edits())
+
+        return summary
 
-        return data
+    def iterate_post_edits(self, after_id: int | None = None) -> Iterator[DanbooruPostVersion]:
+        # with after_id, walks forward from it, so a run that hits the page cap resumes from where it stopped next time;
+        # otherwise walks back from the newest version. Pages are yielded as they arrive and never kept around.
+        cursor = after_id
+        direction = "a" if after_id is not None else "b"
+        for _ in range(Defaults.MAX_EDIT_PAGES):
+            page = f"{direction}{cursor}" if cursor is not None else "1"
+            post_edits = fetch(DanbooruPostVersion.get, updater_name=self.name, is_new=False,
+                               page=page, limit=Defaults.EDIT_PAGE_SIZE)
+            yield from post_edits
 
-    def update_edit_data(self, update: bool = False) -> bool:
+            if len(post_edits) < Defaults.EDIT_PAGE_SIZE:
+                return
+
+            version_ids = [post_edit.id for post_edit in post_edits]
+            cursor = max(version_ids) if after_id is not None else min(version_ids)
+
+    def update_edit_data(self, store: CandidateStore, update: bool = False) -> bool:
         if self.level > UserLevel("platinum"):
             logger.info(f"Edit data for user #{self.id} '{self.name}' won't be collected because they're already builder+.")
+            users_processed.inc(step="edits", outcome="builder")
             return False
         if self.post_edits < 50:
             logger.info(f"Edit data for user #{self.id} '{self.name}' won't be collected because they have less than 50 edits.")
+            users_processed.inc(step="edits", outcome="few_edits")
             return False
 
-        try:
-            last_edit = PromotionCandidate.get(self.id)
-        except peewee.DoesNotExist:
-            last_edit = datetime.now() - timedelta(weeks=52)
-        else:
-            last_edit = last_edit.last_edit
+        saved_data = store.get(self.id)  # type: ignore[arg-type]
+        last_edit = saved_data.last_edit if saved_data else datetime.now() - timedelta(weeks=52)
 
         if last_edit < (datetime.now() - timedelta(days=60)):
             logger.info(f"Edit data for user #{self.id} '{self.name}' won't be collected because they haven't edited in a long time.")
+            users_processed.inc(step="edits", outcome="inactive")
             return False
 
         try:
@@ -203,33 +290,50 @@ class IncompleteUserData(BaseModel):
         except peewee.DoesNotExist:
             edit_data = PromotionCandidateEdits(id=self.id)
             edit_data.last_checked = None
+            edit_data.data = None
 
         force_insert = not edit_data.last_checked
 
         if not update:
             logger.info("Reached the limit for fetchable edit data in the current session. Skipping until next scan.")
+            users_processed.inc(step="edits", outcome="over_budget")
             return False
 
         if edit_data.last_checked and edit_data.last_checked > (datetime.now() - timedelta(days=30)):
             logger.info(f"Edit data for user #{self.id} '{self.name}' was already collected this month.")
+            users_processed.inc(step="edits", outcome="recent")
             return False
 
         if edit_data.last_checked and edit_data.last_checked > last_edit:
             logger.info(f"Edit data for user #{self.id} '{self.name}' won't be collected because they haven't edited in a long time.")
+            users_processed.inc(step="edits", outcome="inactive")
             return False
 
         edit_data.last_checked = datetime.now(tz=UTC)
         logger.info(f"Populating edit data for user #{self.id} '{self.name}'.")
 
-        edit_data.data = self.fetch_edit_data()
-
-        edit_data.save(force_insert=force_insert)
+        # users scanned before the tag edits table existed are scanned again in full, since their old counters have no years
+        previous_data = edit_data.data
+        if previous_data and get_tag_edits_version(self.id, previous_data) != TAG_EDITS_VERSION:  # type: ignore[arg-type]
+            previous_data = None
+        summary = self.fetch_edit_data(previous_data=previous_data)
+        edit_data.data = summary.to_data()
+
+        if saved_data:
+            saved_data.bad_edit_tags = edit_data.data["bad_edit_tags"]
+            saved_data.worst_revert_perc = edit_data.data["worst_revert_perc"]
+            store.save(saved_data)
+
+        with user_database.atomic():
+            save_tag_edits(self.id, summary.new_tag_edits(), replace=not summary.is_incremental)  # type: ignore[arg-type]
+            edit_data.save(force_insert=force_insert)
+        users_processed.inc(step="edits", outcome="collected")
         return True
 
     @field_validator("name", mode="after")
     @classmethod
     def validate_name(cls, value: str) -> str:
-        return value.replace(" ", "_")
+        return normalize_name(value)
 
     @staticmethod
     def from_danbooru_user(user: DanbooruUser) -> "IncompleteUserData":
@@ -249,4 +353,31 @@ class IncompleteUserData(BaseModel):
         except WrongIncludeCallError:
             pass
 
-        return IncompleteUserData(**data | extra_data)
+        user_data = IncompleteUserData(**data | extra_data)
+        user_data._danbooru_user = user
+        return user_data
+
+    def merge(self, user_data: "IncompleteUserData") -> "IncompleteUserData":
+        merged = self.model_copy(update=user_data.model_dump(exclude_none=True))
+        merged._danbooru_user = user_data._danbooru_user or self._danbooru_user
+        return merged
+
+
+def get_tag_edits_version(user_id: int, edits_data: dict) -> int:
+    # the summary says which tag edits table it was counted into, since users who only edit ratings or sources never get any
+    # rows there. Summaries from before it said so are taken at whether there are any.
+    if "tag_edits" in edits_data:
+        return edits_data["tag_edits"]
+    return TAG_EDITS_VERSION if has_tag_edits(user_id) else 0
+
+
+def normalize_name(name: str) -> str:
+    return name.replace(" ", "_")
+
+
+def has_extended_counts(user: DanbooruUser) -> bool:
+    try:
+        user.wiki_page_version_count  # noqa: B018
+    except WrongIncludeCallError:
+        return False
+    return True
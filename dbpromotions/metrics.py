@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+
+from dbpromotions import Defaults, Settings
+
+metrics_folder = Settings.DATA_FOLDER / "metrics"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+type Labels = tuple[tuple[str, str], ...]
+
+
+class Metric(ABC):
+    # a minimal take on the prometheus client, enough to expose counters and histograms in the text format
+    kind = ""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_labels(labels: dict[str, str]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @abstractmethod
+    def samples(self) -> list[tuple[str, Labels, float]]: ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self.get_labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        with self._lock:
+            return [(f"{self.name}_total", labels, value) for labels, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        self._values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self.get_labels(labels)
+        with self._lock:
+            # one counter per bucket, then the sum and the count
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for index, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        samples = []
+        with self._lock:
+            for labels, counts in self._values.items():
+                for bucket, count in zip(self.buckets, counts, strict=False):
+                    samples.append((f"{self.name}_bucket", (*labels, ("le", str(bucket))), count))
+                samples.append((f"{self.name}_bucket", (*labels, ("le", "+Inf")), counts[-1]))
+                samples.append((f"{self.name}_sum", labels, counts[-2]))
+                samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register[M: Metric](self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        return {
+            metric.name: {
+                "kind": metric.kind,
+                "documentation": metric.documentation,
+                "samples": metric.samples(),
+            } for metric in self.metrics.values()
+        }
+
+
+registry = Registry()
+
+phase_duration = registry.register(Histogram(
+    "dbpromotions_phase_duration_seconds", "Time spent in each phase of populate and refresh.",
+))
+api_requests = registry.register(Counter("dbpromotions_api_requests", "Requests made to danbooru, by endpoint and outcome."))
+api_request_duration = registry.register(Histogram(
+    "dbpromotions_api_request_duration_seconds", "Latency of requests made to danbooru.",
+))
+api_cache_lookups = registry.register(Counter("dbpromotions_api_cache_lookups", "Lookups in the on-disk API response cache."))
+db_queries = registry.register(Counter("dbpromotions_db_queries", "SQLite queries, by database and statement."))
+db_query_duration = registry.register(Histogram("dbpromotions_db_query_duration_seconds", "Duration of SQLite queries."))
+users_processed = registry.register(Counter("dbpromotions_users_processed", "Users gone through by populate, by step and outcome."))
+http_requests = registry.register(Counter("dbpromotions_http_requests", "Requests served by the web server."))
+http_request_duration = registry.register(Histogram("dbpromotions_http_request_duration_seconds", "Latency of the web server."))
+
+
+def timed_phase[**P, T](phase: str) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    def decorator(function: Callable[P, T]) -> Callable[P, T]:
+        @wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with phase_duration.time(phase=phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_process_name(source: str) -> str:
+    return f"{source}-{socket.gethostname()}-{os.getpid()}"
+
+
+def write_metrics_file(source: str) -> None:
+    # written by every process, and read back by whichever web worker gets scraped, which has no other way to know about them
+    metrics_folder.mkdir(parents=True, exist_ok=True)
+    metrics_path = metrics_folder / f"{get_process_name(source)}.json"
+    temp_path = metrics_path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(registry.snapshot()))
+    temp_path.replace(metrics_path)
+
+
+_last_written: dict[str, float] = {}
+_last_written_lock = threading.Lock()
+
+
+def write_metrics_file_if_due(source: str) -> None:
+    # for processes that would otherwise write one after every request
+    now = time.monotonic()
+    with _last_written_lock:
+        if source in _last_written and now - _last_written[source] < Defaults.METRICS_WRITE_INTERVAL.total_seconds():
+            return
+        _last_written[source] = now
+    write_metrics_file(source)
+
+
+def read_metrics_files() -> dict[str, dict]:
+    snapshots = {}
+    for metrics_path in metrics_folder.glob("*.json"):
+        try:
+            if metrics_path.stat().st_mtime < time.time() - Defaults.METRICS_FILE_MAX_AGE.total_seconds():
+                continue
+            snapshots[metrics_path.stem] = json.loads(metrics_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+    return snapshots
+
+
+def format_labels(labels: Labels | list) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{escape_label_value(value)}"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metrics(snapshots: dict[str, dict]) -> str:
+    # every snapshot is labelled with where it comes from, so that the same metric from several processes stays apart
+    families: dict[str, dict] = {}
+    for source, snapshot in snapshots.items():
+        for name, family in snapshot.items():
+            merged = families.setdefault(name, {"kind": family["kind"], "documentation": family["documentation"], "samples": []})
+            for sample_name, labels, value in family["samples"]:
+                merged["samples"].append((sample_name, [("source", source), *labels], value))
+
+    lines = []
+    for name, family in families.items():
+        if not family["samples"]:
+            continue
+        lines.append(f"# HELP {name} {family['documentation']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        lines.extend(f"{sample_name}{format_labels(labels)} {value}" for sample_name, labels, value in family["samples"])
+    return "\n".join(lines) + "\n"
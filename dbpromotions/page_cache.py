@@ -0,0 +1,32 @@
+import gzip
+import hashlib
+import os
+from collections.abc import Callable
+
+from dbpromotions import Settings
+
+page_cache_folder = Settings.DATA_FOLDER / "page_cache"
+
+
+def get_cached_page(name: str, version: str, render: Callable[[], str]) -> tuple[str, bytes]:
+    # pages are kept gzipped on disk, so that every gunicorn worker can serve what another one already rendered
+    etag = hashlib.sha1(f"{name}:{version}".encode()).hexdigest()  # noqa: S324
+    page_path = page_cache_folder / f"{name}-{etag}.html.gz"
+
+    try:
+        return etag, page_path.read_bytes()
+    except FileNotFoundError:
+        pass
+
+    body = gzip.compress(render().encode(), compresslevel=9)
+
+    page_cache_folder.mkdir(parents=True, exist_ok=True)
+    temp_path = page_path.with_name(f"{page_path.name}.{os.getpid()}.tmp")
+    temp_path.write_bytes(body)
+    temp_path.replace(page_path)
+
+    for old_page_path in page_cache_folder.glob(f"{name}-*.html.gz"):
+        if old_page_path != page_path:
+            old_page_path.unlink(missing_ok=True)
+
+    return etag, body
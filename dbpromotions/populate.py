@@ -1,3 +1,6 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, date, datetime, time, timedelta
 from itertools import batched
 
 from danbooru.models import DanbooruUser
@@ -5,231 +8,499 @@ from danbooru.reports import (
     DanbooruArtistVersionReport,
     DanbooruForumPostReport,
     DanbooruPostReport,
+    DanbooruPostVersionReport,
     DanbooruWikiPageVersionReport,
 )
 from loguru import logger
 
 from dbpromotions import Defaults
-from dbpromotions.database import PromotionCandidate, PromotionCandidateEdits, init_database
-from dbpromotions.incomplete_user_data import IncompleteUserData
+from dbpromotions.api import RequestBudgetExceededError, fetch, fetch_all, request_budget
+from dbpromotions.database import (
+    ACTIVITY_COLUMNS,
+    ActivityReport,
+    CandidateStore,
+    PopulateRun,
+    PopulateWork,
+    PromotionCandidate,
+    PromotionCandidateEdits,
+    get_activity_reports,
+    get_activity_totals,
+    init_database,
+    save_activity_report,
+    user_database,
+)
+from dbpromotions.incomplete_user_data import IncompleteUserData, normalize_name
+from dbpromotions.metrics import timed_phase, users_processed
+from dbpromotions.response_cache import response_cache
+from dbpromotions.scheduler import as_utc, order_by_priority
+from dbpromotions.user_map import UserMap, UserRow
+from dbpromotions.work_ledger import (
+    DEFERRED,
+    DONE,
+    FAILED,
+    begin_run,
+    claim_work,
+    complete_work,
+    count_claimable,
+    defer_work,
+    draw_requests,
+    fill_run,
+    finish_run_if_done,
+    load_user_data,
+    release_work,
+    renew_work,
+    reserve_updates,
+    settle_updates,
+)
 
+REPORT_GROUP_LIMIT = 1000
 
-def get_recent_non_contributor_uploaders() -> list[IncompleteUserData]:
-    params = {
-        "from": Defaults.RECENT_SINCE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
-        "group": "uploader",
-        "group_limit": 1000,
-        "uploader": {
-            "level": "<35",
-        },
-    }
-    recent_uploader_data = DanbooruPostReport.get(**params, cache=True)  # type: ignore[arg-type]
-    return [IncompleteUserData(name=r.uploader, recent_posts=r.posts) for r in recent_uploader_data]
+# the report each column of the daily activity histogram is filled from: report, group, count field and tags
+ACTIVITY_REPORTS: dict[str, tuple[type[DanbooruPostReport], str, str, str | None]] = {
+    "posts": (DanbooruPostReport, "uploader", "posts", None),
+    "deleted_posts": (DanbooruPostReport, "uploader", "posts", "status:deleted"),
+    "low_gentag_posts": (DanbooruPostReport, "uploader", "posts", Defaults.LOW_GENTAG_QUERY),
+}
+# the candidate fields summed from the histogram over the recent range
+RECENT_ACTIVITY_FIELDS = {
+    "posts": "recent_posts",
+    "deleted_posts": "recent_deleted_posts",
+    "low_gentag_posts": "low_gentag_posts",
+}
 
 
-def get_recent_non_contributor_uploaders_deleted() -> list[IncompleteUserData]:
-    params = {
-        "from": Defaults.RECENT_SINCE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
-        "group": "uploader",
-        "group_limit": 1000,
-        "uploader": {
-            "level": "<35",
-        },
-        "tags": "status:deleted",
-    }
-    recent_uploader_data = DanbooruPostReport.get(**params, cache=True)  # type: ignore[arg-type]
-    return [IncompleteUserData(name=r.uploader, recent_deleted_posts=r.posts) for r in recent_uploader_data]
+def get_report_until() -> str:
+    # reports end tomorrow, taken on every call since workers outlive the day Defaults.RECENT_UNTIL_STR was fixed on
+    return (datetime.now(tz=UTC) + timedelta(days=1)).strftime("%Y-%m-%d")
 
 
-def get_non_contributor_uploaders_deleted() -> list[IncompleteUserData]:
+@timed_phase("get_non_contributor_uploaders_deleted")
+def get_non_contributor_uploaders_deleted() -> list[UserRow]:
     params = {
         "from": Defaults.DANBOORU_START_DATE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
+        "to": get_report_until(),
         "group": "uploader",
-        "group_limit": 1000,
+        "group_limit": REPORT_GROUP_LIMIT,
         "uploader": {
             "level": "<35",
         },
         "tags": "status:deleted",
     }
-    uploader_data = DanbooruPostReport.get(**params, cache=True)  # type: ignore[arg-type]
-    return [IncompleteUserData(name=r.uploader, total_deleted_posts=r.posts) for r in uploader_data]
+    uploader_data = fetch(DanbooruPostReport.get, **params, cache=True)  # type: ignore[arg-type]
+    return [(r.uploader, {"total_deleted_posts": r.posts}) for r in uploader_data]
 
 
-def get_non_contributor_uploaders() -> list[IncompleteUserData]:
-    users = DanbooruUser.get_all(
+@timed_phase("get_non_contributor_uploaders")
+def get_non_contributor_uploaders() -> list[DanbooruUser]:
+    return fetch_all(
+        DanbooruUser.get,
         post_upload_count=f">{Defaults.MIN_UPLOADS}",
-        order="post_upload_count",
         level="<35",
     )
 
-    return [IncompleteUserData.from_danbooru_user(u) for u in users]
 
-
-def get_biggest_non_builder_gardeners() -> list[IncompleteUserData]:
-    users = DanbooruUser.get_all(
-        order="post_update_count",
+@timed_phase("get_biggest_non_builder_gardeners")
+def get_biggest_non_builder_gardeners() -> list[DanbooruUser]:
+    return fetch_all(
+        DanbooruUser.get,
         post_update_count=f">{Defaults.MIN_EDITS}",
         level="<32",
     )
 
-    return [IncompleteUserData.from_danbooru_user(u) for u in users]
-
 
-def get_biggest_non_builder_translators() -> list[IncompleteUserData]:
-    users = DanbooruUser.get_all(
-        order="note_update_count",
+@timed_phase("get_biggest_non_builder_translators")
+def get_biggest_non_builder_translators() -> list[DanbooruUser]:
+    return fetch_all(
+        DanbooruUser.get,
         note_update_count=f">{Defaults.MIN_NOTES}",
         level="<32",
     )
 
-    return [IncompleteUserData.from_danbooru_user(u) for u in users]
 
-
-def get_biggest_non_builder_wiki_editors() -> list[IncompleteUserData]:
+@timed_phase("get_biggest_non_builder_wiki_editors")
+def get_biggest_non_builder_wiki_editors() -> list[UserRow]:
     params = {
         "from": Defaults.DANBOORU_START_DATE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
+        "to": get_report_until(),
         "group": "updater",
-        "group_limit": 1000,
+        "group_limit": REPORT_GROUP_LIMIT,
         "updater": {
             "level": "<32",
         },
     }
 
-    wiki_editor_data = DanbooruWikiPageVersionReport.get(**params, cache=True)
-    return [IncompleteUserData(name=r.updater, total_wiki_edits=r.wiki_edits)for r in wiki_editor_data]
+    wiki_editor_data = fetch(DanbooruWikiPageVersionReport.get, **params, cache=True)
+    return [(r.updater, {"total_wiki_edits": r.wiki_edits}) for r in wiki_editor_data]
 
 
-def get_biggest_non_builder_artist_editors() -> list[IncompleteUserData]:
+@timed_phase("get_biggest_non_builder_artist_editors")
+def get_biggest_non_builder_artist_editors() -> list[UserRow]:
     params = {
         "from": Defaults.DANBOORU_START_DATE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
+        "to": get_report_until(),
         "group": "updater",
-        "group_limit": 1000,
+        "group_limit": REPORT_GROUP_LIMIT,
         "updater": {
             "level": "<32",
         },
     }
 
-    artist_editor_data = DanbooruArtistVersionReport.get(**params, cache=True)
-    return [IncompleteUserData(name=r.updater, total_artist_edits=r.artist_edits) for r in artist_editor_data]
+    artist_editor_data = fetch(DanbooruArtistVersionReport.get, **params, cache=True)
+    return [(r.updater, {"total_artist_edits": r.artist_edits}) for r in artist_editor_data]
 
 
-def get_biggest_non_builder_forum_posters() -> list[IncompleteUserData]:
+@timed_phase("get_biggest_non_builder_forum_posters")
+def get_biggest_non_builder_forum_posters() -> list[UserRow]:
     params = {
         "from": Defaults.DANBOORU_START_DATE_STR,
-        "to": Defaults.RECENT_UNTIL_STR,
+        "to": get_report_until(),
         "group": "creator",
-        "group_limit": 1000,
+        "group_limit": REPORT_GROUP_LIMIT,
         "updater": {
             "level": "<32",
         },
     }
-    recent_uploader_data = DanbooruForumPostReport.get(**params, cache=True)
-    return [IncompleteUserData(name=r.creator, total_forum_posts=r.forum_posts) for r in recent_uploader_data]
-
-
-def merge_map(user_map: dict[str, IncompleteUserData], user_data: list[IncompleteUserData], add_missing: bool = True) -> None:
-    for new_user_data in user_data:
-        old_user_data = user_map.get(new_user_data.name)
-        if not old_user_data:
-            if add_missing:
-                user_map[new_user_data.name] = new_user_data
-            continue
-
-        new_data = old_user_data.model_dump(exclude_none=True) | new_user_data.model_dump(exclude_none=True)
-        user_map[old_user_data.name] = IncompleteUserData(**new_data)
-
-
-def get_user_map_by_name() -> dict[str, IncompleteUserData]:
-    logger.info("Fetching biggest uploaders...")
-    user_map_by_name = {u.name: u for u in get_non_contributor_uploaders()}
-
-    logger.info("Fetching biggest gardeners...")
-    merge_map(user_map_by_name, get_biggest_non_builder_gardeners())
-
-    logger.info("Fetching biggest translators...")
-    merge_map(user_map_by_name, get_biggest_non_builder_translators())
-
-    logger.info("Fetching biggest wiki editors...")
-    editors = get_biggest_non_builder_wiki_editors()
-    logger.info("Fetching biggest artist editors...")
-    editors += get_biggest_non_builder_artist_editors()
-    logger.info("Fetching biggest forum posters...")
-    editors += get_biggest_non_builder_forum_posters()
+    recent_uploader_data = fetch(DanbooruForumPostReport.get, **params, cache=True)
+    return [(r.creator, {"total_forum_posts": r.forum_posts}) for r in recent_uploader_data]
 
-    add_list, merge_list = [], []
-    for user in editors:
-        if (user.total_wiki_edits or 0) + (user.total_artist_edits or 0) > Defaults.MIN_WIKI_ARTIST_EDITS \
-                or (user.total_forum_posts or 0) > Defaults.MIN_FORUM_POSTS:
-            add_list.append(user)
-        else:
-            merge_list.append(user)
 
-    merge_map(user_map_by_name, add_list)
-    merge_map(user_map_by_name, merge_list, add_missing=False)
-
-    logger.info("Fetching recent uploaders...")
-    merge_map(user_map_by_name, get_recent_non_contributor_uploaders(), add_missing=False)
-
-    logger.info("Fetching deleted posts...")
-    merge_map(user_map_by_name, get_non_contributor_uploaders_deleted(), add_missing=False)
-
-    logger.info("Fetching recent deleted posts...")
-    merge_map(user_map_by_name, get_recent_non_contributor_uploaders_deleted(), add_missing=False)
-
-    return user_map_by_name
-
-
-def seed_missing_data(user_map_by_name: dict[str, IncompleteUserData],
-                      max_to_update: int,
-                      resume_from: int,
-                      ) -> dict[int, IncompleteUserData]:
-    user_map_by_id: dict[int, IncompleteUserData] = {}
-    missing_ids: list[IncompleteUserData] = []
+@timed_phase("get_recent_editors")
+def get_recent_editors(report: type[DanbooruPostVersionReport | DanbooruWikiPageVersionReport], days: int) -> list[str]:
+    params = {
+        "from": (datetime.now(tz=UTC) - timedelta(days=days)).strftime("%Y-%m-%d"),
+        "to": get_report_until(),
+        "group": "updater",
+        "group_limit": REPORT_GROUP_LIMIT,
+        "updater": {
+            "level": "<35",
+        },
+    }
+    editor_data = fetch(report.get, **params, cache=True)
+    return [r.updater for r in editor_data]
 
-    processed = 0
-    fetched = 0
-    edit_data_updated = 0
 
-    for user_data in user_map_by_name.values():
-        if user_data.id:
-            processed += 1
-            if processed < resume_from:
+def get_daily_activity_report(day: date, column: str) -> tuple[dict[str, int], bool]:
+    report, group, count_field, tags = ACTIVITY_REPORTS[column]
+    params = {
+        "from": day.strftime("%Y-%m-%d"),
+        "to": (day + timedelta(days=1)).strftime("%Y-%m-%d"),
+        "group": group,
+        "group_limit": REPORT_GROUP_LIMIT,
+        group: {
+            "level": "<35",
+        },
+    }
+    if tags:
+        params["tags"] = tags
+
+    # not kept in the response cache, since the histogram itself is what keeps them
+    rows = fetch(report.get, **params)  # type: ignore[arg-type]
+    counts: dict[str, int] = {}
+    for row in rows:
+        name = normalize_name(getattr(row, group))
+        counts[name] = counts.get(name, 0) + getattr(row, count_field)
+    return counts, len(rows) >= REPORT_GROUP_LIMIT
+
+
+def is_activity_report_due(report: ActivityReport | None, day: date, now: datetime) -> bool:
+    if report is None:
+        return True
+    # a day that was last fetched while it could still change gets fetched again, every now and then
+    fetched_at = as_utc(report.fetched_at)
+    day_end = datetime.combine(day + timedelta(days=1), time(), tzinfo=UTC)
+    return fetched_at < day_end + timedelta(days=Defaults.ACTIVITY_SETTLE_DAYS) \
+        and fetched_at < now - Defaults.ACTIVITY_REFETCH_INTERVAL
+
+
+@timed_phase("update_activity")
+def update_activity() -> None:
+    now = datetime.now(tz=UTC)
+    first_day = now.date() - timedelta(days=Defaults.ACTIVITY_HISTORY_DAYS - 1)
+    fetched = get_activity_reports(first_day)
+
+    due = [(day, column)
+           for day in (first_day + timedelta(days=offset) for offset in range(Defaults.ACTIVITY_HISTORY_DAYS))
+           for column in ACTIVITY_COLUMNS
+           if is_activity_report_due(fetched.get((day, column)), day, now)]
+    if not due:
+        return
+
+    logger.info(f"Fetching {len(due)} daily activity reports...")
+    # fetched in parallel, but saved from this thread, newest first so that an interrupted backfill still covers recent windows
+    due.sort(reverse=True)
+    with ThreadPoolExecutor(max_workers=Defaults.MAX_CONCURRENT_REQUESTS, thread_name_prefix="activity") as executor:
+        reports = executor.map(get_daily_activity_report, [day for day, _ in due], [column for _, column in due])
+        for (day, column), (counts, truncated) in zip(due, reports, strict=True):
+            if truncated:
+                logger.warning(f"The {column} report for {day} hit the group limit; windows including it will be counted user by user.")
+            save_activity_report(day, column, counts, truncated)
+
+
+def get_recent_activity(column: str) -> dict[str, int] | None:
+    # the window is taken from now rather than from Defaults.RECENT_SINCE, which is fixed when the worker starts
+    now = datetime.now(tz=UTC)
+    return get_activity_totals(column, since=(now - Defaults.RECENT_RANGE).date(), until=now.date())
+
+
+def apply_last_edit_hints(user_map: UserMap, kind: str, windows: list[tuple[int, list[str]]]) -> None:
+    # windows go from the narrowest to the widest: users are placed in the narrowest one they show up in, and their last
+    # edit is assumed to be at its most recent bound. Past a truncated window, nobody else can be placed reliably.
+    now = datetime.now(tz=UTC)
+    newer_bound = 0
+    for days, editor_names in windows:
+        for name in map(normalize_name, editor_names):
+            if name in user_map:
+                user_map.last_edit_hints.setdefault(name, {}).setdefault(kind, now - timedelta(days=newer_bound))
+
+        if len(editor_names) >= REPORT_GROUP_LIMIT:
+            return
+        newer_bound = days
+
+    # every window was complete, so whoever isn't in any of them hasn't edited recently
+    for name in user_map.names:
+        user_map.last_edit_hints.setdefault(name, {}).setdefault(kind, None)
+
+
+def fill_unreported(user_map: UserMap, field: str) -> None:
+    # for counts known to list every uploader with at least one match, so that everyone else has zero
+    column = user_map.columns[field]
+    for name in user_map.names:
+        column.setdefault(name, 0)
+
+
+@timed_phase("get_user_map_by_name")
+def get_user_map_by_name() -> UserMap:
+    logger.info("Fetching discovery reports...")
+    with ThreadPoolExecutor(max_workers=Defaults.MAX_CONCURRENT_REQUESTS, thread_name_prefix="discovery") as executor:
+        uploaders = executor.submit(get_non_contributor_uploaders)
+        gardeners = executor.submit(get_biggest_non_builder_gardeners)
+        translators = executor.submit(get_biggest_non_builder_translators)
+        wiki_editors = executor.submit(get_biggest_non_builder_wiki_editors)
+        artist_editors = executor.submit(get_biggest_non_builder_artist_editors)
+        forum_posters = executor.submit(get_biggest_non_builder_forum_posters)
+        deleted_posts = executor.submit(get_non_contributor_uploaders_deleted)
+        activity = executor.submit(update_activity)
+        recent_editor_windows = {
+            (kind, days): executor.submit(get_recent_editors, report, days)
+            for kind, report in (("post", DanbooruPostVersionReport), ("wiki", DanbooruWikiPageVersionReport))
+            for days in Defaults.LAST_EDIT_WINDOWS
+        }
+
+        # results are merged in a fixed order regardless of which fetch finishes first, so the map stays deterministic
+        user_map = UserMap()
+
+        logger.info("Merging biggest uploaders...")
+        user_map.merge_users(uploaders.result())
+
+        logger.info("Merging biggest gardeners...")
+        user_map.merge_users(gardeners.result())
+
+        logger.info("Merging biggest translators...")
+        user_map.merge_users(translators.result())
+
+        logger.info("Merging biggest wiki, artist and forum editors...")
+        editors = wiki_editors.result() + artist_editors.result() + forum_posters.result()
+
+        add_list, merge_list = [], []
+        for name, values in editors:
+            if (values.get("total_wiki_edits") or 0) + (values.get("total_artist_edits") or 0) > Defaults.MIN_WIKI_ARTIST_EDITS \
+                    or (values.get("total_forum_posts") or 0) > Defaults.MIN_FORUM_POSTS:
+                add_list.append((name, values))
+            else:
+                merge_list.append((name, values))
+
+        user_map.merge_rows(add_list)
+        user_map.merge_rows(merge_list, add_missing=False)
+
+        logger.info("Merging deleted posts...")
+        deleted_report = deleted_posts.result()
+        user_map.merge_rows(deleted_report, add_missing=False)
+        if len(deleted_report) < REPORT_GROUP_LIMIT:
+            fill_unreported(user_map, "total_deleted_posts")
+
+        activity.result()
+        for column, field in RECENT_ACTIVITY_FIELDS.items():
+            totals = get_recent_activity(column)
+            if totals is None:
+                # left empty, so that populate_other_values counts them for each user instead
+                logger.info(f"The daily {column} don't cover the recent range, so {field} will be counted user by user.")
                 continue
 
-            logger.info(f"At user {processed} of {len(user_map_by_name)}")
-            fetched += user_data.save_to_db(update=fetched < max_to_update)
-            edit_data_updated += user_data.update_edit_data(update=edit_data_updated < max_to_update)
-            user_map_by_id[user_data.id] = user_data
-        else:
-            missing_ids.append(user_data)
-
-    for missing_id in missing_ids:
-        processed += 1
-
-        if processed < resume_from:
-            continue
-
-        logger.info(f"At user {processed} of {len(user_map_by_name)}")
-        user = DanbooruUser.get_from_name(name=missing_id.name, cache=True)  # type: ignore[call-overload]
-        user_data = IncompleteUserData.from_danbooru_user(user)
-
-        fetched += user_data.save_to_db(update=fetched < max_to_update)
-        edit_data_updated += user_data.update_edit_data(update=edit_data_updated < max_to_update)
-        user_map_by_id[user.id] = user_data
-
-    return user_map_by_id
-
-
-def populate_database(max_to_update: int = 50, resume_from: int = 0) -> None:
+            logger.info(f"Merging {field} from the daily activity...")
+            user_map.merge_rows(((name, {field: count}) for name, count in totals.items()), add_missing=False)
+            fill_unreported(user_map, field)
+
+        logger.info("Merging recent post and wiki editors...")
+        for kind in ("post", "wiki"):
+            windows = [(days, recent_editor_windows[kind, days].result()) for days in Defaults.LAST_EDIT_WINDOWS]
+            apply_last_edit_hints(user_map, kind, windows)
+
+    return user_map
+
+
+class UpdateBudget:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> bool:
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def settle(self, reserved: bool, spent: bool) -> None:
+        # give back unused reservations, and account for new users, which get fetched even without one
+        with self._lock:
+            self.used += spent - reserved
+
+
+class WorkLease:
+    # first-time edit scans can keep a chunk busy for longer than WORK_LEASE, so its lease is extended as users get processed.
+    # A chunk that's stuck stops extending it, and its entries go to another worker once it runs out.
+    def __init__(self, entry_ids: list[int]) -> None:
+        self.entry_ids = entry_ids
+        self.renewed_at = datetime.now(tz=UTC)
+        self._lock = threading.Lock()
+
+    def renew_if_due(self) -> None:
+        now = datetime.now(tz=UTC)
+        with self._lock:
+            if now - self.renewed_at < Defaults.WORK_LEASE / 3:
+                return
+            self.renewed_at = now
+        with user_database.connection_context():
+            renew_work(self.entry_ids)
+
+
+def process_user(user_data: IncompleteUserData,
+                 store: CandidateStore,
+                 fetch_budget: UpdateBudget,
+                 edit_budget: UpdateBudget,
+                 ) -> IncompleteUserData:
+    with user_database.connection_context():
+        if not user_data.id:
+            # not found by resolve_missing_ids, for example because they were renamed since the report was made
+            user = fetch(DanbooruUser.get_from_name, name=user_data.name, cache=True)  # type: ignore[call-overload]
+            user_data = user_data.merge(IncompleteUserData.from_danbooru_user(user))
+
+        reserved = fetch_budget.reserve()
+        fetch_budget.settle(reserved, user_data.save_to_db(store, update=reserved))
+
+        reserved = edit_budget.reserve()
+        edit_budget.settle(reserved, user_data.update_edit_data(store, update=reserved))
+
+    return user_data
+
+
+@timed_phase("resolve_missing_ids")
+def resolve_missing_ids(user_map: UserMap) -> None:
+    missing_names = [name for name in user_map.names if user_map.get(name, "id") is None]
+    logger.info(f"Resolving {len(missing_names)} users without an id...")
+
+    names_by_lowercase = {name.lower(): name for name in missing_names}
+    for name_batch in batched(missing_names, 100):
+        resolved_users = fetch_all(DanbooruUser.get, name_comma=",".join(name_batch))
+        for user in resolved_users:
+            name = names_by_lowercase.get(normalize_name(user.name).lower())
+            if name:
+                user_map.set_danbooru_user(name, user)
+
+
+@timed_phase("discover_work")
+def discover_work(max_to_update: int = 50) -> PopulateRun | None:
     init_database()
-    user_map_by_name = get_user_map_by_name()
-    logger.info(f"Processing {len(user_map_by_name)} users.")
-    seed_missing_data(user_map_by_name, max_to_update=max_to_update, resume_from=resume_from)
+    run, is_new = begin_run(max_to_update)
+    if not is_new and run.discovered_at and finish_run_if_done(run.id):
+        run, is_new = begin_run(max_to_update)
+
+    if not is_new:
+        if not run.discovered_at:
+            logger.info(f"Populate run #{run.id} is still discovering users elsewhere.")
+            return None
+        logger.info(f"Resuming populate run #{run.id}, {count_claimable(run.id)} users left of {run.total}.")
+        return run
+
+    user_map = get_user_map_by_name()
+    resolve_missing_ids(user_map)
+
+    # the most overdue users that matter the most go first, so they're the ones the update budget gets spent on
+    queue = order_by_priority(user_map.to_user_data())
+    fill_run(run, queue)
+    logger.info(f"Populate run #{run.id} will go through {len(queue)} users.")
+
+    response_cache.evict()
+    response_cache.log_stats()
+    return run
+
+
+@timed_phase("process_work_chunk")
+def process_work_chunk(run_id: int,
+                       workers: int = Defaults.REFRESH_WORKERS,
+                       chunk_size: int = Defaults.POPULATE_CHUNK_SIZE,
+                       ) -> int:
+    entries = claim_work(run_id, chunk_size)
+    if not entries:
+        finish_run_if_done(run_id)
+        return 0
+
+    run = PopulateRun.get_by_id(run_id)
+    store = CandidateStore(user_ids=[entry.user_id for entry in entries if entry.user_id])
+    reserved_fetches, reserved_edits = reserve_updates(run_id, len(entries))
+    fetch_budget = UpdateBudget(reserved_fetches)
+    edit_budget = UpdateBudget(reserved_edits)
+    lease = WorkLease([entry.id for entry in entries])
+
+    def process(entry: PopulateWork) -> str:
+        logger.info(f"At user {entry.position} of {run.total}")
+        lease.renew_if_due()
+        try:
+            process_user(load_user_data(entry), store=store, fetch_budget=fetch_budget, edit_budget=edit_budget)
+        except RequestBudgetExceededError:
+            return DEFERRED
+        except Exception:
+            logger.exception(f"Failed to process user '{entry.user_name}' (attempt {entry.attempts + 1}).")
+            return FAILED
+        return DONE
+
+    request_budget.start(lambda wanted: draw_requests(run_id, wanted))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh") as executor:
+            results = dict(zip([entry.id for entry in entries], executor.map(process, entries), strict=True))
+    finally:
+        request_budget.stop()
+
+    for result in results.values():
+        users_processed.inc(step="ledger", outcome=result)
+
+    # entries are only marked as done together with the changes they made, so a crash here just means redoing the chunk.
+    # The flush nested in here becomes a savepoint, so it's this transaction that has to take the write lock upfront.
+    with user_database.atomic("IMMEDIATE"):
+        store.flush()
+        complete_work([entry_id for entry_id, result in results.items() if result == DONE])
+        settle_updates(run_id, fetch_budget.used - reserved_fetches, edit_budget.used - reserved_edits)
+    release_work([entry_id for entry_id, result in results.items() if result == FAILED])
+
+    deferred = [entry_id for entry_id, result in results.items() if result == DEFERRED]
+    if deferred:
+        logger.warning(f"Populate run #{run_id} ran out of requests after {run.max_requests}. Deferring the remaining users.")
+        defer_work(run_id, deferred)
+        finish_run_if_done(run_id)
+        return 0
+
+    return len(entries)
+
+
+def populate_database(max_to_update: int = 50, workers: int = Defaults.REFRESH_WORKERS) -> None:
+    run = discover_work(max_to_update)
+    if not run:
+        return
+
+    logger.info(f"Processing populate run #{run.id} with {workers} workers.")
+    while process_work_chunk(run.id, workers=workers):
+        pass
 
 
 def get_known_user_ids() -> set[int]:
@@ -237,12 +508,20 @@ def get_known_user_ids() -> set[int]:
     return {u["id"] for u in known_users}
 
 
+def fetch_users_by_id(user_ids: tuple[int, ...]) -> list[DanbooruUser]:
+    return fetch_all(DanbooruUser.get, id=",".join(map(str, user_ids)))
+
+
+@timed_phase("refresh_levels")
 def refresh_levels() -> None:
     user_ids = get_known_user_ids()
-    for user_batch in batched(user_ids, 200):
-        updated_users = DanbooruUser.get_all(id=",".join(map(str, user_batch)))
-        for user in updated_users:
-            IncompleteUserData.update_from_danbooru_user(user)
+    updated = 0
+    # batches are downloaded in parallel, but written one transaction at a time from this thread
+    with ThreadPoolExecutor(max_workers=Defaults.MAX_CONCURRENT_REQUESTS, thread_name_prefix="levels") as executor:
+        for updated_users in executor.map(fetch_users_by_id, batched(user_ids, 200)):
+            updated += IncompleteUserData.update_from_danbooru_users(updated_users)
+
+    logger.info(f"Refreshed {len(user_ids)} users, {updated} of which had changed.")
 
 
 if __name__ == "__main__":
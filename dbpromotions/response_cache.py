@@ -0,0 +1,148 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from datetime import timedelta
+
+from loguru import logger
+from peewee import BlobField, CharField, FloatField, IntegerField, Model, chunked, fn
+
+from dbpromotions import Defaults, Settings
+from dbpromotions.database import InstrumentedSqliteDatabase
+from dbpromotions.metrics import api_cache_lookups
+
+response_cache_location = Settings.DATA_FOLDER / "api_cache.sqlite"
+response_cache_database = InstrumentedSqliteDatabase(response_cache_location, pragmas={"journal_mode": "wal", "busy_timeout": 10_000})
+
+
+class CachedResponse(Model):
+    class Meta:
+        database = response_cache_database
+
+    key = CharField(primary_key=True)
+    endpoint = CharField(index=True)
+    value = BlobField()
+    size = IntegerField()
+    expires_at = FloatField(index=True)
+    accessed_at = FloatField(index=True)
+
+
+def get_endpoint_name(endpoint: Callable) -> str:
+    # endpoints are classmethods inherited from a common base, so the class they're bound to is what tells them apart
+    owner = getattr(endpoint, "__self__", None)
+    if isinstance(owner, type):
+        return f"{owner.__name__}.{endpoint.__name__}"
+    return endpoint.__qualname__
+
+
+def get_ttl(endpoint_name: str, kwargs: dict) -> timedelta | None:
+    if endpoint_name.endswith("Report.get"):
+        if kwargs.get("from") == Defaults.DANBOORU_START_DATE_STR:
+            return Defaults.ALL_TIME_REPORT_CACHE_TTL
+        return Defaults.RECENT_REPORT_CACHE_TTL
+    return Defaults.API_CACHE_TTLS.get(endpoint_name)
+
+
+class ResponseCache:
+    # responses are kept on disk between runs, so that every hourly task doesn't download the same reports from scratch
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._writes_since_eviction = 0
+
+    def _init(self) -> None:
+        with self._lock:
+            if self._initialized:
+                return
+            response_cache_location.parent.mkdir(parents=True, exist_ok=True)
+            response_cache_database.create_tables([CachedResponse])
+            self._initialized = True
+
+    @staticmethod
+    def get_key(endpoint_name: str, args: tuple, kwargs: dict) -> str:
+        call = json.dumps([endpoint_name, args, kwargs], sort_keys=True, default=str)
+        return hashlib.sha1(call.encode()).hexdigest()  # noqa: S324
+
+    def fetch[T](self, endpoint: Callable[..., T], request: Callable[[], T], args: tuple, kwargs: dict) -> T:
+        endpoint_name = get_endpoint_name(endpoint)
+        ttl = get_ttl(endpoint_name, kwargs)
+        if ttl is None:
+            return request()
+
+        self._init()
+        key = self.get_key(endpoint_name, args, kwargs)
+        now = time.time()
+
+        cached = CachedResponse.get_or_none((CachedResponse.key == key) & (CachedResponse.expires_at > now))
+        if cached:
+            with self._lock:
+                self.hits[endpoint_name] += 1
+            api_cache_lookups.inc(endpoint=endpoint_name, result="hit")
+            CachedResponse.update(accessed_at=now).where(CachedResponse.key == key).execute()
+            return pickle.loads(cached.value)  # noqa: S301
+
+        with self._lock:
+            self.misses[endpoint_name] += 1
+        api_cache_lookups.inc(endpoint=endpoint_name, result="miss")
+
+        response = request()
+
+        value = pickle.dumps(response)
+        CachedResponse.replace(
+            key=key,
+            endpoint=endpoint_name,
+            value=value,
+            size=len(value),
+            expires_at=now + ttl.total_seconds(),
+            accessed_at=now,
+        ).execute()
+
+        with self._lock:
+            self._writes_since_eviction += 1
+            should_evict = self._writes_since_eviction >= 50
+            if should_evict:
+                self._writes_since_eviction = 0
+        if should_evict:
+            self.evict()
+
+        return response
+
+    def evict(self) -> None:
+        self._init()
+        with response_cache_database.atomic():
+            CachedResponse.delete().where(CachedResponse.expires_at <= time.time()).execute()
+
+            total_size = CachedResponse.select(fn.COALESCE(fn.SUM(CachedResponse.size), 0)).scalar()
+            if total_size <= self.max_size:
+                return
+
+            # least recently used first
+            to_free = total_size - self.max_size
+            evicted = []
+            query = CachedResponse.select(CachedResponse.key, CachedResponse.size).order_by(CachedResponse.accessed_at)
+            for cached in query.iterator():
+                if to_free <= 0:
+                    break
+                evicted.append(cached.key)
+                to_free -= cached.size
+
+            for batch in chunked(evicted, 500):
+                CachedResponse.delete().where(CachedResponse.key.in_(batch)).execute()
+
+        logger.debug(f"Evicted {len(evicted)} responses from the API cache.")
+
+    def log_stats(self) -> None:
+        with self._lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+        if hits or misses:
+            logger.info(f"API cache: {hits} hits, {misses} misses ({hits / (hits + misses):.0%} served from disk).")
+
+
+response_cache = ResponseCache(max_size=Defaults.API_CACHE_MAX_SIZE)
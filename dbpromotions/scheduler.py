@@ -0,0 +1,96 @@
+import math
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING
+
+from peewee import chunked
+
+from dbpromotions import Defaults
+from dbpromotions.database import PromotionCandidate
+
+if TYPE_CHECKING:
+    from dbpromotions.incomplete_user_data import IncompleteUserData
+
+# the same thresholds as should_be_considered
+PROMOTION_THRESHOLDS = (
+    (("total_posts",), Defaults.MIN_UPLOADS),
+    (("post_edits",), Defaults.MIN_EDITS),
+    (("total_note_edits",), Defaults.MIN_NOTES),
+    (("total_wiki_edits", "total_artist_edits"), Defaults.MIN_WIKI_ARTIST_EDITS),
+    (("total_forum_posts",), Defaults.MIN_FORUM_POSTS),
+)
+ACTIVE_RECENT_POSTS = 50
+
+
+def as_utc(moment: datetime | None) -> datetime | None:
+    # values loaded from the database are naive, but stored as utc
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return moment.replace(tzinfo=UTC)
+
+
+def get_value(field: str, user_data: "IncompleteUserData", saved_data: PromotionCandidate | None) -> int:
+    value = getattr(user_data, field)
+    if value is None and saved_data is not None:
+        value = getattr(saved_data, field)
+    return value or 0
+
+
+def get_last_edit(user_data: "IncompleteUserData", saved_data: PromotionCandidate | None) -> datetime | None:
+    last_edits = [user_data._last_edit_hints.get("post"), user_data.last_edit, saved_data.last_edit if saved_data else None]
+    return max((as_utc(last_edit) for last_edit in last_edits if last_edit), default=None)  # type: ignore[type-var]
+
+
+def get_importance(user_data: "IncompleteUserData", saved_data: PromotionCandidate | None, now: datetime) -> float:
+    # between 0 for dormant users far from any threshold, and 3 for very active users that are past one
+    activity = min(get_value("recent_posts", user_data, saved_data) / ACTIVE_RECENT_POSTS, 1)
+
+    last_edit = get_last_edit(user_data, saved_data)
+    if last_edit and last_edit > now - timedelta(weeks=1):
+        activity += 1
+    elif last_edit and last_edit > now - Defaults.RECENT_RANGE:
+        activity += 0.5
+
+    closeness = max(min(sum(get_value(field, user_data, saved_data) for field in fields) / threshold, 1) ** 2
+                    for fields, threshold in PROMOTION_THRESHOLDS)
+
+    return activity + closeness
+
+
+def get_refresh_interval(importance: float) -> timedelta:
+    # users that matter get refreshed at least weekly, everyone else at least every MAX_UNCHANGED_AGE
+    interval = Defaults.MAX_UNCHANGED_AGE / (1 + 4 * importance)
+    return min(max(interval, Defaults.USER_REFRESH_INTERVAL), Defaults.MAX_UNCHANGED_AGE)
+
+
+def get_next_due(user_data: "IncompleteUserData", saved_data: PromotionCandidate | None, now: datetime | None = None) -> datetime:
+    now = now or datetime.now(tz=UTC)
+    last_checked = as_utc(user_data.last_checked or (saved_data.last_checked if saved_data else None))
+    if not last_checked:
+        return now
+    return last_checked + get_refresh_interval(get_importance(user_data, saved_data, now))
+
+
+def get_refresh_priority(user_data: "IncompleteUserData", saved_data: PromotionCandidate | None, now: datetime) -> float:
+    # how overdue the user is relative to their own interval, weighted by how much they matter
+    last_checked = as_utc(saved_data.last_checked if saved_data else None)
+    if not last_checked:
+        return math.inf
+
+    importance = get_importance(user_data, saved_data, now)
+    overdue = (now - last_checked) / get_refresh_interval(importance)
+    return overdue * (1 + importance)
+
+
+def order_by_priority(users: Iterable["IncompleteUserData"]) -> list["IncompleteUserData"]:
+    users = list(users)
+    now = datetime.now(tz=UTC)
+
+    saved_by_id: dict[int, PromotionCandidate] = {}
+    for user_ids in chunked([user_data.id for user_data in users if user_data.id], 500):
+        saved_users = PromotionCandidate.select().where(PromotionCandidate.id.in_(user_ids))
+        saved_by_id.update((saved_data.id, saved_data) for saved_data in saved_users)
+
+    priorities = {id(user_data): get_refresh_priority(user_data, saved_by_id.get(user_data.id), now)  # type: ignore[arg-type]
+                  for user_data in users}
+    return sorted(users, key=lambda user_data: priorities[id(user_data)], reverse=True)
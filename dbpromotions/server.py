@@ -1,13 +1,41 @@
 
+import gzip
 import hashlib
+import time
 from datetime import UTC, datetime
+from functools import cache
 from pathlib import Path
 
-from flask import Flask, render_template
+from danbooru.user_level import UserLevel
+from flask import Flask, Response, g, jsonify, render_template, request
 from jinja2 import StrictUndefined
 from peewee import DoesNotExist
 
-from dbpromotions.database import PromotionCandidate, PromotionCandidateEdits, get_active_users
+from dbpromotions import Defaults
+from dbpromotions.database import (
+    CANDIDATE_SORT_COLUMNS,
+    SNAPSHOT_FIELDS,
+    TAG_LEADERBOARD_COLUMNS,
+    PromotionCandidate,
+    PromotionCandidateEdits,
+    get_active_levels,
+    get_candidate_presets,
+    get_candidates_page,
+    get_data_version,
+    get_snapshots,
+    get_tag_leaderboard,
+)
+from dbpromotions.edit_summary import get_top_tags
+from dbpromotions.metrics import (
+    get_process_name,
+    http_request_duration,
+    http_requests,
+    read_metrics_files,
+    registry,
+    render_metrics,
+    write_metrics_file_if_due,
+)
+from dbpromotions.page_cache import get_cached_page
 
 server = Flask(__name__)
 server.jinja_env.undefined = StrictUndefined
@@ -17,6 +45,30 @@ CONTRIB_MAX_DEL_COUNT = 50
 CONTRIB_MAX_DEL_PERC = 3
 BUILDER_MAX_DEL_PERC = 15
 
+MAX_PAGE_LENGTH = 1000
+
+
+@server.before_request
+def start_timer() -> None:
+    g.request_start = time.perf_counter()
+
+
+@server.after_request
+def record_request(response: Response) -> Response:
+    endpoint = request.endpoint or "unknown"
+    http_requests.inc(endpoint=endpoint, status=str(response.status_code))
+    http_request_duration.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    # scrapes only reach one of the web workers, so the others are read back from their files
+    write_metrics_file_if_due("web")
+    return response
+
+
+@server.route("/metrics")
+def metrics() -> Response:
+    # whatever every process last wrote to disk, with this worker's own metrics as they are now
+    snapshots = {**read_metrics_files(), get_process_name("web"): registry.snapshot()}
+    return Response(render_metrics(snapshots), mimetype="text/plain; version=0.0.4")
+
 
 @server.template_filter("days_ago")
 def days_ago_int(dt: datetime | str) -> int:
@@ -69,16 +121,47 @@ def get_last_updated() -> datetime:
 
 
 def get_js_hash() -> str:
-    file_path = Path("dbpromotions/static/app.js")
+    file_path = Path(server.static_folder) / "app.js"  # type: ignore[arg-type]
+    return _get_file_hash(file_path, file_path.stat().st_mtime_ns)
+
+
+@cache
+def _get_file_hash(file_path: Path, mtime: int) -> str:  # noqa: ARG001
     # Generate MD5 hash
     return hashlib.md5(file_path.read_bytes()).hexdigest()  # noqa: S324
 
 
+def get_page_version() -> str:
+    # anything that changes the rendered page: the data, the js checksum, the template, and the relative dates
+    template_path = Path(server.root_path) / server.template_folder / "promotions.jinja2"  # type: ignore[operator]
+    return ":".join([
+        get_data_version(),
+        get_js_hash(),
+        str(template_path.stat().st_mtime_ns),
+        datetime.now(tz=UTC).strftime("%Y-%m-%d"),
+    ])
+
+
+def cached_response(etag: str, gzipped_body: bytes) -> Response:
+    if request.accept_encodings["gzip"]:
+        response = Response(gzipped_body, content_type="text/html; charset=utf-8")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(gzip.decompress(gzipped_body), content_type="text/html; charset=utf-8")
+
+    response.set_etag(etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
 @server.route("/")
-def users() -> str:
-    users = get_active_users()
-    users = [u for u in users if u.should_be_considered]
+def users() -> Response:
+    etag, body = get_cached_page("promotions", get_page_version(), render_users)
+    return cached_response(etag, body)
+
 
+def render_users() -> str:
     return render_template(
         "promotions.jinja2",
         last_updated=get_last_updated(),
@@ -86,11 +169,133 @@ def users() -> str:
         builder_max_del_perc=BUILDER_MAX_DEL_PERC,
         max_deleted_bad=CONTRIB_MAX_DEL_COUNT,
         max_deleted_warning=CONTRIB_RISKY_DEL_COUNT,
-        users=users,
+        levels={level: UserLevel.name_from_number(level) for level in get_active_levels()},
+        presets={name: label for name, (label, _) in get_candidate_presets().items()},
         checksum=get_js_hash(),
     )
 
 
+@server.route("/candidates.json")
+def candidates() -> Response:
+    # server-side processing for the DataTables candidates table
+    args = request.args
+
+    order_column = args.get("order[0][column]", type=int)
+    order_by = args.get(f"columns[{order_column}][data]", "total_posts")
+    if order_by not in CANDIDATE_SORT_COLUMNS:
+        order_by = "total_posts"
+
+    length = args.get("length", 25, type=int)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    preset = args.get("preset")
+    if preset not in get_candidate_presets():
+        preset = None
+
+    total, filtered, users = get_candidates_page(
+        offset=max(args.get("start", 0, type=int), 0),
+        limit=length,
+        order_by=order_by,
+        descending=args.get("order[0][dir]", "desc") == "desc",
+        search=args.get("search[value]", "").strip(),
+        levels=[int(level) for level in args.get("level", "").split(",") if level.isdigit()],
+        banned={"1": True, "0": False}.get(args.get("banned", "")),
+        preset=preset,
+    )
+
+    return jsonify({
+        "draw": args.get("draw", 0, type=int),
+        "recordsTotal": total,
+        "recordsFiltered": filtered,
+        "data": [candidate_row(user) for user in users],
+    })
+
+
+def candidate_row(user: PromotionCandidate) -> dict:
+    return {
+        "id": user.id,
+        "html_classes": user.html_classes,
+        "level": user.level,
+        "level_string": user.level_string.title(),
+        "name": user.name,
+        "url": user.url,
+        "is_mintagger": user.is_mintagger,
+        "mintags_url": user.mintags_url,
+        "dmail_url": user.dmail_url,
+        "total_posts": user.total_posts,
+        "total_deleted_posts": user.total_deleted_posts,
+        "total_delete_ratio": user.html_total_deletion_ratio,
+        "recent_posts": user.recent_posts,
+        "recent_posts_url": user.recent_posts_url,
+        "recent_deleted_posts": user.recent_deleted_posts,
+        "recent_deleted_posts_url": user.recent_deleted_posts_url,
+        "recent_delete_ratio": user.html_recent_deletion_ratio,
+        "total_note_edits": user.total_note_edits,
+        "note_edits_url": user.note_edits_url,
+        "total_wiki_edits": user.total_wiki_edits,
+        "wiki_edits_url": user.wiki_edits_url,
+        "total_artist_edits": user.total_artist_edits,
+        "artist_edits_url": user.artist_edits_url,
+        "total_forum_posts": user.total_forum_posts,
+        "forum_posts_url": user.forum_posts_url,
+        "post_edits": user.post_edits,
+        "post_edits_url": user.post_edits_url,
+        "bad_edit_tags": user.bad_edit_tags,
+        "worst_revert_perc": f"{user.worst_revert_perc:.0f}",
+        "last_edit": weeks_ago_str(user.last_edit_dt),
+        "first_added": days_ago_str(user.first_added_dt),
+        "first_added_title": str(user.first_added_dt),
+    }
+
+
+@server.route("/tags/<path:tag>/leaderboard.json")
+def tag_leaderboard(tag: str) -> Response:
+    order_by = request.args.get("order", "total")
+    if order_by not in TAG_LEADERBOARD_COLUMNS:
+        order_by = "total"
+
+    limit = request.args.get("limit", 100, type=int)
+    if limit < 0 or limit > MAX_PAGE_LENGTH:
+        limit = MAX_PAGE_LENGTH
+
+    leaderboard = get_tag_leaderboard(
+        tag=tag,
+        year=request.args.get("year", type=int),
+        order_by=order_by,
+        limit=limit,
+        min_edits=request.args.get("min_edits", Defaults.MIN_TAG_EDITS, type=int),
+    )
+
+    for entry in leaderboard:
+        entry["level_string"] = UserLevel.name_from_number(entry["level"])
+        entry["revert_perc"] = round(entry["revert_perc"] or 0, 2)
+
+    return jsonify({"tag": tag, "order": order_by, "data": leaderboard})
+
+
+@server.route("/users/<int:user_id>/trend")
+def user_trend(user_id: int) -> Response:
+    # one series per field, plus the deletion ratios, aligned with taken_at
+    fields = [field for field in request.args.get("fields", "").split(",") if field in SNAPSHOT_FIELDS] or list(SNAPSHOT_FIELDS)
+    snapshots = get_snapshots(
+        user_id,
+        since=request.args.get("since", type=datetime.fromisoformat),
+        until=request.args.get("until", type=datetime.fromisoformat),
+    )
+
+    series: dict[str, list] = {field: [values.get(field) for _, values in snapshots] for field in fields}
+    for ratio, deleted, total in (("total_delete_ratio", "total_deleted_posts", "total_posts"),
+                                  ("recent_delete_ratio", "recent_deleted_posts", "recent_posts")):
+        series[ratio] = [round(values.get(deleted, 0) * 100 / values[total], 2) if values.get(total) else 0 for _, values in snapshots]
+
+    return jsonify({
+        "user_id": user_id,
+        "taken_at": [taken_at.isoformat() for taken_at, _ in snapshots],
+        "series": series,
+    })
+
+
 @server.route("/users/<user_id>/edit_summary")
 def user_edits(user_id: int) -> str:
     try:
@@ -102,37 +307,15 @@ def user_edits(user_id: int) -> str:
           so it's gonna take a while to collect it for old entries.</p>
         """
 
-    process_edit_data(user_data.data)
+    edits_data = user_data.data
+    if "top_tags" not in edits_data:
+        # summaries saved before the metrics were computed on write
+        edits_data = {**edits_data, "top_tags": get_top_tags(edits_data["by_tag"])}
 
     return render_template(
         "edits_summary.jinja2",
-        edits_data=user_data.data,
+        edits_data=edits_data,
         user_id=user_id,
         last_checked=user_data.last_checked,
+        min_tag_edits=Defaults.MIN_TAG_EDITS,
     )
-
-
-def process_edit_data(data: dict) -> None:
-    for tag_data in data["by_tag"].values():
-        tag_data["total"] = tag_data["added"] + tag_data["removed"]
-        tag_data["revert_total"] = tag_data["revert_added"] + tag_data["revert_removed"]
-
-        tag_data["revert_total_perc"] = (tag_data["revert_total"] / tag_data["total"]) * 100
-
-        if tag_data["added"]:
-            tag_data["revert_added_perc"] = (tag_data["revert_added"] / tag_data["added"]) * 100
-        else:
-            tag_data["revert_added_perc"] = 0
-
-        if tag_data["removed"]:
-            tag_data["revert_removed_perc"] = (tag_data["revert_removed"] / tag_data["removed"]) * 100
-        else:
-            tag_data["revert_removed_perc"] = 0
-
-        tag_data["bad_edits"] = False
-        if tag_data["revert_total_perc"] > 15:
-            tag_data["bad_edits"] = True
-        if tag_data["revert_added_perc"] > 20 and tag_data["added"] > 20:
-            tag_data["bad_edits"] = True
-        if tag_data["revert_removed_perc"] > 20 and tag_data["removed"] > 20:
-            tag_data["bad_edits"] = True
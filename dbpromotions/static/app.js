@@ -30,10 +30,23 @@ class DBPromotions {
         });
     }
 
-    get_column(name) {
-        return $("#users th").filter(function () {
-            return $(this).text().trim().toLowerCase() === name.toLowerCase();
-        }).index();
+    escape(text) {
+        return $("<div/>").text(text).html()
+    }
+
+    link(url, text) {
+        return `<a href="${url}" target="_blank">${this.escape(text)}</a>`
+    }
+
+    linked_column(name, url_name, class_name) {
+        let klass = this
+        return {
+            data: name,
+            className: class_name,
+            render: function (data, type, row) {
+                return type === "display" ? klass.link(row[url_name], data) : data
+            }
+        }
     }
 
     populate_secondary_tables(rowData) {
@@ -42,7 +55,7 @@ class DBPromotions {
             .text("Loading...");
 
         $.ajax( {
-            url: `/users/${rowData[this.get_column("ID")]}/edit_summary`,
+            url: `/users/${rowData.id}/edit_summary`,
             success: function ( response ) {
                 div.html( response ).removeClass("loading");
                 new DataTable("table#by_year:not(.dataTable)", {
@@ -73,28 +86,25 @@ class DBPromotions {
     init_primary_table() {
         let klass = this
 
-
+        // rows are paged, sorted and filtered by the server, see /candidates.json
         this.table = new DataTable("table#users", {
             initComplete: function() { $("table#users").show(); },
+            serverSide: true,
+            processing: true,
+            ajax: {
+                url: "/candidates.json",
+                data: function (data) {
+                    data.level = $("#filter-level").val()
+                    data.banned = $("#filter-banned").val()
+                    data.preset = $("#filter-preset").val()
+                },
+            },
+            searchDelay: 400,
             paging: true,
             lengthMenu: [10, 25, 50, 75, 100, 1000],
             pageLength: 25,
             responsive: true,
             layout: {
-                top3: {
-                    searchPanes: {
-                        columns: [ // Specifies which columns to include in the search panes
-                            klass.get_column("Level"),
-                            klass.get_column("Total %")
-                        ],
-                        controls: false,
-                        dtOpts: {
-                            select: {
-                                style: 'multi'
-                            }
-                        }
-                    }
-                },
                 top2Start: 'pageLength',
                 top2End: 'search',
                 topStart: 'info',
@@ -108,84 +118,70 @@ class DBPromotions {
                 header: true,
                 footer: true,
             },
-            searchPanes: {
-                viewTotal: true
-            },
             stateSave: true,
-            order: [[klass.get_column("Uploads"), 'desc']],
-            columnDefs: [
+            order: [[4, 'desc']],
+            createdRow: function (row, data) {
+                $(row).addClass(data.html_classes)
+                row.setAttribute("data-user-id", data.id)
+            },
+            columns: [
                 {
+                    data: null,
                     className: "dt-control",
                     orderable: false,
-                    data: null,
                     defaultContent: "",
-                    targets: 0
                 },
+                { data: "id", className: "userid" },
                 {
-                    targets: [klass.get_column("Total %")],
-                    searchPanes: {
-                        show: true,
-                        header: "Additional Filtering",
-                        options: [
-                            {
-                                label: '1. For Contrib (<4%, 500 ups, 50 recent)',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return parseFloat(rowData[klass.get_column("recent %")]) < 4
-                                        && parseInt(rowData[klass.get_column("uploads")]) > 500
-                                        && parseInt($(rowData[klass.get_column("recent uploads")]).text()) > 50;
-                                }
-                            },
-                            {
-                                label: '2. Translators for Builder (>2000 notes)',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return parseInt($(rowData[klass.get_column("notes")]).text()) > 2000 && rowData[klass.get_column("level")].display !== "Builder";
-                                }
-                            },
-                            {
-                                label: '3. For Builder (>5000 edits or >1000 ups)',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return rowData[klass.get_column("level")].display !== "Builder" &&
-                                        (
-                                            parseInt($(rowData[klass.get_column("edits")]).text()) > 5000 ||
-                                            parseInt(rowData[klass.get_column("uploads")]) > 1000
-                                        )
-                                }
-                            },
-                            {
-                                label: '4. Wiki/Artist Editors (>1000 edits)',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return rowData[klass.get_column("level")].display !== "Builder" &&
-                                    (
-                                        parseInt($(rowData[klass.get_column("wikis")]).text()) + parseInt($(rowData[klass.get_column("artists")]).text()) > 1000
-                                    )
-                                }
-                            },
-                            {
-                                label: '5. Forum Posters (>100 posts)',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return rowData[klass.get_column("level")].display !== "Builder" &&
-                                    (
-                                        parseInt($(rowData[klass.get_column("forum")]).text()) > 100
-                                    )
-                                }
-                            },
-                            {
-                                label: '6. Mintaggers/Bad users',
-                                // eslint-disable-next-line no-unused-vars
-                                value: function (rowData, rowIdx) {
-                                    return $(rowData[klass.get_column("user")]).text().includes("⚠️")
-                                }
-                            },
-                        ]
-                    },
+                    data: "level",
+                    className: "level",
+                    render: function (data, type, row) {
+                        return type === "display" ? row.level_string : data
+                    }
+                },
+                {
+                    data: "name",
+                    className: "username",
+                    render: function (data, type, row) {
+                        if (type !== "display") {
+                            return data
+                        }
+                        let html = klass.link(row.url, data)
+                        if (row.is_mintagger) {
+                            html += ` <a href="${row.mintags_url}" title="<15 gentags on many recent uploads" target="_blank">⚠️</a>`
+                            html += ` <a href="${row.dmail_url}" target="_blank">✉️</a>`
+                        }
+                        if (row.bad_edit_tags) {
+                            html += ` <span class="bad-edits-flag" title="${row.bad_edit_tags} tags with many reverted edits (worst: ${row.worst_revert_perc}% reverted)">🚩</span>`
+                        }
+                        return html
+                    }
+                },
+                { data: "total_posts", className: "totalUploaded" },
+                { data: "total_deleted_posts", className: "totalDeleted" },
+                { data: "total_delete_ratio", className: "totalRatio" },
+                this.linked_column("recent_posts", "recent_posts_url", "recentUploaded"),
+                this.linked_column("recent_deleted_posts", "recent_deleted_posts_url", "recentDeleted"),
+                { data: "recent_delete_ratio", className: "recentRatio" },
+                this.linked_column("total_note_edits", "note_edits_url", "totalNotes"),
+                this.linked_column("total_wiki_edits", "wiki_edits_url", "totalWikis"),
+                this.linked_column("total_artist_edits", "artist_edits_url", "totalArtists"),
+                this.linked_column("total_forum_posts", "forum_posts_url", "totalForums"),
+                this.linked_column("post_edits", "post_edits_url", "totalEdits"),
+                { data: "last_edit", className: "lastEdit" },
+                {
+                    data: "first_added",
+                    className: "firstAdded",
+                    render: function (data, type, row) {
+                        return type === "display" ? `<span title="${row.first_added_title}">${data}</span>` : data
+                    }
                 },
             ],
         });
+
+        $("#filters select").on("change", function () {
+            klass.table.ajax.reload()
+        })
     }
 
     init_values() {
@@ -1,7 +1,14 @@
+import math
+import os
+
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import task_postrun, worker_process_init
 
-from dbpromotions.populate import populate_database, refresh_levels
+from dbpromotions import Defaults
+from dbpromotions.api import request_limiter
+from dbpromotions.metrics import write_metrics_file
+from dbpromotions.populate import count_claimable, discover_work, process_work_chunk, refresh_levels
 
 tasks = Celery(  # type: ignore[call-arg]
     broker_url="filesystem://",
@@ -10,9 +17,21 @@ tasks = Celery(  # type: ignore[call-arg]
         "data_folder_out": "./data/celery",
         "control_folder": "./data/celery",
     },
+    worker_concurrency=int(os.environ.get("CELERY_CONCURRENCY", "2")),
 )
 
 
+@worker_process_init.connect
+def split_request_rate(**kwargs) -> None:  # noqa: ARG001
+    # every worker process has its own limiter, so the request rate is split between them
+    request_limiter.set_rate(Defaults.MAX_REQUESTS_PER_SECOND / tasks.conf.worker_concurrency)
+
+
+@task_postrun.connect
+def save_metrics(**kwargs) -> None:  # noqa: ARG001
+    write_metrics_file("tasks")
+
+
 @tasks.on_after_configure.connect  # type: ignore[union-attr]
 def setup_periodic_tasks(sender: Celery, **kwargs) -> None:  # noqa: ARG001
     sender.add_periodic_task(crontab(minute="20", hour="*"), refresh_levels_task.s(), name="Refresh levels.")
@@ -27,4 +46,17 @@ def refresh_levels_task() -> None:
 
 @tasks.task(max_retries=0, ignore_result=True)
 def populate_database_task() -> None:
-    populate_database()
+    # only discovers who to go through; the users themselves are processed by refresh chunks, on any free worker
+    run = discover_work()
+    if not run:
+        return
+
+    for _ in range(math.ceil(count_claimable(run.id) / Defaults.POPULATE_CHUNK_SIZE)):
+        refresh_chunk_task.delay(run.id)
+
+
+@tasks.task(max_retries=0, ignore_result=True)
+def refresh_chunk_task(run_id: int) -> None:
+    # keeps going until nothing is left to claim, which picks up users that were released or whose worker died
+    if process_work_chunk(run_id):
+        refresh_chunk_task.delay(run_id)
@@ -0,0 +1,98 @@
+from collections.abc import Iterable
+from functools import cache
+from typing import TYPE_CHECKING, Any
+
+from danbooru.model import WrongIncludeCallError
+from danbooru.models import DanbooruUser
+
+from dbpromotions.incomplete_user_data import IncompleteUserData, normalize_name
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+type UserRow = tuple[str, dict[str, Any]]
+
+USER_FIELDS = tuple(IncompleteUserData.model_fields)
+
+
+@cache
+def get_shared_fields(user_class: type[DanbooruUser]) -> tuple[str, ...]:
+    # the danbooru user fields that IncompleteUserData.from_danbooru_user copies over as they are
+    return tuple(field for field in user_class.model_fields if field in USER_FIELDS and field != "level")
+
+
+def get_user_values(user: DanbooruUser) -> dict[str, Any]:
+    # the same values as IncompleteUserData.from_danbooru_user, without dumping the user or validating anything
+    values = {field: getattr(user, field) for field in get_shared_fields(type(user))}
+    values |= {
+        "total_posts": user.post_upload_count,
+        "total_note_edits": user.note_update_count,
+        "post_edits": user.post_update_count,
+        "level": user.level_string,
+    }
+    try:
+        values |= {
+            "total_wiki_edits": user.wiki_page_version_count,
+            "total_artist_edits": user.artist_version_count,
+            "total_forum_posts": user.forum_post_count,
+        }
+    except WrongIncludeCallError:
+        pass
+    return values
+
+
+class UserMap:
+    # what discovery accumulates: one column per field, keyed by normalized name, that reports write into without any validation.
+    # Users only become IncompleteUserData once every report has been merged in.
+    def __init__(self) -> None:
+        self.columns: dict[str, dict[str, Any]] = {field: {} for field in USER_FIELDS}
+        self.danbooru_users: dict[str, DanbooruUser] = {}
+        self.last_edit_hints: dict[str, dict[str, datetime | None]] = {}
+        self._names: dict[str, None] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._names)
+
+    def get(self, name: str, field: str) -> Any:  # noqa: ANN401
+        return self.columns[field].get(name)
+
+    def update(self, name: str, values: dict[str, Any], add_missing: bool = True) -> bool:
+        # later values win, but None never overwrites anything, like merging IncompleteUserData does
+        if name not in self._names:
+            if not add_missing:
+                return False
+            self._names[name] = None
+
+        for field, value in values.items():
+            if value is not None:
+                self.columns[field][name] = value
+        return True
+
+    def merge_rows(self, rows: Iterable[UserRow], add_missing: bool = True) -> None:
+        for name, values in rows:
+            self.update(normalize_name(name), values, add_missing=add_missing)
+
+    def merge_users(self, users: Iterable[DanbooruUser], add_missing: bool = True) -> None:
+        for user in users:
+            self.set_danbooru_user(normalize_name(user.name), user, add_missing=add_missing)
+
+    def set_danbooru_user(self, name: str, user: DanbooruUser, add_missing: bool = True) -> None:
+        if self.update(name, get_user_values(user), add_missing=add_missing):
+            self.danbooru_users[name] = user
+
+    def get_user_data(self, name: str) -> IncompleteUserData:
+        values = {field: column[name] for field, column in self.columns.items() if name in column}
+        user_data = IncompleteUserData(**{"name": name} | values)
+        user_data._danbooru_user = self.danbooru_users.get(name)
+        user_data._last_edit_hints = self.last_edit_hints.get(name, {})
+        return user_data
+
+    def to_user_data(self) -> list[IncompleteUserData]:
+        return [self.get_user_data(name) for name in self._names]
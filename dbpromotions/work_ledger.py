@@ -0,0 +1,193 @@
+from datetime import UTC, datetime
+
+from danbooru.models import DanbooruUser
+from loguru import logger
+from peewee import Case, Expression, chunked, fn
+
+from dbpromotions import Defaults
+from dbpromotions.database import PopulateRun, PopulateWork, user_database
+from dbpromotions.incomplete_user_data import IncompleteUserData
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+DEFERRED = "deferred"
+
+
+def get_unfinished_run() -> PopulateRun | None:
+    return PopulateRun.select().where(PopulateRun.finished_at.is_null()).order_by(PopulateRun.id.desc()).first()
+
+
+def begin_run(max_to_update: int, max_requests: int = Defaults.MAX_REQUESTS_PER_RUN) -> tuple[PopulateRun, bool]:
+    # a run that's still going is picked up again instead of starting a new one, so overlapping schedules don't duplicate work
+    now = datetime.now(tz=UTC)
+    with user_database.atomic("IMMEDIATE"):
+        run = get_unfinished_run()
+        if run:
+            discovery_expired = PopulateRun.select().where(
+                (PopulateRun.id == run.id)
+                & PopulateRun.discovered_at.is_null()
+                & (PopulateRun.started_at < now - Defaults.DISCOVERY_TIMEOUT),
+            ).exists()
+            if not discovery_expired:
+                return run, False
+
+            logger.warning(f"Discovery for populate run #{run.id} never finished. Starting a new run.")
+            run.finished_at = now
+            run.save()
+
+        run = PopulateRun.create(started_at=now, max_to_update=max_to_update, max_requests=max_requests)
+        PopulateWork.delete().where(PopulateWork.run_id != run.id).execute()
+        return run, True
+
+
+def fill_run(run: PopulateRun, queue: list[IncompleteUserData]) -> None:
+    rows = [{
+        "run_id": run.id,
+        "position": position,
+        "user_name": user_data.name,
+        "user_id": user_data.id,
+        "user_data": user_data.model_dump_json(),
+        "last_edit_hints": {kind: last_edit.isoformat() if last_edit else None for kind, last_edit in user_data._last_edit_hints.items()},
+        "danbooru_user": user_data._danbooru_user.model_dump(mode="json") if user_data._danbooru_user else None,
+    } for position, user_data in enumerate(queue, start=1)]
+
+    with user_database.atomic():
+        for batch in chunked(rows, 100):
+            PopulateWork.insert_many(batch).execute()
+
+        run.total = len(rows)
+        run.discovered_at = datetime.now(tz=UTC)
+        run.save()
+
+
+def load_user_data(entry: PopulateWork) -> IncompleteUserData:
+    user_data = IncompleteUserData.model_validate_json(entry.user_data)
+    user_data._last_edit_hints = {kind: datetime.fromisoformat(last_edit) if last_edit else None
+                                  for kind, last_edit in entry.last_edit_hints.items()}
+    if entry.danbooru_user:
+        user_data._danbooru_user = DanbooruUser.model_validate(entry.danbooru_user)
+    return user_data
+
+
+def is_expired(now: datetime) -> Expression:
+    # entries whose lease ran out belong to a worker that died
+    return (PopulateWork.state == CLAIMED) & (PopulateWork.lease_until < now)
+
+
+def is_claimable(now: datetime) -> Expression:
+    return (PopulateWork.state == PENDING) | (is_expired(now) & (PopulateWork.attempts < Defaults.MAX_WORK_ATTEMPTS))
+
+
+def fail_abandoned_work(run_id: int, now: datetime) -> None:
+    # expired entries that already used up their attempts are never claimed again
+    PopulateWork.update(state=FAILED, lease_until=None).where(
+        (PopulateWork.run_id == run_id) & is_expired(now) & (PopulateWork.attempts >= Defaults.MAX_WORK_ATTEMPTS),
+    ).execute()
+
+
+def claim_work(run_id: int, limit: int) -> list[PopulateWork]:
+    now = datetime.now(tz=UTC)
+    with user_database.atomic("IMMEDIATE"):
+        fail_abandoned_work(run_id, now)
+        entries = list(PopulateWork
+                       .select()
+                       .where((PopulateWork.run_id == run_id) & is_claimable(now))
+                       .order_by(PopulateWork.position)
+                       .limit(limit))
+
+        PopulateWork.update(
+            state=CLAIMED,
+            lease_until=now + Defaults.WORK_LEASE,
+            attempts=PopulateWork.attempts + 1,
+        ).where(PopulateWork.id.in_([entry.id for entry in entries])).execute()
+
+    return entries
+
+
+def renew_work(entry_ids: list[int]) -> None:
+    # for chunks that are still making progress, however long their users take
+    lease_until = datetime.now(tz=UTC) + Defaults.WORK_LEASE
+    for batch in chunked(entry_ids, 500):
+        PopulateWork.update(lease_until=lease_until).where(PopulateWork.id.in_(batch) & (PopulateWork.state == CLAIMED)).execute()
+
+
+def complete_work(entry_ids: list[int]) -> None:
+    for batch in chunked(entry_ids, 500):
+        PopulateWork.update(state=DONE, lease_until=None).where(PopulateWork.id.in_(batch)).execute()
+
+
+def release_work(entry_ids: list[int]) -> None:
+    # failed entries are retried by a later chunk, until they run out of attempts
+    state = Case(None, [(PopulateWork.attempts >= Defaults.MAX_WORK_ATTEMPTS, FAILED)], PENDING)
+    for batch in chunked(entry_ids, 500):
+        PopulateWork.update(state=state, lease_until=None).where(PopulateWork.id.in_(batch)).execute()
+
+
+def defer_work(run_id: int, entry_ids: list[int]) -> None:
+    # once the run is out of requests, whatever is left waits for the next run, which will rank them again
+    for batch in chunked(entry_ids, 500):
+        PopulateWork.update(state=DEFERRED, lease_until=None).where(PopulateWork.id.in_(batch)).execute()
+    PopulateWork.update(state=DEFERRED).where((PopulateWork.run_id == run_id) & (PopulateWork.state == PENDING)).execute()
+
+
+def count_claimable(run_id: int) -> int:
+    now = datetime.now(tz=UTC)
+    return PopulateWork.select().where((PopulateWork.run_id == run_id) & is_claimable(now)).count()
+
+
+def finish_run_if_done(run_id: int) -> bool:
+    now = datetime.now(tz=UTC)
+    with user_database.atomic("IMMEDIATE"):
+        run = PopulateRun.get_by_id(run_id)
+        if run.finished_at:
+            return True
+
+        fail_abandoned_work(run_id, now)
+        unfinished = PopulateWork.select().where((PopulateWork.run_id == run_id) & PopulateWork.state.in_([PENDING, CLAIMED]))
+        if unfinished.exists():
+            return False
+
+        run.finished_at = now
+        run.save()
+
+    states = dict(PopulateWork
+                  .select(PopulateWork.state, fn.COUNT(PopulateWork.id))
+                  .where(PopulateWork.run_id == run_id)
+                  .group_by(PopulateWork.state)
+                  .tuples())
+    logger.info(f"Populate run #{run_id} finished: {states.get(DONE, 0)} users processed, {states.get(FAILED, 0)} failed, "
+                f"{states.get(DEFERRED, 0)} deferred after running out of requests.")
+    return True
+
+
+def reserve_updates(run_id: int, wanted: int) -> tuple[int, int]:
+    # a chunk reserves fetches and edits for all of its users at once, out of what's left of the run's max_to_update
+    with user_database.atomic("IMMEDIATE"):
+        run = PopulateRun.get_by_id(run_id)
+        fetches = min(wanted, max(run.max_to_update - run.fetches_used, 0))
+        edits = min(wanted, max(run.max_to_update - run.edits_used, 0))
+        PopulateRun.update(
+            fetches_used=PopulateRun.fetches_used + fetches,
+            edits_used=PopulateRun.edits_used + edits,
+        ).where(PopulateRun.id == run_id).execute()
+    return fetches, edits
+
+
+def settle_updates(run_id: int, fetches: int, edits: int) -> None:
+    # what a chunk used beyond its reservation, negative for the part of it that went unused
+    if fetches or edits:
+        PopulateRun.update(
+            fetches_used=PopulateRun.fetches_used + fetches,
+            edits_used=PopulateRun.edits_used + edits,
+        ).where(PopulateRun.id == run_id).execute()
+
+
+def draw_requests(run_id: int, wanted: int) -> int:
+    # hands out up to `wanted` of the run's remaining requests; a negative amount gives unused ones back
+    with user_database.atomic("IMMEDIATE"):
+        run = PopulateRun.get_by_id(run_id)
+        granted = min(wanted, max(run.max_requests - run.requests_used, 0))
+        PopulateRun.update(requests_used=PopulateRun.requests_used + granted).where(PopulateRun.id == run_id).execute()
+    return granted
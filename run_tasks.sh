@@ -1,2 +1,3 @@
 #!/bin/bash
-uv run celery -A dbpromotions.tasks worker -E -B --loglevel=INFO --concurrency=1
+# populate is split into chunks that the worker processes claim from a shared ledger, see dbpromotions.work_ledger
+uv run celery -A dbpromotions.tasks worker -E -B --loglevel=INFO --concurrency="${CELERY_CONCURRENCY:-2}"
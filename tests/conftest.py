@@ -0,0 +1,47 @@
+import os
+import tempfile
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+# dbpromotions reads its settings on import, so the data folder has to point somewhere disposable before anything imports it
+os.environ["BASE_FOLDER"] = tempfile.mkdtemp(prefix="dbpromotions-tests-")
+
+from dbpromotions.database import USER_DATABASE_MODELS, PromotionCandidate, init_database, user_database
+
+
+@pytest.fixture(autouse=True)
+def database() -> Iterator[None]:
+    # every test starts from empty tables
+    init_database()
+    yield
+    user_database.drop_tables(USER_DATABASE_MODELS)
+    user_database.close()
+
+
+@pytest.fixture
+def make_candidate() -> Callable[..., PromotionCandidate]:
+    def make_candidate(user_id: int, **values) -> PromotionCandidate:
+        now = datetime.now(tz=UTC)
+        defaults = {
+            "name": f"user_{user_id}",
+            "level": 20,
+            "created_at": now - timedelta(days=1000),
+            "is_deleted": False,
+            "is_banned": False,
+            "last_checked": now,
+            "last_edit": now - timedelta(days=1),
+            "total_posts": 0,
+            "total_deleted_posts": 0,
+            "recent_posts": 0,
+            "recent_deleted_posts": 0,
+            "post_edits": 0,
+            "total_note_edits": 0,
+            "total_wiki_edits": 0,
+            "total_artist_edits": 0,
+            "total_forum_posts": 0,
+            "low_gentag_posts": 0,
+        }
+        return PromotionCandidate(id=user_id, **defaults | values)
+    return make_candidate
@@ -0,0 +1,58 @@
+from datetime import UTC, date, datetime, timedelta
+
+from dbpromotions import Defaults, populate
+from dbpromotions.database import get_activity_totals, save_activity_report
+
+FIRST_DAY = date(2024, 3, 1)
+LAST_DAY = date(2024, 3, 3)
+
+
+def save_days(days: list[date], truncated: bool = False) -> None:
+    for day in days:
+        save_activity_report(day, "posts", {"user_a": 2, "user_b": day.day}, truncated=truncated)
+
+
+def test_totals_sum_every_day_of_the_window() -> None:
+    save_days([FIRST_DAY, FIRST_DAY + timedelta(days=1), LAST_DAY, LAST_DAY + timedelta(days=1)])
+    save_activity_report(FIRST_DAY, "deleted_posts", {"user_a": 1}, truncated=False)
+
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) == {"user_a": 6, "user_b": 6}
+    assert get_activity_totals("posts", since=LAST_DAY, until=LAST_DAY) == {"user_a": 2, "user_b": 3}
+
+
+def test_a_refetched_day_replaces_what_it_said_before() -> None:
+    save_days([FIRST_DAY, FIRST_DAY + timedelta(days=1), LAST_DAY])
+    save_activity_report(LAST_DAY, "posts", {"user_a": 5}, truncated=False)
+
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) == {"user_a": 9, "user_b": 3}
+
+
+def test_totals_are_unknown_with_a_missing_day() -> None:
+    save_days([FIRST_DAY, LAST_DAY])
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) is None
+
+    # another column's report for the missing day doesn't fill the gap
+    save_activity_report(FIRST_DAY + timedelta(days=1), "deleted_posts", {"user_a": 1}, truncated=False)
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) is None
+
+
+def test_totals_are_unknown_with_a_truncated_day() -> None:
+    save_days([FIRST_DAY, LAST_DAY])
+    save_days([FIRST_DAY + timedelta(days=1)], truncated=True)
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) is None
+
+    # until it's fetched again without hitting the group limit
+    save_days([FIRST_DAY + timedelta(days=1)])
+    assert get_activity_totals("posts", since=FIRST_DAY, until=LAST_DAY) == {"user_a": 6, "user_b": 6}
+
+
+def test_recent_activity_is_taken_from_the_current_day(monkeypatch) -> None:
+    today = datetime.now(tz=UTC).date()
+    monkeypatch.setattr(Defaults, "RECENT_RANGE", timedelta(days=2))
+    monkeypatch.setattr(Defaults, "RECENT_SINCE", datetime(2020, 1, 1, tzinfo=UTC))
+    save_days([today - timedelta(days=offset) for offset in range(3)])
+
+    assert populate.get_recent_activity("posts") == {
+        "user_a": 6,
+        "user_b": sum((today - timedelta(days=offset)).day for offset in range(3)),
+    }
@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import backoff._sync
+import pytest
+
+from dbpromotions import Defaults, api
+from dbpromotions.api import RateLimiter, RequestBudgetExceededError, fetch_all, request, request_budget
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int, retry_after: str = "") -> None:
+        super().__init__(status_code)
+        self.response = SimpleNamespace(status_code=status_code, headers={"Retry-After": retry_after} if retry_after else {})
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(api, "time", clock)
+    monkeypatch.setattr(backoff._sync, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock) -> RateLimiter:  # noqa: ARG001
+    limiter = RateLimiter(requests_per_second=10, burst=2)
+    monkeypatch.setattr(api, "request_limiter", limiter)
+    return limiter
+
+
+def test_limiter_spends_the_burst_then_waits_for_tokens(clock, limiter) -> None:
+    for _ in range(3):
+        limiter.wait()
+    assert clock.sleeps == [pytest.approx(0.1)]
+
+
+def test_throttling_halves_the_rate_and_pauses_everyone(clock, limiter) -> None:
+    limiter.on_throttle(pause=5)
+    assert limiter.rate == 5
+
+    limiter.wait()
+    assert sum(clock.sleeps) == pytest.approx(5)
+
+    for _ in range(10):
+        limiter.on_throttle(pause=0)
+    assert limiter.rate == Defaults.MIN_REQUESTS_PER_SECOND
+
+
+def test_successes_bring_the_rate_back_up(limiter) -> None:
+    limiter.on_throttle(pause=0)
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.rate == limiter.max_rate
+
+
+def test_throttled_requests_are_retried_after_retry_after(clock, limiter) -> None:
+    responses = [HTTPError(429, retry_after="30"), HTTPError(503), "ok"]
+
+    def endpoint() -> str:
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert request(endpoint) == "ok"
+    assert limiter.rate < limiter.max_rate
+    assert clock.now - 1000 >= 30
+
+
+@pytest.mark.usefixtures("limiter")
+def test_permanent_errors_are_not_retried() -> None:
+    calls = []
+
+    def endpoint() -> None:
+        calls.append(1)
+        raise HTTPError(404)
+
+    with pytest.raises(HTTPError):
+        request(endpoint)
+    assert len(calls) == 1
+
+
+@pytest.mark.usefixtures("limiter")
+def test_listings_are_fetched_one_request_per_page(monkeypatch) -> None:
+    users = [SimpleNamespace(id=user_id) for user_id in range(1, 6)]
+    pages = []
+
+    def get(page: str, limit: int, **search) -> list[SimpleNamespace]:
+        pages.append((page, search))
+        return [user for user in users if user.id > int(page[1:])][:limit]
+
+    monkeypatch.setattr(Defaults, "LISTING_PAGE_SIZE", 2)
+    request_budget.start(lambda wanted: wanted)
+    try:
+        assert fetch_all(get, level="<32") == users
+        assert request_budget.used == 3
+    finally:
+        request_budget.stop()
+    assert pages == [("a0", {"level": "<32"}), ("a2", {"level": "<32"}), ("a4", {"level": "<32"})]
+
+
+@pytest.mark.usefixtures("limiter")
+def test_listings_stop_when_the_budget_runs_out(monkeypatch) -> None:
+    monkeypatch.setattr(Defaults, "LISTING_PAGE_SIZE", 1)
+    pages = []
+
+    def get(page: str, limit: int) -> list[SimpleNamespace]:
+        pages.append(page)
+        return [SimpleNamespace(id=int(page[1:]) + 1)][:limit]
+
+    remaining = [2]
+
+    def draw(wanted: int) -> int:
+        granted = min(wanted, remaining[0])
+        remaining[0] -= granted
+        return granted
+
+    request_budget.start(draw)
+    try:
+        with pytest.raises(RequestBudgetExceededError):
+            fetch_all(get)
+    finally:
+        request_budget.stop()
+    assert pages == ["a0", "a1"]
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+from datetime import UTC, datetime
+
+from danbooru.models import DanbooruUser
+
+from dbpromotions.database import (
+    CandidateStore,
+    PopulateRun,
+    PromotionCandidate,
+    PromotionCandidateSnapshot,
+    get_data_version,
+    user_database,
+)
+from dbpromotions.incomplete_user_data import IncompleteUserData
+
+
+def test_new_candidates_are_only_written_on_flush(make_candidate) -> None:
+    store = CandidateStore()
+    store.save(make_candidate(1, total_posts=600), new=True)
+
+    assert store.get(1).total_posts == 600
+    assert not PromotionCandidate.select().exists()
+
+    store.flush()
+    assert PromotionCandidate.get_by_id(1).total_posts == 600
+
+
+def test_save_flushes_every_n_candidates(make_candidate) -> None:
+    store = CandidateStore(flush_every=3)
+    for user_id in range(1, 6):
+        store.save(make_candidate(user_id), new=True)
+
+    assert PromotionCandidate.select().count() == 3
+    store.flush()
+    assert PromotionCandidate.select().count() == 5
+
+
+def test_flush_only_writes_changed_columns(make_candidate) -> None:
+    make_candidate(1, total_posts=600, post_edits=100).save(force_insert=True)
+    store = CandidateStore()
+
+    candidate = store.get(1)
+    candidate.total_posts = 700
+    store.save(candidate)
+
+    # written by someone else after the store loaded its copy
+    PromotionCandidate.update(post_edits=200).where(PromotionCandidate.id == 1).execute()
+    store.flush()
+
+    saved = PromotionCandidate.get_by_id(1)
+    assert saved.total_posts == 700
+    assert saved.post_edits == 200
+
+
+def test_unchanged_candidates_are_flushed_without_effect(make_candidate) -> None:
+    make_candidate(1, total_posts=600).save(force_insert=True)
+    store = CandidateStore()
+    store.save(store.get(1))
+    store.flush()
+
+    assert PromotionCandidate.get_by_id(1).total_posts == 600
+    assert not store._pending
+
+
+def test_partial_store_looks_up_missing_users(make_candidate) -> None:
+    make_candidate(1).save(force_insert=True)
+    make_candidate(2).save(force_insert=True)
+    store = CandidateStore(user_ids=[1])
+
+    assert list(store._candidates) == [1]
+    assert store.get(2).id == 2
+    assert store.get(3) is None
+
+
+def test_flush_keeps_a_snapshot(make_candidate) -> None:
+    store = CandidateStore()
+    store.save(make_candidate(1, total_posts=600), new=True)
+    store.flush()
+
+    snapshot = PromotionCandidateSnapshot.get(PromotionCandidateSnapshot.user_id == 1)
+    assert snapshot.is_keyframe
+    assert snapshot.values["total_posts"] == 600
+
+
+def test_only_candidate_writes_change_the_data_version(make_candidate) -> None:
+    version = get_data_version()
+    PopulateRun.create(started_at=datetime.now(tz=UTC), max_to_update=10)
+    assert get_data_version() == version
+
+    store = CandidateStore()
+    store.save(make_candidate(1), new=True)
+    store.flush()
+    assert get_data_version() != version
+
+    # the hourly level refresh writes candidates too, but only when something changed
+    user = DanbooruUser.model_validate({
+        "id": 1,
+        "name": "user_1",
+        "level": 30,
+        "level_string": "Gold",
+        "created_at": "2020-01-01T00:00:00.000Z",
+        "post_upload_count": 0,
+        "post_update_count": 0,
+        "note_update_count": 0,
+    })
+    version = get_data_version()
+    assert IncompleteUserData.update_from_danbooru_users([user]) == 1
+    assert get_data_version() != version
+
+    version = get_data_version()
+    assert IncompleteUserData.update_from_danbooru_users([user]) == 0
+    assert get_data_version() == version
+
+def test_flush_waits_for_another_writer(make_candidate) -> None:
+    # a flush that took a read lock first couldn't wait for the write lock, and would fail right away instead
+    make_candidate(1).save(force_insert=True)
+    other = sqlite3.connect(user_database.database, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    commit = threading.Timer(0.2, other.execute, ["COMMIT"])
+
+    store = CandidateStore()
+    candidate = store.get(1)
+    candidate.total_posts = 600
+    store.save(candidate)
+    commit.start()
+    try:
+        store.flush()
+    finally:
+        commit.join()
+        other.close()
+    assert PromotionCandidate.get_by_id(1).total_posts == 600
@@ -0,0 +1,167 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+from dbpromotions import Defaults, incomplete_user_data
+from dbpromotions.database import CandidateStore, PromotionCandidateEdits, PromotionCandidateTagEdits, save_tag_edits
+from dbpromotions.edit_summary import TAG_EDITS_VERSION, EditSummary
+from dbpromotions.incomplete_user_data import IncompleteUserData, get_tag_edits_version
+
+NOW = datetime.now(tz=UTC)
+OLD = NOW - timedelta(days=Defaults.EDIT_SETTLE_DAYS + 10)
+RECENT = NOW - timedelta(days=1)
+
+
+def version(version_id: int, updated_at: datetime, **tags: list[str]) -> SimpleNamespace:
+    # stands in for a DanbooruPostVersion
+    tag_lists = {f"{kind}_tags": tags.get(kind, []) for kind in ("added", "removed", "obsolete_added", "obsolete_removed")}
+    return SimpleNamespace(id=version_id, updated_at=updated_at, **tag_lists)
+
+
+def reload(summary: EditSummary) -> EditSummary:
+    # the same round trip the data goes through in PromotionCandidateEdits
+    data = summary.to_data()
+    data["unsettled"] = {str(version_id): list(tags) for version_id, tags in data["unsettled"].items()}
+    return EditSummary.from_data(data)
+
+
+def test_full_scan_counts_every_version() -> None:
+    summary = EditSummary()
+    summary.consume([
+        version(3, RECENT, added=["a"], obsolete_added=["a"]),
+        version(2, OLD, added=["a", "b"], removed=["c"]),
+        version(1, OLD, removed=["c"], obsolete_removed=["c"]),
+    ])
+
+    data = summary.to_data()
+    assert data["count"] == 3
+    assert data["newest_id"] == 3
+    assert data["by_tag"]["a"] == {"added": 2, "removed": 0, "revert_added": 1, "revert_removed": 0}
+    assert data["by_tag"]["c"] == {"added": 0, "removed": 2, "revert_added": 0, "revert_removed": 1}
+    assert data["settled_id"] == 2
+    assert data["unsettled"] == {3: (["a"], [])}
+
+
+def test_refetched_versions_only_replace_their_reverts() -> None:
+    summary = EditSummary()
+    summary.consume([
+        version(2, RECENT, added=["a"]),
+        version(1, OLD, added=["b"]),
+    ])
+
+    summary = reload(summary)
+    summary.consume([
+        # reverted since the last scan
+        version(2, RECENT, added=["a"], obsolete_added=["a"]),
+        version(3, RECENT, removed=["c"]),
+    ])
+
+    data = summary.to_data()
+    assert data["count"] == 3
+    assert data["newest_id"] == 3
+    assert data["by_tag"]["a"] == {"added": 1, "removed": 0, "revert_added": 1, "revert_removed": 0}
+    assert summary.new_tag_edits() == {
+        ("a", RECENT.year): {"added": 0, "removed": 0, "revert_added": 1, "revert_removed": 0},
+        ("c", RECENT.year): {"added": 0, "removed": 1, "revert_added": 0, "revert_removed": 0},
+    }
+
+
+def test_reverts_are_not_counted_twice() -> None:
+    summary = EditSummary()
+    summary.consume([version(1, RECENT, added=["a", "b"], obsolete_added=["a"])])
+
+    summary = reload(summary)
+    summary.consume([version(1, RECENT, added=["a", "b"], obsolete_added=["a", "b"])])
+
+    data = summary.to_data()
+    assert data["by_tag"]["a"]["revert_added"] == 1
+    assert data["by_tag"]["b"]["revert_added"] == 1
+    assert summary.new_tag_edits() == {("b", RECENT.year): {"added": 0, "removed": 0, "revert_added": 1, "revert_removed": 0}}
+
+
+def test_versions_that_leave_the_window_are_settled() -> None:
+    summary = EditSummary()
+    summary.consume([version(1, RECENT, added=["a"], obsolete_added=["a"])])
+    summary = reload(summary)
+
+    # a later scan, once the version has become older than the settle window
+    summary.settle_since = NOW
+    summary.consume([version(1, RECENT, added=["a"], obsolete_added=["a"])])
+
+    data = summary.to_data()
+    assert data["settled_id"] == 1
+    assert data["unsettled"] == {}
+    assert data["by_tag"]["a"]["revert_added"] == 1
+
+
+def test_summaries_without_a_settle_window_are_taken_as_settled() -> None:
+    summary = EditSummary()
+    summary.consume([version(5, RECENT, added=["a"])])
+    data = summary.to_data()
+    del data["settled_id"], data["unsettled"]
+
+    assert EditSummary.from_data(data).settled_id == 5
+
+
+def test_fetch_edit_data_refetches_the_settle_window(monkeypatch) -> None:
+    versions = [
+        version(1, OLD, added=["a"]),
+        version(2, RECENT, added=["a"]),
+    ]
+    pages = []
+
+    def fetch(_endpoint, page: str, limit: int, **_kwargs) -> list[SimpleNamespace]:
+        pages.append(page)
+        if page.startswith("a"):
+            return [v for v in versions if v.id > int(page[1:])][:limit]
+        return sorted(versions, key=lambda v: v.id, reverse=True)[:limit]
+
+    monkeypatch.setattr(incomplete_user_data, "fetch", fetch)
+    user = IncompleteUserData(id=1, name="user_1")
+
+    data = user.fetch_edit_data().to_data()
+    assert data["by_tag"]["a"]["revert_added"] == 0
+
+    versions[1] = version(2, RECENT, added=["a"], obsolete_added=["a"])
+    versions.append(version(3, RECENT, added=["a"]))
+    data = user.fetch_edit_data(previous_data=data).to_data()
+
+    assert pages == ["1", "a1"]
+    assert data["count"] == 3
+    assert data["by_tag"]["a"] == {"added": 3, "removed": 0, "revert_added": 1, "revert_removed": 0}
+
+
+def test_users_without_tag_edits_are_scanned_incrementally(monkeypatch, make_candidate) -> None:
+    # someone who only ever changes ratings and sources never gets a row in the tag edits table
+    versions = [version(version_id, OLD) for version_id in range(1, 4)]
+    pages = []
+
+    def fetch(_endpoint, page: str, limit: int, **_kwargs) -> list[SimpleNamespace]:
+        pages.append(page)
+        if page.startswith("a"):
+            return [v for v in versions if v.id > int(page[1:])][:limit]
+        return sorted(versions, key=lambda v: v.id, reverse=True)[:limit]
+
+    monkeypatch.setattr(incomplete_user_data, "fetch", fetch)
+    make_candidate(1).save(force_insert=True)
+    store = CandidateStore()
+    user = IncompleteUserData(id=1, name="user_1", level=20, post_edits=100)
+
+    assert user.update_edit_data(store, update=True)
+    assert pages == ["1"]
+    assert not PromotionCandidateTagEdits.select().exists()
+
+    PromotionCandidateEdits.update(last_checked=NOW - timedelta(days=31)).execute()
+    versions.append(version(4, RECENT))
+    assert user.update_edit_data(store, update=True)
+    assert pages == ["1", "a3"]
+    assert PromotionCandidateEdits.get_by_id(1).data["count"] == 4
+
+
+def test_summaries_from_before_the_tag_edits_table_are_scanned_again() -> None:
+    data = EditSummary().to_data()
+    assert get_tag_edits_version(1, data) == TAG_EDITS_VERSION
+
+    del data["tag_edits"]
+    assert get_tag_edits_version(1, data) != TAG_EDITS_VERSION
+    save_tag_edits(1, {("a", 2024): {"added": 1, "removed": 0, "revert_added": 0, "revert_removed": 0}})
+    assert get_tag_edits_version(1, data) == TAG_EDITS_VERSION
@@ -0,0 +1,155 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from danbooru.models import DanbooruPostVersion, DanbooruWikiPageVersion
+from danbooru.reports import DanbooruPostVersionReport
+
+from dbpromotions import Defaults, incomplete_user_data, populate
+from dbpromotions.database import CandidateStore, PromotionCandidate
+from dbpromotions.incomplete_user_data import IncompleteUserData
+from dbpromotions.populate import apply_last_edit_hints, get_recent_editors
+from dbpromotions.scheduler import as_utc
+from dbpromotions.user_map import UserMap
+
+NOW = datetime.now(tz=UTC)
+
+
+@pytest.fixture
+def fetched(monkeypatch) -> dict:
+    # what set_last_edit gets back from each endpoint, and the endpoints it went to
+    fetched: dict = {"calls": []}
+
+    def fetch(endpoint, *_args, **_kwargs) -> list:
+        fetched["calls"].append(endpoint)
+        return fetched.get(endpoint, [])
+
+    monkeypatch.setattr(incomplete_user_data, "fetch", fetch)
+    return fetched
+
+
+def make_user_map(*names: str) -> UserMap:
+    user_map = UserMap()
+    for name in names:
+        user_map.update(name, {})
+    return user_map
+
+
+def get_hint_days(user_map: UserMap, kind: str) -> dict[str, int | None]:
+    hints = {name: hints[kind] for name, hints in user_map.last_edit_hints.items() if kind in hints}
+    return {name: None if hint is None else round((NOW - hint) / timedelta(days=1)) for name, hint in hints.items()}
+
+
+def test_recent_editor_reports_end_tomorrow(monkeypatch) -> None:
+    # workers run for days, so the end of the window can't be what it was when they started
+    monkeypatch.setattr(Defaults, "RECENT_UNTIL_STR", "2020-01-01")
+    params = []
+    monkeypatch.setattr(populate, "fetch", lambda _endpoint, **kwargs: params.append(kwargs) or [])
+
+    get_recent_editors(DanbooruPostVersionReport, 7)
+    assert params[0]["from"] == (NOW - timedelta(days=7)).strftime("%Y-%m-%d")
+    assert params[0]["to"] == (NOW + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def test_users_are_placed_in_the_narrowest_window_they_edited_in() -> None:
+    user_map = make_user_map("user_a", "user_b", "user_c")
+    apply_last_edit_hints(user_map, "post", [(1, ["user a"]), (7, ["user_a", "user_b"]), (31, ["someone_else"])])
+
+    assert get_hint_days(user_map, "post") == {"user_a": 0, "user_b": 1, "user_c": None}
+    assert "someone_else" not in user_map
+
+
+def test_nobody_is_placed_past_a_truncated_window(monkeypatch) -> None:
+    monkeypatch.setattr(populate, "REPORT_GROUP_LIMIT", 2)
+    user_map = make_user_map("user_a", "user_b", "user_c")
+    apply_last_edit_hints(user_map, "post", [(1, ["user_a"]), (7, ["user_b", "someone_else"]), (31, ["user_c"])])
+
+    # user_c may well have edited within the week, the report just didn't have room for them
+    assert get_hint_days(user_map, "post") == {"user_a": 0, "user_b": 1}
+
+
+def test_a_recent_hint_is_taken_as_the_last_edit(make_candidate, fetched) -> None:
+    user = IncompleteUserData(id=1, name="user_1", post_edits=100)
+    user._last_edit_hints = {"post": NOW - timedelta(days=7)}
+
+    assert user.set_last_edit(make_candidate(1)) == NOW - timedelta(days=7)
+    assert user.last_edit == NOW - timedelta(days=7)
+    assert not fetched["calls"]
+
+
+def test_no_recent_edits_keep_an_old_last_edit(make_candidate, fetched) -> None:
+    user = IncompleteUserData(id=1, name="user_1", post_edits=100)
+    user._last_edit_hints = {"post": None}
+    old_edit = (NOW - timedelta(days=200)).replace(microsecond=0)
+
+    assert user.set_last_edit(make_candidate(1, last_edit=old_edit)) == old_edit
+    assert not fetched["calls"]
+
+
+def test_no_recent_edits_over_a_recent_last_edit_are_looked_up(make_candidate, fetched) -> None:
+    # the saved last edit says they were active, so the reports saying otherwise isn't enough to go on
+    user = IncompleteUserData(id=1, name="user_1", post_edits=100)
+    user._last_edit_hints = {"post": None}
+    fetched[DanbooruPostVersion.get] = [SimpleNamespace(updated_at=NOW - timedelta(days=3))]
+
+    assert user.set_last_edit(make_candidate(1, last_edit=NOW - timedelta(days=10))) == NOW - timedelta(days=3)
+    assert fetched["calls"] == [DanbooruPostVersion.get]
+
+
+def test_wiki_hints_are_used_for_users_without_post_edits(make_candidate, fetched) -> None:
+    user = IncompleteUserData(id=1, name="user_1", post_edits=0)
+    user._last_edit_hints = {"post": None, "wiki": NOW - timedelta(days=1)}
+
+    assert user.set_last_edit(make_candidate(1, last_edit=NOW - timedelta(days=10))) is None
+    assert user.last_edit == NOW - timedelta(days=1)
+    assert not fetched["calls"]
+
+
+def test_without_hints_the_last_wiki_edit_is_the_fallback(make_candidate, fetched) -> None:
+    user = IncompleteUserData(id=1, name="user_1", post_edits=0)
+    fetched[DanbooruWikiPageVersion.get] = [SimpleNamespace(updated_at=NOW - timedelta(days=5))]
+
+    assert user.set_last_edit(make_candidate(1)) is None
+    assert user.last_edit == NOW - timedelta(days=5)
+    assert fetched["calls"] == [DanbooruPostVersion.get, DanbooruWikiPageVersion.get]
+
+
+def make_unchanged_user(make_candidate, last_refreshed: datetime, last_edit: datetime) -> IncompleteUserData:
+    user = IncompleteUserData(id=1, name="user_1", level=20, is_banned=False, is_deleted=False,
+                              total_posts=600, post_edits=3000, total_note_edits=10)
+    candidate = make_candidate(1, total_posts=600, post_edits=3000, total_note_edits=10, last_edit=last_edit,
+                               counters_fingerprint=user.get_counters_fingerprint(), last_refreshed=last_refreshed)
+    candidate.save(force_insert=True)
+    return user
+
+
+def test_unchanged_users_still_take_recent_hints(make_candidate, fetched) -> None:
+    # a wiki editor's counters don't move, but the wiki report says they're active
+    user = make_unchanged_user(make_candidate, last_refreshed=NOW - timedelta(days=1), last_edit=NOW - timedelta(days=90))
+    user._last_edit_hints = {"post": None, "wiki": NOW - timedelta(days=1)}
+    store = CandidateStore()
+
+    assert not user.save_to_db(store, update=True)
+    assert as_utc(store.get(1).last_edit) == (NOW - timedelta(days=1)).replace(microsecond=0)
+    assert not fetched["calls"]
+
+
+def test_unchanged_users_keep_a_newer_last_edit(make_candidate, fetched) -> None:
+    last_edit = (NOW - timedelta(hours=2)).replace(microsecond=0)
+    user = make_unchanged_user(make_candidate, last_refreshed=NOW - timedelta(days=1), last_edit=last_edit)
+    user._last_edit_hints = {"post": NOW - timedelta(days=1)}
+    store = CandidateStore()
+
+    assert not user.save_to_db(store, update=True)
+    assert as_utc(store.get(1).last_edit) == last_edit
+    assert not fetched["calls"]
+
+
+def test_users_are_refreshed_once_unchanged_for_too_long(make_candidate) -> None:
+    user = make_unchanged_user(make_candidate, last_refreshed=NOW - timedelta(days=1), last_edit=NOW - timedelta(days=1))
+    assert user.is_unchanged(CandidateStore().get(1))
+
+    PromotionCandidate.delete().execute()
+    user = make_unchanged_user(make_candidate, last_refreshed=NOW - Defaults.MAX_UNCHANGED_AGE - timedelta(hours=1),
+                               last_edit=NOW - timedelta(days=1))
+    assert not user.is_unchanged(CandidateStore().get(1))
@@ -0,0 +1,53 @@
+import json
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+from dbpromotions import Defaults, metrics
+from dbpromotions.metrics import get_process_name
+from dbpromotions.server import server
+
+
+@pytest.fixture(autouse=True)
+def metrics_folder(monkeypatch, tmp_path) -> Path:
+    monkeypatch.setattr(metrics, "metrics_folder", tmp_path)
+    monkeypatch.setattr(metrics, "_last_written", {})
+    return tmp_path
+
+
+def test_web_workers_write_their_metrics_after_a_request(metrics_folder) -> None:
+    server.test_client().get("/users/1/edit_summary")
+
+    assert [path.stem for path in metrics_folder.glob("*.json")] == [get_process_name("web")]
+    snapshot = json.loads((metrics_folder / f"{get_process_name('web')}.json").read_text())
+    assert snapshot["dbpromotions_http_requests"]["samples"]
+
+
+def test_metrics_files_are_written_at_most_once_per_interval(monkeypatch, metrics_folder) -> None:
+    client = server.test_client()
+    client.get("/users/1/edit_summary")
+    written = (metrics_folder / f"{get_process_name('web')}.json").read_text()
+
+    client.get("/users/1/edit_summary")
+    assert (metrics_folder / f"{get_process_name('web')}.json").read_text() == written
+
+    monkeypatch.setattr(Defaults, "METRICS_WRITE_INTERVAL", timedelta(0))
+    client.get("/users/1/edit_summary")
+    assert (metrics_folder / f"{get_process_name('web')}.json").read_text() != written
+
+
+def test_a_scrape_reports_every_worker(metrics_folder) -> None:
+    def write_snapshot(name: str, endpoint: str) -> None:
+        samples = [["dbpromotions_http_requests_total", [["endpoint", endpoint], ["status", "200"]], 7]]
+        snapshot = {"dbpromotions_http_requests": {"kind": "counter", "documentation": "", "samples": samples}}
+        (metrics_folder / f"{name}.json").write_text(json.dumps(snapshot))
+
+    # another web worker's file, and this worker's own stale one that its live registry replaces
+    write_snapshot("web-otherhost-1", "other_worker")
+    write_snapshot(get_process_name("web"), "stale")
+
+    response = server.test_client().get("/metrics")
+
+    assert 'source="web-otherhost-1",endpoint="other_worker",status="200"} 7' in response.text
+    assert 'endpoint="stale"' not in response.text
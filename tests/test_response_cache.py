@@ -0,0 +1,110 @@
+from collections.abc import Iterator
+from datetime import timedelta
+
+import pytest
+
+from dbpromotions import Defaults, response_cache
+from dbpromotions.response_cache import CachedResponse, ResponseCache, get_endpoint_name, get_ttl
+
+
+class Endpoint:
+    @classmethod
+    def get(cls, **kwargs) -> dict:
+        return kwargs
+
+
+class DanbooruPostReport(Endpoint):
+    pass
+
+
+class Uncached(Endpoint):
+    pass
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    monkeypatch.setitem(Defaults.API_CACHE_TTLS, "Endpoint.get", timedelta(hours=1))
+    return clock
+
+
+@pytest.fixture
+def cache() -> Iterator[ResponseCache]:
+    cache = ResponseCache(max_size=10_000)
+    cache._init()
+    yield cache
+    CachedResponse.delete().execute()
+
+
+def fetch(cache: ResponseCache, endpoint=Endpoint.get, **kwargs) -> tuple[dict, int]:
+    calls = []
+
+    def request() -> dict:
+        calls.append(kwargs)
+        return endpoint(**kwargs)
+
+    return cache.fetch(endpoint, request, (), kwargs), len(calls)
+
+
+def test_endpoint_names_include_the_class() -> None:
+    assert get_endpoint_name(Endpoint.get) == "Endpoint.get"
+    assert get_endpoint_name(DanbooruPostReport.get) == "DanbooruPostReport.get"
+    assert get_endpoint_name(fetch) == "fetch"
+
+
+def test_ttls() -> None:
+    assert get_ttl("DanbooruPostReport.get", {"from": Defaults.DANBOORU_START_DATE_STR}) == Defaults.ALL_TIME_REPORT_CACHE_TTL
+    assert get_ttl("DanbooruPostReport.get", {"from": Defaults.RECENT_SINCE_STR}) == Defaults.RECENT_REPORT_CACHE_TTL
+    assert get_ttl("DanbooruUser.get_from_name", {}) == Defaults.USER_REFRESH_INTERVAL
+    assert get_ttl("DanbooruUser.get", {}) is None
+
+
+def test_keys_depend_on_the_call_only() -> None:
+    key = ResponseCache.get_key("Endpoint.get", (), {"a": 1, "b": 2})
+    assert ResponseCache.get_key("Endpoint.get", (), {"b": 2, "a": 1}) == key
+    assert ResponseCache.get_key("Endpoint.get", (), {"a": 1, "b": 3}) != key
+    assert ResponseCache.get_key("Other.get", (), {"a": 1, "b": 2}) != key
+
+
+def test_responses_are_cached_until_they_expire(cache, clock) -> None:
+    assert fetch(cache, a=1) == ({"a": 1}, 1)
+    assert fetch(cache, a=1) == ({"a": 1}, 0)
+    assert fetch(cache, a=2) == ({"a": 2}, 1)
+
+    clock.now += timedelta(hours=1).total_seconds()
+    assert fetch(cache, a=1) == ({"a": 1}, 1)
+    assert cache.hits["Endpoint.get"] == 1
+    assert cache.misses["Endpoint.get"] == 3
+
+
+def test_endpoints_without_a_ttl_are_not_cached(cache) -> None:
+    assert fetch(cache, endpoint=Uncached.get, a=1)[1] == 1
+    assert fetch(cache, endpoint=Uncached.get, a=1)[1] == 1
+    assert not CachedResponse.select().exists()
+
+
+def test_eviction_drops_expired_then_least_recently_used(cache, clock) -> None:
+    for value in range(4):
+        fetch(cache, a=value)
+        clock.now += 1
+    # refreshes its access time
+    fetch(cache, a=0)
+
+    keys = [ResponseCache.get_key("Endpoint.get", (), {"a": value}) for value in range(4)]
+    sizes = {cached.key: cached.size for cached in CachedResponse.select()}
+    CachedResponse.update(expires_at=clock.now).where(CachedResponse.key == keys[3]).execute()
+    # one more response has to go once the expired one is gone
+    cache.max_size = sum(sizes.values()) - sizes[keys[3]] - 1
+    cache.evict()
+
+    remaining = {cached.key for cached in CachedResponse.select()}
+    assert remaining == {keys[0], keys[2]}
@@ -0,0 +1,18 @@
+from datetime import UTC, datetime
+
+from dbpromotions import Defaults
+from dbpromotions.incomplete_user_data import IncompleteUserData
+from dbpromotions.scheduler import get_importance
+
+NOW = datetime.now(tz=UTC)
+
+
+def test_users_past_a_promotion_threshold_are_the_closest() -> None:
+    at_threshold = IncompleteUserData(name="user_1", post_edits=Defaults.MIN_EDITS)
+    halfway = IncompleteUserData(name="user_2", post_edits=Defaults.MIN_EDITS // 2)
+    wiki_editor = IncompleteUserData(name="user_3", total_wiki_edits=Defaults.MIN_WIKI_ARTIST_EDITS // 2,
+                                     total_artist_edits=Defaults.MIN_WIKI_ARTIST_EDITS // 2)
+
+    assert get_importance(at_threshold, None, NOW) == 1
+    assert get_importance(halfway, None, NOW) == 0.25
+    assert get_importance(wiki_editor, None, NOW) == 1
@@ -0,0 +1,39 @@
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+from dbpromotions.database import PromotionCandidateEdits
+from dbpromotions.edit_summary import EditSummary
+from dbpromotions.server import candidate_row, server
+
+
+def test_candidate_row_with_edits(make_candidate) -> None:
+    row = candidate_row(make_candidate(1))
+    assert row["last_edit"] == "this week"
+
+
+def test_legacy_edit_summary_is_not_modified(monkeypatch) -> None:
+    # summaries saved before top_tags existed only have the raw counters
+    data = {
+        "count": 200,
+        "oldest": "2024-01-01T00:00:00+00:00",
+        "by_year": {"2024": 200},
+        "by_tag": {"long_hair": {"added": 150, "removed": 50, "revert_added": 40, "revert_removed": 0}},
+    }
+    stored = SimpleNamespace(data=data, last_checked=datetime.now(tz=UTC))
+    monkeypatch.setattr(PromotionCandidateEdits, "get", lambda *_args: stored)
+
+    response = server.test_client().get("/users/1/edit_summary")
+
+    assert response.status_code == 200
+    assert b"long_hair" in response.data
+    assert "top_tags" not in stored.data
+
+
+def test_edit_summary_without_any_versions(monkeypatch) -> None:
+    stored = SimpleNamespace(data=EditSummary().to_data(), last_checked=datetime.now(tz=UTC))
+    monkeypatch.setattr(PromotionCandidateEdits, "get", lambda *_args: stored)
+
+    response = server.test_client().get("/users/1/edit_summary")
+
+    assert response.status_code == 200
+    assert b"0 actual edits</a> as of the last scan" in response.data
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from dbpromotions.database import PromotionCandidate, PromotionCandidateSnapshot, get_snapshots, save_snapshots
+
+
+def save(candidate: PromotionCandidate) -> None:
+    # the way CandidateStore does it: snapshots first, then the candidate
+    save_snapshots([candidate])
+    PromotionCandidate.insert(candidate.__data__).on_conflict_replace().execute()
+
+
+def age_snapshots(days: int) -> None:
+    for row in PromotionCandidateSnapshot.select():
+        row.taken_at -= timedelta(days=days)
+        row.save()
+
+
+def get_rows() -> list[tuple[bool, dict]]:
+    snapshot = PromotionCandidateSnapshot
+    return [(row.is_keyframe, row.values) for row in snapshot.select().order_by(snapshot.taken_at, snapshot.id)]
+
+
+def test_only_changes_are_kept_between_keyframes(make_candidate) -> None:
+    save(make_candidate(1, total_posts=100, post_edits=10))
+    age_snapshots(2)
+    save(make_candidate(1, total_posts=150, post_edits=10, worst_revert_perc=12.5))
+    age_snapshots(2)
+    save(make_candidate(1, total_posts=150, post_edits=10, worst_revert_perc=12.5))
+
+    rows = get_rows()
+    assert len(rows) == 2
+    assert rows[0][0]
+    assert rows[0][1]["total_posts"] == 100
+    assert rows[1] == (False, {"total_posts": 50, "worst_revert_perc": 12.5})
+
+
+def test_a_keyframe_is_taken_once_the_last_one_is_old(make_candidate) -> None:
+    save(make_candidate(1, total_posts=100))
+    age_snapshots(31)
+    save(make_candidate(1, total_posts=120))
+
+    rows = get_rows()
+    assert [is_keyframe for is_keyframe, _ in rows] == [True, True]
+    assert rows[1][1]["total_posts"] == 120
+
+
+def test_snapshots_rebuild_every_state(make_candidate) -> None:
+    for total_posts in (100, 150, 140):
+        age_snapshots(5)
+        save(make_candidate(1, total_posts=total_posts, worst_revert_perc=total_posts / 8))
+    age_snapshots(31)
+    save(make_candidate(1, total_posts=200, worst_revert_perc=25.0))
+    age_snapshots(5)
+    save(make_candidate(1, total_posts=210, worst_revert_perc=25.0))
+
+    series = get_snapshots(1)
+    assert [(values["total_posts"], values["worst_revert_perc"]) for _, values in series] == [
+        (100, 12.5), (150, 18.75), (140, 17.5), (200, 25.0), (210, 25.0),
+    ]
+    assert all(values["level"] == 20 for _, values in series)
+
+
+def test_snapshots_since_start_with_the_state_at_that_time(make_candidate) -> None:
+    for total_posts in (100, 150, 140, 130):
+        age_snapshots(10)
+        save(make_candidate(1, total_posts=total_posts))
+    taken_at = [moment for moment, _ in get_snapshots(1)]
+
+    series = get_snapshots(1, since=taken_at[1] + timedelta(days=1), until=taken_at[2])
+    assert [(moment, values["total_posts"]) for moment, values in series] == [
+        (taken_at[1] + timedelta(days=1), 150),
+        (taken_at[2], 140),
+    ]
+
+    # with nothing changing in the range, the state at its start is all there is
+    series = get_snapshots(1, since=taken_at[3] + timedelta(days=1))
+    assert [values["total_posts"] for _, values in series] == [130]
@@ -0,0 +1,239 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from danbooru.models import DanbooruUser
+
+from dbpromotions import Defaults, populate, tasks
+from dbpromotions.database import PopulateRun, PopulateWork, init_database, user_database
+from dbpromotions.incomplete_user_data import IncompleteUserData
+from dbpromotions.work_ledger import (
+    CLAIMED,
+    DONE,
+    FAILED,
+    PENDING,
+    begin_run,
+    claim_work,
+    count_claimable,
+    fill_run,
+    finish_run_if_done,
+    load_user_data,
+    release_work,
+    reserve_updates,
+)
+
+
+def start_run(users: int) -> PopulateRun:
+    run, is_new = begin_run(max_to_update=users)
+    assert is_new
+    fill_run(run, [IncompleteUserData(id=user_id, name=f"user_{user_id}") for user_id in range(1, users + 1)])
+    return run
+
+
+def expire_leases(entries: list[PopulateWork]) -> None:
+    PopulateWork.update(lease_until=datetime(2000, 1, 1, tzinfo=UTC)).where(PopulateWork.id.in_([entry.id for entry in entries])).execute()
+
+
+def get_states(run_id: int) -> dict[str, int]:
+    return {state: PopulateWork.select().where((PopulateWork.run_id == run_id) & (PopulateWork.state == state)).count()
+            for state in (PENDING, CLAIMED, DONE, FAILED)}
+
+
+@pytest.fixture
+def processed(monkeypatch) -> list[str]:
+    # users are processed without any request to danbooru
+    processed = []
+
+    def process_user(user_data: IncompleteUserData, **_kwargs) -> IncompleteUserData:
+        processed.append(user_data.name)
+        return user_data
+
+    monkeypatch.setattr(populate, "process_user", process_user)
+    return processed
+
+
+@pytest.fixture
+def queued(monkeypatch) -> list[int]:
+    # chunk tasks that would have been sent to celery
+    queued: list[int] = []
+    monkeypatch.setattr(tasks.refresh_chunk_task, "delay", queued.append)
+    return queued
+
+
+def run_queued(queued: list[int]) -> None:
+    while queued:
+        tasks.refresh_chunk_task(queued.pop(0))
+
+
+def test_claims_go_in_order_and_hold_a_lease() -> None:
+    run = start_run(5)
+
+    entries = claim_work(run.id, 3)
+    assert [entry.position for entry in entries] == [1, 2, 3]
+    assert load_user_data(entries[0]).name == "user_1"
+    assert [entry.position for entry in claim_work(run.id, 3)] == [4, 5]
+    assert claim_work(run.id, 3) == []
+    assert count_claimable(run.id) == 0
+    assert not finish_run_if_done(run.id)
+
+
+def test_queued_user_data_survives_the_ledger() -> None:
+    run, _ = begin_run(max_to_update=1)
+    last_edit = datetime(2025, 1, 2, 3, 4, 5, tzinfo=UTC)
+    user_data = IncompleteUserData(id=1, name="user_1", level=20, total_posts=600, last_edit=last_edit)
+    user_data._last_edit_hints = {"post": last_edit, "wiki": None}
+    user_data._danbooru_user = DanbooruUser.model_validate({
+        "id": 1,
+        "name": "user_1",
+        "level": 20,
+        "level_string": "Member",
+        "created_at": "2020-01-01T00:00:00.000-05:00",
+        "post_upload_count": 600,
+    })
+    fill_run(run, [user_data])
+
+    loaded = load_user_data(PopulateWork.get())
+    assert loaded == user_data
+    assert loaded._last_edit_hints == user_data._last_edit_hints
+    assert loaded._danbooru_user == user_data._danbooru_user
+    assert loaded._danbooru_user.created_at.utcoffset() == timedelta(hours=-5)
+
+
+def test_pickled_ledgers_are_dropped() -> None:
+    run = start_run(1)
+    PopulateWork.drop_table()
+    user_database.execute_sql("CREATE TABLE populatework (id INTEGER PRIMARY KEY, run_id INTEGER, position INTEGER, "
+                              "user_name VARCHAR(255), user_id INTEGER, state VARCHAR(255), lease_until INTEGER, "
+                              "attempts INTEGER, payload BLOB NOT NULL)")
+
+    init_database()
+
+    assert "payload" not in {column.name for column in user_database.get_columns("populatework")}
+    assert PopulateRun.get_by_id(run.id).finished_at is not None
+    assert begin_run(max_to_update=1)[1]
+
+
+def test_expired_leases_are_claimable_again() -> None:
+    run = start_run(5)
+    entries = claim_work(run.id, 3)
+    expire_leases(entries)
+
+    assert count_claimable(run.id) == 5
+    assert [entry.position for entry in claim_work(run.id, 5)] == [1, 2, 3, 4, 5]
+    assert PopulateWork.get(PopulateWork.position == 1).attempts == 2
+
+
+def test_entries_fail_after_their_last_attempt() -> None:
+    run = start_run(2)
+    for _ in range(Defaults.MAX_WORK_ATTEMPTS):
+        entries = claim_work(run.id, 1)
+        assert [entry.position for entry in entries] == [1]
+        expire_leases(entries)
+
+    assert count_claimable(run.id) == 1
+    release_work([entry.id for entry in claim_work(run.id, 1)])
+    assert get_states(run.id) == {PENDING: 1, CLAIMED: 0, DONE: 0, FAILED: 1}
+
+
+def test_abandoned_entries_out_of_attempts_dont_keep_the_run_open() -> None:
+    run = start_run(1)
+    for _ in range(Defaults.MAX_WORK_ATTEMPTS):
+        expire_leases(claim_work(run.id, 1))
+
+    assert count_claimable(run.id) == 0
+    assert finish_run_if_done(run.id)
+    assert get_states(run.id)[FAILED] == 1
+
+
+def test_run_finishes_after_a_crashed_chunk(processed, queued) -> None:
+    run = start_run(5)
+
+    # a worker claims a chunk and dies without completing or releasing any of it
+    crashed = claim_work(run.id, 3)
+    tasks.populate_database_task()
+    run_queued(queued)
+    assert processed == ["user_4", "user_5"]
+    assert PopulateRun.get_by_id(run.id).finished_at is None
+
+    # the next scheduled run picks the chunk up once its lease has run out
+    expire_leases(crashed)
+    tasks.populate_database_task()
+    run_queued(queued)
+    assert processed == ["user_4", "user_5", "user_1", "user_2", "user_3"]
+    assert PopulateRun.get_by_id(run.id).finished_at is not None
+    assert get_states(run.id)[DONE] == 5
+
+
+def test_chunk_tasks_queue_a_follow_up_while_there_is_work(processed, queued) -> None:
+    run = start_run(5)
+
+    tasks.refresh_chunk_task(run.id)
+    assert len(processed) == 5
+    assert queued == [run.id]
+
+    # released by a failed user while the other chunks were running
+    PopulateWork.update(state=PENDING).where(PopulateWork.position == 1).execute()
+    tasks.refresh_chunk_task(queued.pop())
+    assert len(processed) == 6
+    assert queued == [run.id]
+
+    tasks.refresh_chunk_task(queued.pop())
+    assert queued == []
+    assert PopulateRun.get_by_id(run.id).finished_at is not None
+
+
+def test_reservations_are_capped_by_the_run() -> None:
+    run = start_run(5)
+    assert reserve_updates(run.id, 3) == (3, 3)
+    assert reserve_updates(run.id, 3) == (2, 2)
+    assert reserve_updates(run.id, 3) == (0, 0)
+
+
+def test_chunks_settle_what_they_used(monkeypatch) -> None:
+    run, _ = begin_run(max_to_update=3)
+    fill_run(run, [IncompleteUserData(id=user_id, name=f"user_{user_id}") for user_id in range(1, 6)])
+
+    fetched = []
+
+    def process_user(user_data: IncompleteUserData, fetch_budget, edit_budget, **_kwargs) -> IncompleteUserData:
+        # user_2 turned out not to be due, and nobody had their edits collected
+        reserved = fetch_budget.reserve()
+        spent = reserved and user_data.name != "user_2"
+        fetch_budget.settle(reserved, spent)
+        edit_budget.settle(edit_budget.reserve(), False)
+        if spent:
+            fetched.append(user_data.name)
+        return user_data
+
+    monkeypatch.setattr(populate, "process_user", process_user)
+    populate.process_work_chunk(run.id, workers=1)
+
+    # the fetch user_2 didn't need went to user_4 instead
+    assert fetched == ["user_1", "user_3", "user_4"]
+    run = PopulateRun.get_by_id(run.id)
+    assert (run.fetches_used, run.edits_used) == (3, 0)
+
+
+def test_chunks_keep_their_lease_while_they_make_progress(monkeypatch) -> None:
+    class Clock(datetime):
+        offset = timedelta()
+
+        @classmethod
+        def now(cls, tz=None) -> datetime:
+            return datetime.now(tz=tz) + cls.offset
+
+    monkeypatch.setattr(populate, "datetime", Clock)
+    run = start_run(4)
+    claimable = []
+
+    def process_user(user_data: IncompleteUserData, **_kwargs) -> IncompleteUserData:
+        # every user takes half the lease, and the lease would have run out without being extended
+        claimable.append(count_claimable(run.id))
+        expire_leases(list(PopulateWork.select()))
+        Clock.offset += Defaults.WORK_LEASE / 2
+        return user_data
+
+    monkeypatch.setattr(populate, "process_user", process_user)
+    populate.process_work_chunk(run.id, workers=1)
+
+    assert claimable == [0, 0, 0, 0]
+    assert get_states(run.id)[DONE] == 4